@@ -0,0 +1,159 @@
+# external imports
+import sqlite3
+from datetime import date
+
+# my imports
+from sketch import TDigest, percentiles
+from charts import daily_series
+
+
+class AnalyticsSnapshot:
+    # holds everything the analytics page shows, so the page reads from this instead of querying the database per deck
+    # overall is a dict with the same keys as Database.get_quiz_stats
+    # decks is a list of (deck_id, deck_name, performance_score) tuples sorted by performance score (highest first)
+    # deck_stats maps each deck id to a dict with the same keys as Database.get_deck_stats
+    # answer_times is the p50/p90/p99 answer time across all decks and deck_answer_times is the same for each deck
+    # (see sketch.percentiles), these are None when there are no answers yet
+    # patterns is the retention, hour of day accuracy and heatmap dict from RetentionEngine.results
+    # series maps the sessions, accuracy and time studied charts on the analytics page to their daily TimeSeries (see charts.py)
+    def __init__(self, overall, decks, deck_stats, answer_times=None, deck_answer_times=None, patterns=None, series=None):
+        self.overall = overall
+        self.decks = decks
+        self.deck_stats = deck_stats
+        self.answer_times = answer_times
+        self.deck_answer_times = deck_answer_times or {}
+        self.patterns = patterns
+        self.series = series or {}
+
+    # returns the stats for one deck, or zeros if the deck has no quiz sessions yet
+    def get_deck_stats(self, deck_id):
+        return self.deck_stats.get(deck_id, {
+            "session_count": 0,
+            "total_time": 0.0,
+            "avg_time_per_card": 0.0,
+            "total_correct": 0,
+            "total_reviewed": 0,
+            "accuracy": 0.0
+        })
+
+
+# works out a deck performance score from 0 to 100 from the deck's average ef (same as Database.get_deck_performance_score)
+def performance_score(avg_ef, card_count):
+    if card_count == 0:
+        return 0.0
+    score = ((avg_ef - 1.3) / (3.5 - 1.3)) * 100
+    return min(max(score, 0), 100)
+
+
+# builds an analytics snapshot for a user with a few set based queries (overall stats, stats grouped by deck,
+# average ef grouped by deck and the answer time digests) instead of several queries for every deck
+# this runs on a background thread, so it opens its own connection (sqlite connections can't be shared between threads)
+# retention_engine is the user's RetentionEngine, which only loads the reviews added since it was last refreshed
+def build_snapshot(db_name, user_id, retention_engine=None):
+    conn = sqlite3.connect(db_name)
+    try:
+        cursor = conn.cursor()
+
+        # overall quiz statistics for the user
+        cursor.execute("""
+            SELECT
+                COUNT(*) AS total_sessions,
+                SUM(deck_time) AS total_time,
+                AVG(avg_time) AS overall_avg_time,
+                SUM(correct_count) AS total_correct,
+                SUM(total_cards) AS total_reviewed
+            FROM quiz
+            WHERE user_id = ?
+        """, (user_id,))
+        row = cursor.fetchone()
+        total_reviewed = row[4] or 0
+        total_correct = row[3] or 0
+        overall = {
+            "total_sessions": row[0] or 0,
+            "total_time": row[1] or 0.0,
+            "overall_avg_time_per_card": row[2] or 0.0,
+            "total_correct": total_correct,
+            "total_reviewed": total_reviewed,
+            "overall_accuracy": (total_correct / total_reviewed) * 100 if total_reviewed > 0 else 0.0
+        }
+
+        # quiz statistics for every deck at once, grouped by deck
+        cursor.execute("""
+            SELECT
+                deck_id,
+                COUNT(*) AS session_count,
+                SUM(deck_time) AS total_time,
+                AVG(avg_time) AS avg_time_per_card,
+                SUM(correct_count) AS total_correct,
+                SUM(total_cards) AS total_reviewed
+            FROM quiz
+            WHERE user_id = ?
+            GROUP BY deck_id
+        """, (user_id,))
+        deck_stats = {}
+        for deck_id, session_count, total_time, avg_time, correct, reviewed in cursor.fetchall():
+            correct = correct or 0
+            reviewed = reviewed or 0
+            deck_stats[deck_id] = {
+                "session_count": session_count or 0,
+                "total_time": total_time or 0.0,
+                "avg_time_per_card": avg_time or 0.0,
+                "total_correct": correct,
+                "total_reviewed": reviewed,
+                "accuracy": (correct / reviewed * 100) if reviewed else 0.0
+            }
+
+        # average ef and card count for every deck at once, used for the performance scores
+        cursor.execute("""
+            SELECT d.deck_id, d.deck_name, AVG(COALESCE(s.ef, 2.5)) AS avg_ef, COUNT(c.card_id) AS card_count
+            FROM decks d
+            LEFT JOIN cards c ON c.deck_id = d.deck_id
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE d.user_id = ?
+            GROUP BY d.deck_id, d.deck_name
+        """, (user_id, user_id))
+        decks = []
+        for deck_id, deck_name, avg_ef, card_count in cursor.fetchall():
+            decks.append((deck_id, deck_name, performance_score(avg_ef, card_count)))
+
+        # answer time percentiles for each deck, and for all decks by merging the deck digests together
+        cursor.execute("SELECT deck_id, digest FROM answer_time_sketches WHERE user_id = ?", (user_id,))
+        merged = TDigest()
+        deck_answer_times = {}
+        for deck_id, data in cursor.fetchall():
+            digest = TDigest.from_bytes(data)
+            deck_answer_times[deck_id] = percentiles(digest)
+            merged.merge(digest)
+        answer_times = percentiles(merged)
+
+        patterns = retention_engine.refresh(conn) if retention_engine else None
+
+        # quizzes, accuracy and time studied for each day, added up in sql so only one row per day is loaded
+        # (quiz timestamps are saved in utc, so they are converted to local time to find the day)
+        cursor.execute("""
+            SELECT
+                DATE(timestamp, 'localtime') AS study_date,
+                COUNT(*),
+                SUM(correct_count),
+                SUM(total_cards),
+                SUM(deck_time)
+            FROM quiz
+            WHERE user_id = ?
+            GROUP BY study_date
+            ORDER BY study_date
+        """, (user_id,))
+        days = [(date.fromisoformat(row[0]),) + row[1:] for row in cursor.fetchall()]
+
+        series = {
+            "sessions": daily_series([(day[0], day[1]) for day in days], fill=0),
+            "accuracy": daily_series([(day[0], day[2] / day[3] * 100) for day in days if day[3]]),
+            "time": daily_series([(day[0], day[4] or 0.0) for day in days], fill=0)
+        }
+    finally:
+        conn.close()
+
+    # sorts decks by performance score, highest first
+    def get_performance_score(deck):
+        return deck[2]
+    decks.sort(key=get_performance_score, reverse=True)
+    return AnalyticsSnapshot(overall, decks, deck_stats, answer_times, deck_answer_times, patterns, series)
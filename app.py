@@ -2,10 +2,34 @@
 import customtkinter as ctk
 from tkinter import messagebox
 from datetime import datetime
+from PIL import Image
 
 
 # my imports
 from components import BasePage, BaseContainer, BaseDialog
+from analytics import build_snapshot
+from background import run_in_background, run_in_process, run_in_processes
+from charts import LineChart, daily_series, draw_heatmap, draw_bar_chart
+from stream import PagePrefetcher, RelearnQueue, merge_due_cards
+from sampling import CramSampler, random_cards
+from planner import TimeBudgetPlan
+from scheduler import SCHEDULERS
+from optimizer import MIN_REVIEWS, fit_user
+from simulator import initial_state, simulate, simulation_tasks, summarise
+from retention import local_timestamp
+from backlog import SPREAD_DAYS, BacklogPlan
+from clustering import cluster_user
+from tags import parse_tag_list
+
+# number of cards in a random quiz
+RANDOM_QUIZ_SIZE = 20
+
+# how far ahead and how many times the edit deck dialog simulates the deck's reviews under the chosen scheduler
+SIMULATION_DAYS = 365
+SIMULATION_TRIALS = 100
+
+# the parent deck dropdown's option for a top level deck
+NO_PARENT_LABEL = "None (top level)"
 
 class DecksPage(BasePage):
     # initialises decks page as a subclass of basepage (inheritance)
@@ -93,6 +117,20 @@ class DecksPage(BasePage):
         )
         self.delete_selected_button.pack(side="left", padx=5)
 
+        # spreads the cards that became overdue during a break over the next few days
+        self.backlog_button = ctk.CTkButton(
+            self.buttons_frame,
+            text="Spread Backlog",
+            width=70,
+            height=32,
+            corner_radius=16,
+            fg_color="#F3F4F6",
+            text_color="black",
+            hover_color="#E5E7EB",
+            command=self.spread_backlog
+        )
+        self.backlog_button.pack(side="left", padx=5)
+
         # separator, seperates header from the decks frame below
         self.separator = ctk.CTkFrame(self.main_header_content, height=1, fg_color="#E5E7EB")
         self.separator.pack(fill="x", padx=30, pady=(20, 0))
@@ -116,62 +154,12 @@ class DecksPage(BasePage):
         for widget in self.decks_frame.winfo_children():
             widget.destroy()
 
-        deck_list = []
-        decks = self.db.get_decks(self.user_id)
-
-        # build deck_list as tuples with following, (deck_id, deck_name, avg_ef, card_count)
-        for deck_id, deck_name in decks:
-            # gets all cards for a certain deck from database
-            cards = self.db.get_cards(deck_id)
-            if cards:
-                # calculates avg_ef of deck by doing total_ef/number of cards
-                total_ef = sum(self.db.get_card_easiness(self.user_id, c[0]) for c in cards)
-                avg_ef = total_ef / len(cards)
-            else:
-                # if cards dont exist defaults to ef of 2.5
-                avg_ef = 2.5
-            # retrieves number of cards in a deck
-            card_count = self.db.get_card_count(deck_id)
-            
-            deck_list.append((deck_id, deck_name, avg_ef, card_count))
-
-        # gets the user input from the search field, makes it lowercase and strips whitespace
-        search_query = self.deck_search_input.get().lower().strip()
-        if search_query:
-            filtered_deck_list = []
-            # iterates through deck list
-            for deck in deck_list:
-                # makes deck name lower case
-                deck_name = deck[1].lower()
-                # if any characters in the search query are in deck_name, 
-                # append that deck to filtered decks and make deck_list equal to filtered decks
-                if search_query in deck_name:
-                    filtered_deck_list.append(deck)
-            # assigns deck list to the now filtered deck list
-            deck_list = filtered_deck_list
-
-        # filter by priority (using avg_ef)
+        # gets the user input from the search field and the selected priority, which are used to filter the decks
+        search_query = self.deck_search_input.get().strip()
         priority_filter = self.deck_priority_filter_selection.get().lower()
-        # if a priority is selected (anything but "all")
-        if priority_filter != "all":
-            filtered_deck_list = []
-            # if high, then only append decks with avg_ef less than 2
-            if priority_filter == "high":
-                for deck in deck_list:
-                    if deck[2] < 2.0:
-                        filtered_deck_list.append(deck)
-            # if medium, then only append decks with avg_ef between 2 and 2.5, including 2
-            elif priority_filter == "medium":
-                for deck in deck_list:
-                    if 2.0 <= deck[2] < 2.5:
-                        filtered_deck_list.append(deck)
-            # if low, then only show append with avg_ef more than or equal to 2.5
-            elif priority_filter == "low":
-                for deck in deck_list:
-                    if deck[2] >= 2.5:
-                        filtered_deck_list.append(deck)
-            # assigns deck_list to the now filtered deck list
-            deck_list = filtered_deck_list
+        # deck_list is a list of tuples with following, (deck_id, deck_name, avg_ef, card_count)
+        # decks are read in order from the deck index (an AVL tree, explained in graph.py) which the database keeps sorted by avg_ef
+        deck_list = self.db.get_ordered_decks(self.user_id, search=search_query, priority=priority_filter)
 
         # if user has no decks, then display a message
         if not deck_list:
@@ -181,26 +169,18 @@ class DecksPage(BasePage):
                          text_color="#4B5563").pack(expand=True, pady=50)
             return
 
-        # sort decks using BST (binary search tree) (based on avg_ef)
-        # how this works is explained in graph.py
-        from graph import DeckNode, insert_node, in_order
-        root = None
-        for deck in deck_list:
-            node = DeckNode(deck_id=deck[0], deck_name=deck[1], avg_ef=deck[2], card_count=deck[3])
-            root = insert_node(root, node)
-        sorted_nodes = in_order(root)
-
+        # deck_list is already sorted by avg_ef (lowest first, so highest priority first)
         # instantiate deck container for each deck to be displayed
         row, col = 0, 0
-        for node in sorted_nodes:
+        for deck_id, deck_name, avg_ef, card_count in deck_list:
             deck_container = DeckContainer(
                 self.decks_frame, 
-                deck_id=node.deck_id,
+                deck_id=deck_id,
                 user_id=self.user_id,
-                deck_name=node.deck_name, 
-                card_count=node.card_count,
+                deck_name=deck_name, 
+                card_count=card_count,
                 selection_callback=self.toggle_deck_selection,
-                avg_ef=node.avg_ef, 
+                avg_ef=avg_ef, 
                 edit_callback=self.edit_deck,
                 delete_callback=self.delete_deck,
                 db=self.db
@@ -223,9 +203,15 @@ class DecksPage(BasePage):
         self.update_deck_list()
         self.sidebar.update_deck_list()
         
+    # calls backlog dialog which previews and moves overdue cards to later days, then updates the due counts
+    def spread_backlog(self):
+        BacklogDialog(self, db=self.db)
+        self.update_deck_list()
+        self.sidebar.update_deck_list()
+
     # allows to delete a deck from database and update deck list
     def delete_deck(self, deck_id):
-        if messagebox.askyesno("Delete Deck", "Are you sure you want to delete this deck?"):
+        if messagebox.askyesno("Delete Deck", "Are you sure you want to delete this deck? Its subdecks will be kept."):
             self.db.delete_deck(deck_id)
             self.update_deck_list()
             self.sidebar.update_deck_list()
@@ -287,18 +273,32 @@ class DeckContainer(BaseContainer):
             text_color="#6B7280"
         ).pack(anchor="w", pady=(5, 0))
 
-        # get available for review count from database
-        available_for_review = self.db.get_available_for_review_count(self.user_id, deck_id)
-        if available_for_review is None:
-            available_for_review = 0
+        # get available for review count from the due forecast, which is loaded for all decks at once and cached,
+        # rather than querying the database for each deck
+        available_for_review = self.db.get_due_counts(self.user_id).get(deck_id, 0)
+        self.available_for_review = available_for_review
 
-        # label to display how many cards are available for review
-        ctk.CTkLabel(
+        # label to display how many cards are available for review, kept up to date by the due watcher as cards become due
+        self.available_label = ctk.CTkLabel(
             self.info_frame,
             text=f"{available_for_review} available for review",
             font=("Inter", 12),
             text_color="#DC2626"
-        ).pack(anchor="w", pady=(5, 0))
+        )
+        self.available_label.pack(anchor="w", pady=(5, 0))
+        if self.db.due_watcher is not None:
+            self.db.due_watcher.subscribe(self, self.update_available_count)
+
+        # label to display how many more cards become due over the rest of the week
+        due_this_week = sum(count for _, count in self.db.get_due_forecast(self.user_id, days=7, deck_id=deck_id))
+        upcoming = due_this_week - available_for_review
+        if upcoming > 0:
+            ctk.CTkLabel(
+                self.info_frame,
+                text=f"{upcoming} more due in the next 7 days",
+                font=("Inter", 12),
+                text_color="#6B7280"
+            ).pack(anchor="w", pady=(2, 0))
 
         # determine deck priority based on average ef value
         if self.avg_ef < 2.0:
@@ -375,12 +375,22 @@ class DeckContainer(BaseContainer):
             self.configure(fg_color="white")
             self.checkbox.configure(fg_color="white", checkmark_color="black", hover_color="white")
 
+    # called by the due watcher with the latest due counts, the label is only changed if this deck's count has
+    def update_available_count(self, due_counts):
+        count = due_counts.get(self.deck_id, 0)
+        if count != self.available_for_review:
+            self.available_for_review = count
+            self.available_label.configure(text=f"{count} available for review")
+
 
 class CardsPage(BasePage):
-    def __init__(self, master, user_id, deck_id, switch_page, db):
+    # search can be given to open the page with the search box already filled in (used by quick jump)
+    def __init__(self, master, user_id, deck_id, switch_page, db, search=""):
         super().__init__(master, user_id, switch_page, db=db)
         self.deck_id = deck_id
         self.selected_cards = set()
+        # number of cards fetched from the database at a time
+        self.cards_per_page = 25
         self.deck_info = self.db.get_deck_info(self.deck_id)
 
         # header frame, a container for deck title, card count, search, and filter by priority option
@@ -405,13 +415,36 @@ class CardsPage(BasePage):
         )
         self.card_count_label.pack(side="left", padx=(10, 0))
 
+        # decks with subdecks also show the cards in the whole subtree (from one query of the deck tree),
+        # with a button to review the deck and all its subdecks together
+        self.subdeck_ids = self.db.get_subdeck_ids(self.deck_id)
+        if len(self.subdeck_ids) > 1:
+            subtree = self.db.get_subtree_stats(self.user_id, self.deck_id)
+            self.card_count_label.configure(
+                text=f"{self.deck_info['card_count']} cards ({subtree['card_count']} with subdecks, "
+                     f"average ef {subtree['avg_ef']:.2f})"
+            )
+            ctk.CTkButton(
+                self.header_frame,
+                text=f"Review with subdecks ({subtree['due']} due)",
+                image=ctk.CTkImage(light_image=Image.open("images/hierarchy_icon.png"), size=(16, 16)),
+                compound="left",
+                height=32,
+                corner_radius=16,
+                fg_color="#F5F3FF",
+                text_color="#4F46E5",
+                hover_color="#EDE9FE",
+                state="normal" if subtree["due"] else "disabled",
+                command=self.review_subtree
+            ).pack(side="left", padx=(15, 0))
+
         # filter frame holds the search entry and priority dropdown
         self.filter_frame = ctk.CTkFrame(self.header_frame, fg_color="transparent")
         self.filter_frame.pack(side="right", padx=10)
 
         # card_search_input stores the users search text
         # card_search_entry_field makes the search box
-        self.card_search_input = ctk.StringVar()
+        self.card_search_input = ctk.StringVar(value=search)
         self.card_search_entry_field = ctk.CTkEntry(
             self.filter_frame,
             textvariable=self.card_search_input,
@@ -424,6 +457,19 @@ class CardsPage(BasePage):
         )
         self.card_search_entry_field.pack(side="left", padx=5)
 
+        # tag query entry, e.g. "verbs and not easy" (see tags.py), which filters the cards by their tags
+        self.card_tag_input = ctk.StringVar()
+        ctk.CTkEntry(
+            self.filter_frame,
+            textvariable=self.card_tag_input,
+            placeholder_text="Tags, e.g. verbs and not easy",
+            placeholder_text_color="#D1D1D1",
+            text_color="#000000",
+            fg_color="white",
+            border_color="#e5e7eb",
+            width=200
+        ).pack(side="left", padx=5)
+
         # card priority filter and dropdown menu (default selected valu eis All)
         self.card_priority_filter_selection = ctk.StringVar(value="All")
         self.card_priority_filter_menu = ctk.CTkOptionMenu(
@@ -441,6 +487,7 @@ class CardsPage(BasePage):
         # trace_add listens for changes in search and filter and calls update_card_list accordingly
         self.card_search_input.trace_add("write", lambda *args: self.update_card_list())
         self.card_priority_filter_selection.trace_add("write", lambda *args: self.update_card_list())
+        self.card_tag_input.trace_add("write", lambda *args: self.update_card_list())
 
         # delete selected cards button, which is initially disabled (only enabled if checkbox(es) clicked)
         self.delete_selected_button = ctk.CTkButton(
@@ -472,6 +519,15 @@ class CardsPage(BasePage):
         )
         self.add_card_button.pack(side="right", padx=5)
 
+        # study suggestions frame, which shows the deck's hardest difficulty groups (see clustering.py)
+        # as buttons that start a quiz of just that group's cards
+        self.suggestions_frame = ctk.CTkFrame(self.main_header_content, fg_color="transparent")
+        self.suggestions_frame.pack(fill="x", padx=30)
+        self.update_study_suggestions()
+        # the groups are worked out again in a worker process if they are missing or out of date
+        if self.db.difficulty_clusters_out_of_date(self.user_id) and self.user_id not in self.db.clustering_users:
+            self.group_cards()
+
         # cards frame, scrollable container for displaying card containers
         self.cards_frame = ctk.CTkScrollableFrame(
             self.main_header_content,
@@ -489,52 +545,13 @@ class CardsPage(BasePage):
         # clear existing card widgets from the scrollable frame
         for widget in self.cards_frame.winfo_children():
             widget.destroy()
+        # next_cursor marks where the next page of cards starts, None means start from the first card
+        self.next_cursor = None
+        self.load_more_button = None
+        self.load_card_page()
 
-        card_list = []
-        cards = self.db.get_cards(self.deck_id)
-        
-        # builds card_list as tuples with following, (card_id, question, answer, ef)
-        # _ is deck_id which is ignored
-        for card in cards:
-            card_id, _, question, answer = card
-            ef = self.db.get_card_easiness(self.user_id, card_id)
-            card_list.append((card_id, question, answer, ef))
-
-        # gets the user input from the search field, makes it lowercase and strips whitespace
-        search_query = self.card_search_input.get().lower().strip()
-        if search_query:
-            filtered_card_list = []
-            for card in card_list:
-                # if any characters in the search query are in card[1] (which is the question), 
-                # append that card to filtered card list and make card_list equal to filtered card list
-                if search_query in card[1].lower():
-                    filtered_card_list.append(card)
-            card_list = filtered_card_list
-
-        # filter card_list by priority (using easiness factor)
-        priority_filter = self.card_priority_filter_selection.get().lower()
-        # if a priority is selected (anything but "all")
-        if priority_filter != "all":
-            filtered_card_list = []
-            # if high, then append cards with ef less than 2
-            if priority_filter == "high":
-                for card in card_list:
-                    if card[3] < 2.0:
-                        filtered_card_list.append(card)
-            # if high, then append cards with ef between 2 and 2.5, including 2
-            elif priority_filter == "medium":
-                for card in card_list:
-                    if 2.0 <= card[3] < 2.5:
-                        filtered_card_list.append(card)
-            # if low, then append cards with ef less than or equal to 2.5
-            elif priority_filter == "low":
-                for card in card_list:
-                    if card[3] >= 2.5:
-                        filtered_card_list.append(card)
-            card_list = filtered_card_list
-
-        # if user has no cards, display a message
-        if not card_list:
+        # if user has no cards (or none match the search and filter), display a message
+        if not self.cards_frame.winfo_children():
             no_cards_frame = ctk.CTkFrame(self.cards_frame, fg_color="transparent")
             no_cards_frame.pack(fill="both", expand=True)
             ctk.CTkLabel(
@@ -543,15 +560,49 @@ class CardsPage(BasePage):
                 font=("Inter", 16, "bold"),
                 text_color="#4B5563"
             ).pack(expand=True, pady=50)
-            return
 
-        # sort card_list using merge sort based on easiness factor (lower ef means higher priority)
-        # sorts from lowest to highest ef (so highest to lowest priority)
-        from misc import MiscFunctions
-        sorted_cards = MiscFunctions.split(card_list)
+    # fetches the next page of cards and adds a card container for each one
+    def load_card_page(self):
+        if self.load_more_button is not None:
+            self.load_more_button.destroy()
+            self.load_more_button = None
+
+        search = self.card_search_input.get().strip()
+        priority = self.card_priority_filter_selection.get().lower()
+        tags = self.card_tag_input.get()
+        try:
+            if not search and priority == "all" and not tags.strip():
+                # without a filter the cards come from the deck's priority order (see ordering.py), which is kept
+                # up to date as cards are rated, and next_cursor is the position of the next page in it
+                start = self.next_cursor or 0
+                card_list = self.db.get_priority_page(self.user_id, self.deck_id, start, self.cards_per_page + 1)
+                self.next_cursor = None
+                if len(card_list) > self.cards_per_page:
+                    card_list = card_list[:self.cards_per_page]
+                    self.next_cursor = start + self.cards_per_page
+            else:
+                # search, priority filter, tag filter and sorting (lowest ef first, so highest priority first)
+                # are all done by the database, which only returns the cards for this page
+                card_list, self.next_cursor = self.db.list_cards(
+                    self.deck_id,
+                    self.user_id,
+                    search=search,
+                    priority=priority,
+                    after=self.next_cursor,
+                    limit=self.cards_per_page,
+                    tags=tags
+                )
+        except ValueError as e:
+            # the tag query can't be read yet, e.g. while the user is still typing "verbs and"
+            ctk.CTkLabel(self.cards_frame, text=str(e), font=("Inter", 14), text_color="#6B7280").pack(pady=50)
+            self.next_cursor = None
+            return
+        # the tags of the cards on this page, loaded in one query
+        card_tags = self.db.get_card_tags([card[0] for card in card_list])
 
         # instantiate card container for each card to be displayed
-        for card in sorted_cards:
+        # card is a tuple with following, (card_id, question, answer, ef)
+        for card in card_list:
             card_container = CardContainer(
                 self.cards_frame,
                 db=self.db,
@@ -561,10 +612,88 @@ class CardsPage(BasePage):
                 edit_callback=self.edit_card,
                 delete_callback=self.delete_card,
                 ef=card[3],
-                selection_callback=self.toggle_card_selection
+                selection_callback=self.toggle_card_selection,
+                tags=card_tags.get(card[0], [])
             )
             card_container.pack(fill="x", pady=10)
 
+        # if there are more cards, show a button to load the next page under the last card
+        if self.next_cursor is not None:
+            self.load_more_button = ctk.CTkButton(
+                self.cards_frame,
+                text="Load more cards",
+                width=160,
+                height=32,
+                corner_radius=16,
+                fg_color="#F3F4F6",
+                text_color="black",
+                hover_color="#E5E7EB",
+                command=self.load_card_page
+            )
+            self.load_more_button.pack(pady=10)
+
+    # shows a button for each of the deck's difficulty groups apart from the easiest, hardest first
+    def update_study_suggestions(self):
+        for widget in self.suggestions_frame.winfo_children():
+            widget.destroy()
+        groups = self.db.get_cluster_counts(self.user_id, self.deck_id)
+        clusters = self.db.get_difficulty_clusters(self.user_id)
+        groups = [group for group in groups if group[0] < len(clusters.names) - 1] if clusters else []
+        if not groups:
+            return
+        ctk.CTkLabel(
+            self.suggestions_frame,
+            text="Study together:",
+            font=("Inter", 13, "bold"),
+            text_color="#4B5563"
+        ).pack(side="left", padx=(0, 5))
+        for cluster, name, count in groups[:3]:
+            ctk.CTkButton(
+                self.suggestions_frame,
+                text=f"{count} {name}",
+                height=28,
+                corner_radius=14,
+                fg_color="#F5F3FF",
+                text_color="#4F46E5",
+                hover_color="#EDE9FE",
+                command=lambda c=cluster: self.study_cluster(c)
+            ).pack(side="left", padx=5)
+
+    # groups the user's cards by difficulty in a separate process (see clustering.py)
+    # the top level window is used to check on it, so the groups are still saved if the user leaves the page
+    def group_cards(self):
+        self.db.clustering_users.add(self.user_id)
+        run_in_process(
+            self.winfo_toplevel(), cluster_user, self.on_cards_grouped, self.db.db_name, self.user_id,
+            on_error=self.on_grouping_failed
+        )
+
+    # a failed run doesn't save anything, and the next visit to a cards page tries again
+    def on_grouping_failed(self, error):
+        self.db.clustering_users.discard(self.user_id)
+
+    def on_cards_grouped(self, result):
+        self.db.clustering_users.discard(self.user_id)
+        if result:
+            self.db.save_difficulty_clusters(self.user_id, *result)
+        if self.suggestions_frame.winfo_exists():
+            self.update_study_suggestions()
+
+    # starts a quiz session of the due cards in this deck and all its subdecks
+    def review_subtree(self):
+        for widget in self.master.winfo_children():
+            widget.destroy()
+        QuizSession(self.master, self.user_id, self.subdeck_ids, self.switch_page, db=self.db)
+
+    # starts a quiz of the cards in one of the deck's difficulty groups, lowest ef first
+    def study_cluster(self, cluster):
+        cards = self.db.get_cluster_cards(self.user_id, self.deck_id, cluster, RANDOM_QUIZ_SIZE)
+        if not cards:
+            return
+        for widget in self.master.winfo_children():
+            widget.destroy()
+        QuizSession(self.master, self.user_id, [self.deck_id], self.switch_page, db=self.db, source=cards)
+
     # call add card dialog to add a card (with question and answer)
     def add_card(self):
         AddCardDialog(self, deck_id=self.deck_id, db=self.db)
@@ -602,7 +731,7 @@ class CardsPage(BasePage):
 
 class CardContainer(BaseContainer):
     # initialises card container as subclass of base container (inheritance)
-    def __init__(self, master, db, card_id, question, answer, edit_callback, delete_callback, ef, selection_callback=None):
+    def __init__(self, master, db, card_id, question, answer, edit_callback, delete_callback, ef, selection_callback=None, tags=()):
         super().__init__(master, db=db)
         self.card_id = card_id
         self.selection_callback = selection_callback  # callback for handling selection state
@@ -646,6 +775,15 @@ class CardContainer(BaseContainer):
             text_color=color
         ).pack(anchor="w", pady=(5, 10))
 
+        # label to show the card's tags
+        if tags:
+            ctk.CTkLabel(
+                self.card_container,
+                text="  ".join(f"#{name}" for name in tags),
+                font=("Inter", 12),
+                text_color="#4F46E5"
+            ).pack(anchor="w", pady=(0, 10))
+
         # aligns buttons_frame to be on bottom of card
         buttons_frame = ctk.CTkFrame(self.card_container, fg_color="transparent")
         buttons_frame.pack(side="bottom", fill="x")
@@ -710,7 +848,7 @@ class EditCardDialog(BaseDialog):
     # initialise edit card dialog as subclass of basedialog (inheritance)
     def __init__(self, parent, card_id, db):
         # set dialog size for editing a card
-        super().__init__(db=db, title="Edit Card", width=500, height=500)
+        super().__init__(db=db, title="Edit Card", width=500, height=600)
         self.parent = parent
         self.card_id = card_id
 
@@ -762,6 +900,17 @@ class EditCardDialog(BaseDialog):
         self.answer_entry.pack(fill="x", padx=10, pady=(0, 10))
         self.answer_entry.insert("1.0", current_answer)
 
+        # create tags section label and input field, with the card's current tags in it
+        ctk.CTkLabel(
+            self.container,
+            text="Tags (separated by spaces)",
+            font=("Inter", 14, "bold"),
+            text_color="black"
+        ).pack(fill="x", pady=(10, 5))
+        self.tags_entry = self.create_dialog_input_field(
+            initial_value=" ".join(self.db.get_card_tags([card_id]).get(card_id, []))
+        )
+
         # create save button (defined in basedialog)
         self.create_dialog_button("Save Card", self.save_card)
         self.wait_window()
@@ -778,6 +927,7 @@ class EditCardDialog(BaseDialog):
             return
         try:
             self.db.update_card(self.card_id, new_question, new_answer)
+            self.db.set_card_tags(self.parent.user_id, self.card_id, parse_tag_list(self.tags_entry.get()))
             # simply close the dialog; the calling page should update the cards list
             self.cancel_dialog_event()
         except Exception as e:
@@ -787,7 +937,7 @@ class AddCardDialog(BaseDialog):
     # initialise add card dialog as subclass of base dialog (inheritance)
     def __init__(self, parent, deck_id, db):
         # set dialog size for creating a new card
-        super().__init__(db=db, title="New Card", width=500, height=500)
+        super().__init__(db=db, title="New Card", width=500, height=600)
         self.parent = parent
         self.deck_id = deck_id
         # create title (defined in base dialog)
@@ -830,6 +980,15 @@ class AddCardDialog(BaseDialog):
         )
         self.answer_entry.pack(fill="x", padx=10, pady=(0, 10))
 
+        # create tags section label and input field
+        ctk.CTkLabel(
+            self.container,
+            text="Tags (separated by spaces)",
+            font=("Inter", 14, "bold"),
+            text_color="black"
+        ).pack(pady=(10, 5))
+        self.tags_entry = self.create_dialog_input_field()
+
         # create save button (defined in base dialog)
         self.create_dialog_button("Save Card", self.save_card)
         self.wait_window()
@@ -845,17 +1004,33 @@ class AddCardDialog(BaseDialog):
             messagebox.showwarning("Warning", "Please fill in both question and answer")
             return
         try:
-            self.db.create_card(self.deck_id, question, answer)
+            card_id = self.db.create_card(self.deck_id, question, answer)
+            tags = parse_tag_list(self.tags_entry.get())
+            if tags:
+                self.db.set_card_tags(self.parent.user_id, card_id, tags)
             # simply close the dialog; the calling page should update the cards list
             self.cancel_dialog_event()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to create card: {str(e)}")
 
+# returns {deck_id: label} for a parent deck dropdown, with None (no parent) first and then each of the user's decks
+# (apart from excluded ones) labelled by its path, e.g. "Languages / Spanish"
+# deck names don't have to be unique, so decks with the same path have their deck id added to tell them apart
+def parent_deck_options(db, user_id, excluded=()):
+    paths = [(deck_id, path) for deck_id, path in db.get_deck_paths(user_id) if deck_id not in excluded]
+    path_counts = {}
+    for _, path in paths:
+        path_counts[path] = path_counts.get(path, 0) + 1
+    options = {None: NO_PARENT_LABEL}
+    for deck_id, path in paths:
+        options[deck_id] = f"{path} (#{deck_id})" if path_counts[path] > 1 else path
+    return options
+
 class EditDeckDialog(BaseDialog):
     # intiialise edit deck dialog as subclass of basedialog (inheritance)
     def __init__(self, parent, deck_id, db):
         # set dialog size
-        super().__init__(db=db, title="Edit Deck", width=400, height=300)
+        super().__init__(db=db, title="Edit Deck", width=400, height=600)
         self.parent = parent
         self.deck_id = deck_id
 
@@ -877,10 +1052,109 @@ class EditDeckDialog(BaseDialog):
         # create input field, with current deck name in it (defined in base dialog)
         self.deck_entry = self.create_dialog_input_field(initial_value=current_deck_name)
 
+        # parent deck dropdown, which can't offer the deck itself or its own subdecks
+        ctk.CTkLabel(
+            self.container,
+            text="Parent deck",
+            font=("Inter", 14, "bold"),
+            text_color="black"
+        ).pack(fill="x", pady=(10, 5))
+        subdeck_ids = set(self.db.get_subdeck_ids(deck_id))
+        self.parent_decks = parent_deck_options(self.db, self.parent.user_id, excluded=subdeck_ids)
+        self.current_parent = deck_info["parent_id"]
+        self.parent_selection = ctk.StringVar(value=self.parent_decks.get(self.current_parent, NO_PARENT_LABEL))
+        ctk.CTkOptionMenu(
+            self.container,
+            values=list(self.parent_decks.values()),
+            variable=self.parent_selection,
+            width=300,
+            fg_color="white",
+            button_color="#F3F4F6",
+            button_hover_color="#E5E7EB",
+            text_color="#111827"
+        ).pack(pady=5)
+
+        # scheduler dropdown, changing it reschedules the deck's cards when the deck is saved
+        ctk.CTkLabel(
+            self.container,
+            text="Scheduler",
+            font=("Inter", 14, "bold"),
+            text_color="black"
+        ).pack(fill="x", pady=(10, 5))
+        self.scheduler_names = {scheduler.label: name for name, scheduler in SCHEDULERS.items()}
+        self.current_scheduler = deck_info["scheduler"]
+        self.scheduler_selection = ctk.StringVar(value=SCHEDULERS[self.current_scheduler].label)
+        ctk.CTkOptionMenu(
+            self.container,
+            values=list(self.scheduler_names),
+            variable=self.scheduler_selection,
+            width=300,
+            fg_color="white",
+            button_color="#F3F4F6",
+            button_hover_color="#E5E7EB",
+            text_color="#111827"
+        ).pack(pady=10)
+
+        # simulate button, shows the daily reviews and retention to expect over the next year with the chosen scheduler
+        self.simulate_button = ctk.CTkButton(
+            self.container,
+            text="Simulate a Year",
+            width=300,
+            fg_color="white",
+            border_width=1,
+            border_color="#E5E7EB",
+            text_color="#111827",
+            hover_color="#F3F4F6",
+            command=self.simulate_scheduler
+        )
+        self.simulate_button.pack()
+        self.simulation_label = ctk.CTkLabel(self.container, text="", text_color="#4B5563", justify="left")
+        self.simulation_label.pack(pady=(5, 0))
+
         # create save button (defined in base dialog)
         self.create_dialog_button("Save Deck", self.save_deck)
         self.wait_window()
 
+    # simulates the deck's cards from their current state under the selected scheduler in worker processes,
+    # with the user's fitted settings if they have optimised the scheduler (the same settings the deck would use)
+    def simulate_scheduler(self):
+        user_id = self.parent.user_id
+        scheduler_name = self.scheduler_names[self.scheduler_selection.get()]
+        rows = self.db.get_simulation_state(user_id, self.deck_id)
+        if not rows:
+            self.simulation_label.configure(text="This deck has no cards to simulate")
+            return
+        fit = self.db.get_scheduler_fit(user_id)
+        params = SCHEDULERS[scheduler_name].fitted_params(fit) if fit else None
+        memory_params = SCHEDULERS["fsrs"].fitted_params(fit) if fit else None
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        state = initial_state(rows, local_timestamp(today))
+        tasks = simulation_tasks(state, scheduler_name, params, memory_params, SIMULATION_DAYS, SIMULATION_TRIALS)
+        self.simulate_button.configure(state="disabled")
+        self.simulation_label.configure(text="Simulating... 0%")
+        run_in_processes(
+            self, simulate, tasks, self.show_simulation,
+            on_progress=self.show_simulation_progress, on_error=self.on_simulation_failed
+        )
+
+    def show_simulation_progress(self, fraction):
+        self.simulation_label.configure(text=f"Simulating... {fraction * 100:.0f}%")
+
+    def on_simulation_failed(self, error):
+        self.simulate_button.configure(state="normal")
+        self.simulation_label.configure(text=f"Simulation failed: {error}")
+
+    def show_simulation(self, results):
+        summary = summarise(results)
+        daily_mean = summary["daily_mean"]
+        self.simulate_button.configure(state="normal")
+        self.simulation_label.configure(text=(
+            f"Reviews a day: {sum(daily_mean) / len(daily_mean):.0f} on average, "
+            f"busiest day {max(daily_mean):.0f} (90th percentile {max(summary['daily_p90']):.0f})\n"
+            f"Retention: {summary['retention'] * 100:.1f}% "
+            f"({summary['retention_p5'] * 100:.1f}% - {summary['retention_p95'] * 100:.1f}%)"
+        ))
+
     # when save deck button clicked, call save_deck to update datebase with new deck info
     def save_deck(self):
         new_deck_name = self.deck_entry.get().strip()
@@ -888,7 +1162,19 @@ class EditDeckDialog(BaseDialog):
             messagebox.showwarning("Warning", "Please enter a deck name")
             return
         try:
+            # the move is done first, as it is the only change that can be rejected
+            # move_deck changes nothing when it fails, so a failed save leaves the deck as it was
+            parent_label = self.parent_selection.get()
+            parent_id = next((d_id for d_id, label in self.parent_decks.items() if label == parent_label), None)
+            if parent_id != self.current_parent:
+                if not self.db.move_deck(self.deck_id, parent_id):
+                    messagebox.showerror("Error", "Failed to move the deck, a deck can't be moved into its own subdecks")
+                    return
+                self.current_parent = parent_id
             self.db.update_deck_name(self.deck_id, new_deck_name)
+            scheduler_name = self.scheduler_names[self.scheduler_selection.get()]
+            if scheduler_name != self.current_scheduler:
+                self.db.set_deck_scheduler(self.deck_id, scheduler_name)
             self.cancel_dialog_event()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to update deck: {str(e)}")
@@ -897,7 +1183,7 @@ class AddDeckDialog(BaseDialog):
     # initialise add deck dialog as subclass of basedialog (inheritance)
     def __init__(self, parent, db):
         # set dialog size
-        super().__init__(db=db, title="New Deck", width=400, height=300)
+        super().__init__(db=db, title="New Deck", width=400, height=380)
         self.parent = parent 
         self.create_dialog_title("New Deck")
         ctk.CTkLabel(
@@ -909,6 +1195,26 @@ class AddDeckDialog(BaseDialog):
         
         # create input field (defined in basedialog)
         self.deck_entry = self.create_dialog_input_field()
+
+        # parent deck dropdown, so the new deck can be made as a subdeck of another deck
+        ctk.CTkLabel(
+            self.container,
+            text="Parent deck",
+            font=("Inter", 14, "bold"),
+            text_color="black"
+        ).pack(pady=(10, 5))
+        self.parent_decks = parent_deck_options(self.db, self.parent.user_id)
+        self.parent_selection = ctk.StringVar(value=NO_PARENT_LABEL)
+        ctk.CTkOptionMenu(
+            self.container,
+            values=list(self.parent_decks.values()),
+            variable=self.parent_selection,
+            width=300,
+            fg_color="white",
+            button_color="#F3F4F6",
+            button_hover_color="#E5E7EB",
+            text_color="#111827"
+        ).pack(pady=5)
         # create add button (defined in base dialog)
         self.create_dialog_button("Save Deck", self.save_deck)
         self.wait_window()
@@ -920,11 +1226,297 @@ class AddDeckDialog(BaseDialog):
             messagebox.showwarning("Warning", "Please enter a deck name")
             return
         try:
-            self.db.create_deck(self.parent.user_id, new_deck_name)
+            parent_label = self.parent_selection.get()
+            parent_id = next((d_id for d_id, label in self.parent_decks.items() if label == parent_label), None)
+            self.db.create_deck(self.parent.user_id, new_deck_name, parent_id)
             self.cancel_dialog_event()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to create deck: {str(e)}")
 
+class BacklogDialog(BaseDialog):
+    # initialise backlog dialog as subclass of basedialog (inheritance)
+    # shows how many cards would be due each day if the overdue cards were spread over the chosen number of days,
+    # and only moves them when apply is clicked
+    def __init__(self, parent, db):
+        super().__init__(db=db, title="Spread Backlog", width=500, height=560)
+        self.parent = parent
+        self.plan = None
+        self.create_dialog_title("Spread Backlog")
+
+        ctk.CTkLabel(
+            self.container,
+            text="Spread overdue cards over",
+            font=("Inter", 14, "bold"),
+            text_color="black"
+        ).pack(fill="x", pady=(10, 5))
+        self.days_selection = ctk.StringVar(value=f"{SPREAD_DAYS[1]} days")
+        ctk.CTkOptionMenu(
+            self.container,
+            values=[f"{days} days" for days in SPREAD_DAYS],
+            variable=self.days_selection,
+            width=300,
+            fg_color="white",
+            button_color="#F3F4F6",
+            button_hover_color="#E5E7EB",
+            text_color="#111827",
+            command=lambda choice: self.preview()
+        ).pack(pady=10)
+
+        self.summary_label = ctk.CTkLabel(self.container, text="", text_color="#4B5563", justify="left")
+        self.summary_label.pack(pady=(5, 0))
+        # holds the before and after charts, which are redrawn when the number of days changes
+        self.chart_frame = ctk.CTkFrame(self.container, fg_color="white")
+        self.chart_frame.pack(fill="x")
+
+        self.apply_button = self.create_dialog_button("Apply", self.apply_plan)
+        self.preview()
+        self.wait_window()
+
+    # works out the plan for the chosen number of days and shows the forecast before and after it
+    def preview(self):
+        days = int(self.days_selection.get().split()[0])
+        self.plan = BacklogPlan(self.db, self.parent.user_id, days)
+        for widget in self.chart_frame.winfo_children():
+            widget.destroy()
+        if self.plan.overdue_count() == 0:
+            self.summary_label.configure(text="There are no overdue cards to spread")
+            self.apply_button.configure(state="disabled")
+            return
+        self.summary_label.configure(text=(
+            f"{self.plan.overdue_count()} overdue cards, {self.plan.moved_count()} moved to later days\n"
+            f"Busiest day: {max(self.plan.before)} cards now, {max(self.plan.after)} after spreading"
+        ))
+        self.apply_button.configure(state="normal")
+        for title, counts, colour in (("Now", self.plan.before, "#DC2626"), ("After spreading", self.plan.after, "#10B981")):
+            ctk.CTkLabel(self.chart_frame, text=title, font=("Inter", 12, "bold"), text_color="#4B5563").pack(anchor="w", padx=20)
+            LineChart(self.chart_frame, daily_series(list(zip(self.plan.dates, counts)), fill=0), colour=colour, height=110)
+
+    # when apply button clicked, moves the cards as previewed
+    def apply_plan(self):
+        try:
+            self.plan.apply()
+            self.cancel_dialog_event()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to spread backlog: {str(e)}")
+
+class LeechesDialog(BaseDialog):
+    # initialise leeches dialog as subclass of basedialog (inheritance)
+    # lists the user's leeches (cards failed again and again, see Database.update_spaced_rep) with buttons to suspend
+    # or unsuspend each one or reset it (e.g. after rewriting it), and sets the leech threshold and action
+    def __init__(self, parent, db):
+        super().__init__(db=db, title="Leeches", width=600, height=620)
+        self.parent = parent
+        self.user_id = parent.user_id
+        self.create_dialog_title("Leeches")
+
+        threshold, action = self.db.get_leech_settings(self.user_id)
+        settings_frame = ctk.CTkFrame(self.container, fg_color="transparent")
+        settings_frame.pack(pady=(0, 10))
+        ctk.CTkLabel(settings_frame, text="A leech after", font=("Inter", 14), text_color="black").pack(side="left", padx=5)
+        self.threshold_selection = ctk.StringVar(value=str(threshold))
+        ctk.CTkOptionMenu(
+            settings_frame,
+            values=[str(count) for count in (4, 6, 8, 10, 15)],
+            variable=self.threshold_selection,
+            width=70,
+            fg_color="white",
+            button_color="#F3F4F6",
+            button_hover_color="#E5E7EB",
+            text_color="#111827",
+            command=lambda choice: self.save_settings()
+        ).pack(side="left", padx=5)
+        ctk.CTkLabel(settings_frame, text="failures, then", font=("Inter", 14), text_color="black").pack(side="left", padx=5)
+        self.actions = {"tag it": "tag", "suspend it": "suspend"}
+        self.action_selection = ctk.StringVar(value=next(label for label, name in self.actions.items() if name == action))
+        ctk.CTkOptionMenu(
+            settings_frame,
+            values=list(self.actions),
+            variable=self.action_selection,
+            width=120,
+            fg_color="white",
+            button_color="#F3F4F6",
+            button_hover_color="#E5E7EB",
+            text_color="#111827",
+            command=lambda choice: self.save_settings()
+        ).pack(side="left", padx=5)
+
+        self.leeches_frame = ctk.CTkScrollableFrame(
+            self.container,
+            fg_color="transparent",
+            scrollbar_button_color="#E5E7EB",
+            scrollbar_button_hover_color="#D1D5DB"
+        )
+        self.leeches_frame.pack(fill="both", expand=True)
+        self.update_leech_list()
+        self.wait_window()
+
+    def save_settings(self):
+        self.db.set_leech_settings(
+            self.user_id, int(self.threshold_selection.get()), self.actions[self.action_selection.get()]
+        )
+
+    def update_leech_list(self):
+        for widget in self.leeches_frame.winfo_children():
+            widget.destroy()
+        leeches = self.db.get_leeches(self.user_id)
+        if not leeches:
+            ctk.CTkLabel(self.leeches_frame, text="No leeches, well done!", text_color="#6B7280").pack(pady=20)
+            return
+        for card_id, question, deck_name, lapses, failure_streak, suspended in leeches:
+            row = ctk.CTkFrame(self.leeches_frame, fg_color="#F9FAFB", corner_radius=8)
+            row.pack(fill="x", pady=4)
+            info = ctk.CTkFrame(row, fg_color="transparent")
+            info.pack(side="left", fill="x", expand=True, padx=10, pady=6)
+            ctk.CTkLabel(
+                info, text=question[:60], font=("Inter", 13, "bold"), text_color="black", anchor="w"
+            ).pack(fill="x")
+            ctk.CTkLabel(
+                info,
+                text=f"{deck_name} - {lapses} lapses, {failure_streak} failed in a row{' - suspended' if suspended else ''}",
+                font=("Inter", 11),
+                text_color="#6B7280",
+                anchor="w"
+            ).pack(fill="x")
+            ctk.CTkButton(
+                row,
+                text="Reset",
+                width=60,
+                height=28,
+                corner_radius=14,
+                fg_color="#F3F4F6",
+                text_color="black",
+                hover_color="#E5E7EB",
+                command=lambda c_id=card_id: self.reset_leech(c_id)
+            ).pack(side="right", padx=(2, 10))
+            ctk.CTkButton(
+                row,
+                text="Unsuspend" if suspended else "Suspend",
+                width=80,
+                height=28,
+                corner_radius=14,
+                fg_color="#FEE2E2" if not suspended else "#F3F4F6",
+                text_color="#DC2626" if not suspended else "black",
+                hover_color="#FECACA" if not suspended else "#E5E7EB",
+                command=lambda c_id=card_id, s=suspended: self.set_suspended(c_id, not s)
+            ).pack(side="right", padx=2)
+
+    def set_suspended(self, card_id, suspended):
+        self.db.set_card_suspended(self.user_id, card_id, suspended)
+        self.update_leech_list()
+
+    def reset_leech(self, card_id):
+        self.db.reset_leech(self.user_id, card_id)
+        self.update_leech_list()
+
+class CommandPalette(BaseDialog):
+    # initialise command palette (quick jump) as subclass of basedialog (inheritance)
+    # lets the user type part of a deck name or card question (typos are allowed) and jump straight to it
+    def __init__(self, parent, db):
+        super().__init__(db=db, title="Quick Jump", width=500, height=470)
+        self.parent = parent
+        self.results = []
+        self.selected_index = 0
+        self.search_job = None
+
+        # starts the index if it wasn't started at login (or belongs to a different user)
+        if self.db.search_index is None or self.db.search_index.user_id != self.parent.user_id:
+            self.db.start_search_index(self.parent.user_id)
+
+        self.create_dialog_title("Quick Jump")
+        self.search_entry = self.create_dialog_input_field()
+        self.search_entry.configure(placeholder_text="Search decks and cards")
+        self.search_entry.focus_set()
+
+        # a fixed number of result buttons are made once and then reconfigured on each search,
+        # as creating and destroying widgets on every keystroke is much slower than the search itself
+        self.result_buttons = []
+        for x in range(8):
+            button = ctk.CTkButton(
+                self.container,
+                text="",
+                width=440,
+                height=32,
+                corner_radius=8,
+                anchor="w",
+                fg_color="transparent",
+                text_color="black",
+                hover_color="#F3F4F6",
+                command=lambda index=x: self.open_result(index)
+            )
+            self.result_buttons.append(button)
+
+        self.status_label = ctk.CTkLabel(self.container, text="", font=("Inter", 12), text_color="#6B7280")
+        self.status_label.pack(pady=(5, 0))
+
+        # searching is debounced, so typing quickly only runs one search once the user pauses
+        self.search_entry.bind("<KeyRelease>", self.on_key_release)
+        self.search_entry.bind("<Return>", lambda e: self.open_result(self.selected_index))
+        self.search_entry.bind("<Down>", lambda e: self.move_selection(1))
+        self.search_entry.bind("<Up>", lambda e: self.move_selection(-1))
+        self.bind("<Escape>", lambda e: self.cancel_dialog_event())
+
+    def on_key_release(self, event):
+        # arrow keys and enter are handled by their own bindings and shouldn't restart the search
+        if event.keysym in ("Up", "Down", "Return", "Escape"):
+            return
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(80, self.run_search)
+
+    def run_search(self):
+        self.search_job = None
+        index = self.db.search_index
+        # if the index is still being built in the background, try again shortly
+        if not index.ready.is_set():
+            self.status_label.configure(text="Still indexing your decks and cards...")
+            self.search_job = self.after(100, self.run_search)
+            return
+        self.results = index.search(self.search_entry.get(), limit=len(self.result_buttons))
+        self.selected_index = 0
+        self.show_results()
+
+    def show_results(self):
+        for x, button in enumerate(self.result_buttons):
+            if x < len(self.results):
+                kind, _, text, deck_id = self.results[x]
+                if kind == "deck":
+                    label = f"Deck: {text}"
+                else:
+                    label = f"Card: {text[:50]}"
+                button.configure(
+                    text=label,
+                    fg_color="#F5F3FF" if x == self.selected_index else "transparent"
+                )
+                if not button.winfo_ismapped():
+                    button.pack(pady=1, before=self.status_label)
+            else:
+                button.pack_forget()
+        if self.search_entry.get().strip() and not self.results:
+            self.status_label.configure(text="No matches found")
+        else:
+            self.status_label.configure(text="Enter to open, arrow keys to move")
+
+    def move_selection(self, step):
+        if not self.results:
+            return
+        self.selected_index = (self.selected_index + step) % len(self.results)
+        self.show_results()
+
+    # opens the cards page of the chosen deck, and for a card also fills in the search box with its question
+    def open_result(self, index):
+        if index >= len(self.results):
+            return
+        kind, _, text, deck_id = self.results[index]
+        search = text if kind == "card" else ""
+        self.cancel_dialog_event()
+        self.parent.switch_page(
+            CardsPage,
+            user_id=self.parent.user_id,
+            deck_id=deck_id,
+            switch_page=self.parent.switch_page,
+            search=search
+        )
+
 class QuizPage(BasePage):
     # initialise quiz page as subclass of base page (inheritance)
     def __init__(self, master, user_id, switch_page, db):
@@ -994,6 +1586,50 @@ class QuizPage(BasePage):
         )
         self.start_button.pack(side="right", padx=(0, 10))
 
+        # session mode dropdown, "Due cards" reviews the selected decks' due cards in order and updates their schedule,
+        # "Cram" drills random cards from the selected decks (favouring hard ones) without changing their schedule,
+        # the random modes quiz 20 cards picked at random (from every card, or only high priority ones), due or not,
+        # and the study modes pick the due cards that fit in that many minutes (see planner.py)
+        self.session_mode_selection = ctk.StringVar(value="Due cards")
+        self.session_mode_menu = ctk.CTkOptionMenu(
+            self.header_frame,
+            values=["Due cards", "Cram", "Random 20", "Random 20 (hard)", "Study 10 min", "Study 20 min", "Study 30 min"],
+            variable=self.session_mode_selection,
+            width=120,
+            fg_color="white",
+            button_color="#F3F4F6",
+            button_hover_color="#E5E7EB",
+            text_color="#111827"
+        )
+        self.session_mode_menu.pack(side="right", padx=(0, 10))
+
+        # tag query entry, e.g. "verbs and not easy" (see tags.py), which limits any session mode to the matching cards
+        self.tag_input = ctk.StringVar()
+        ctk.CTkEntry(
+            self.header_frame,
+            textvariable=self.tag_input,
+            placeholder_text="Only cards tagged...",
+            placeholder_text_color="#D1D1D1",
+            text_color="#000000",
+            fg_color="white",
+            border_color="#e5e7eb",
+            width=180
+        ).pack(side="right", padx=(0, 10))
+
+        # review all due button, starts a session with the due cards from every deck
+        self.review_all_button = ctk.CTkButton(
+            self.header_frame,
+            text="Review All Due",
+            width=140,
+            height=32,
+            corner_radius=16,
+            fg_color="#F3F4F6",
+            text_color="black",
+            hover_color="#E5E7EB",
+            command=self.review_all_due
+        )
+        self.review_all_button.pack(side="right", padx=(0, 10))
+
         # separator to divide header from main content
         self.separator = ctk.CTkFrame(self.main_header_content, height=1, fg_color="#E5E7EB")
         self.separator.pack(fill="x", padx=30, pady=(20, 0))
@@ -1003,7 +1639,7 @@ class QuizPage(BasePage):
         self.selection_frame.pack(fill="both", expand=True, padx=30, pady=20)
         ctk.CTkLabel(
             self.selection_frame,
-            text="Select a deck to quiz yourself on",
+            text="Select one or more decks to quiz yourself on",
             font=("Inter", 16, "bold"),
             text_color="black"
         ).pack(anchor="w", pady=(0, 10))
@@ -1026,36 +1662,10 @@ class QuizPage(BasePage):
         for widget in self.decks_frame.winfo_children():
             widget.destroy()
 
-        deck_list = []
-        decks = self.db.get_decks(self.user_id)
-        for deck in decks:
-            deck_id = deck[0]
-            deck_name = deck[1]
-            cards = self.db.get_cards(deck_id)
-            if cards:
-                total_ef = 0
-                for c in cards:
-                    total_ef += self.db.get_card_easiness(self.user_id, c[0])
-                avg_ef = total_ef / len(cards)
-            else:
-                avg_ef = 2.5
-            card_count = self.db.get_card_count(deck_id)
-            deck_list.append((deck_id, deck_name, avg_ef, card_count))
-
-        # filter deck list based on search query
-        search_query = self.deck_search_input.get().lower().strip()
-        if search_query:
-            deck_list = [deck for deck in deck_list if search_query in deck[1].lower()]
-
-        # filter deck list based on priority selection
+        # get decks filtered by search query and priority selection (same as decks page)
+        search_query = self.deck_search_input.get().strip()
         priority_filter = self.deck_priority_filter_selection.get().lower()
-        if priority_filter != "all":
-            if priority_filter == "high":
-                deck_list = [deck for deck in deck_list if deck[2] < 2.0]
-            elif priority_filter == "medium":
-                deck_list = [deck for deck in deck_list if 2.0 <= deck[2] < 2.5]
-            elif priority_filter == "low":
-                deck_list = [deck for deck in deck_list if deck[2] >= 2.5]
+        deck_list = self.db.get_ordered_decks(self.user_id, search=search_query, priority=priority_filter)
 
         # if no decks found, display a message
         if not deck_list:
@@ -1069,25 +1679,17 @@ class QuizPage(BasePage):
             ).pack(expand=True, pady=50)
             return
 
-        # sort decks using bst (based on avg_ef)
-        from graph import DeckNode, insert_node, in_order
-        root = None
-        for deck in deck_list:
-            node = DeckNode(deck_id=deck[0], deck_name=deck[1], avg_ef=deck[2], card_count=deck[3])
-            root = insert_node(root, node)
-        sorted_nodes = in_order(root)
-
-        # create a deck container for each deck
+        # create a deck container for each deck (already sorted by avg_ef by the deck index)
         row, col = 0, 0
-        for node in sorted_nodes:
+        for deck_id, deck_name, avg_ef, card_count in deck_list:
             deck_container = DeckContainer(
                 self.decks_frame,
-                deck_id=node.deck_id,
+                deck_id=deck_id,
                 user_id=self.user_id,
-                deck_name=node.deck_name,
-                card_count=node.card_count,
+                deck_name=deck_name,
+                card_count=card_count,
                 selection_callback=self.toggle_deck_selection,
-                avg_ef=node.avg_ef,
+                avg_ef=avg_ef,
                 edit_callback=None,
                 delete_callback=None,
                 db=self.db
@@ -1100,9 +1702,10 @@ class QuizPage(BasePage):
 
     def toggle_deck_selection(self, deck_id, selected):
         # iterate through each deck container widget in the decks frame
+        # any number of decks can be selected, as a session can cover several decks
         for widget in self.decks_frame.winfo_children():
             # if this widget's deck id matches the toggled deck's id
-            if widget.deck_id == deck_id:
+            if getattr(widget, "deck_id", None) == deck_id:
                 # set its selected state to the same as the toggled deck
                 widget.selected = selected
                 # if selected, change background and mark checkbox; if not, reset appearance
@@ -1112,16 +1715,11 @@ class QuizPage(BasePage):
                 else:
                     widget.configure(fg_color="white")
                     widget.checkbox.deselect()
-            else:
-                # ensure all other deck containers are deselected
-                widget.selected = False
-                widget.configure(fg_color="white")
-                widget.checkbox.deselect()
         
         # manually check if any deck is selected
         selected_found = False
         for widget in self.decks_frame.winfo_children():
-            if widget.selected:
+            if getattr(widget, "selected", False):
                 selected_found = True
                 break
 
@@ -1129,26 +1727,61 @@ class QuizPage(BasePage):
         self.start_button.configure(state="normal" if selected_found else "disabled")
 
     def start_quiz(self):
-        # initialize variable to store the selected deck's id
-        selected_deck_id = None
+        # collect the ids of all the selected decks
+        selected_deck_ids = []
         # iterate through all deck container widgets in the decks frame
         for widget in self.decks_frame.winfo_children():
-            if widget.selected:
-                # if found, store its deck id and exit loop
-                selected_deck_id = widget.deck_id
-                break
+            if getattr(widget, "selected", False):
+                selected_deck_ids.append(widget.deck_id)
         # if no deck is selected, show a warning message
-        if selected_deck_id is None:
+        if not selected_deck_ids:
             messagebox.showwarning("Warning", "Please select a deck")
             return
+        mode = self.session_mode_selection.get()
+        tags = self.tag_input.get().strip() or None
+        try:
+            if mode == "Cram":
+                source = CramSampler(self.db, self.user_id, selected_deck_ids, tags=tags)
+                self.open_session(selected_deck_ids, source, practice=True)
+            elif mode.startswith("Random"):
+                priority = "high" if mode.endswith("(hard)") else None
+                cards = random_cards(self.db, self.user_id, selected_deck_ids, RANDOM_QUIZ_SIZE, priority=priority, tags=tags)
+                self.open_session(selected_deck_ids, cards)
+            elif mode.startswith("Study"):
+                minutes = int(mode.split()[1])
+                self.open_session(selected_deck_ids, TimeBudgetPlan(self.db, self.user_id, selected_deck_ids, minutes, tags=tags))
+            elif tags:
+                # due cards matching the tags, in due order
+                now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                self.open_session(selected_deck_ids, self.db.get_tagged_due_cards(self.user_id, selected_deck_ids, now_str, tags))
+            else:
+                self.open_session(selected_deck_ids)
+        except ValueError as e:
+            messagebox.showwarning("Warning", f"Couldn't read the tag filter: {e}")
+
+    # starts a session covering every one of the user's decks
+    def review_all_due(self):
+        deck_ids = [deck_id for deck_id, _ in self.db.get_decks(self.user_id)]
+        if not deck_ids:
+            messagebox.showwarning("Warning", "You don't have any decks yet")
+            return
+        self.open_session(deck_ids)
+
+    # source and practice are passed on to the quiz session (see QuizSession)
+    def open_session(self, deck_ids, source=None, practice=False):
         # clear all widgets on the window to start the quiz session
         for widget in self.master.winfo_children():
             widget.destroy()
-        # start a quiz session with the selected deck, passing along the db connection
-        QuizSession(self.master, self.user_id, selected_deck_id, self.switch_page, db=self.db)
+        # start a quiz session with the selected decks, passing along the db connection
+        QuizSession(self.master, self.user_id, deck_ids, self.switch_page, db=self.db, source=source, practice=practice)
 
 class QuizSession(ctk.CTkFrame):
-    def __init__(self, master, user_id, deck_id, switch_page, db):
+    # deck_ids is a list of the decks in the session, due cards from all of them are shown in due order
+    # source can be given to show other cards instead, it is iterated for (card_id, question, answer, due, deck_id) tuples,
+    # its length (if it has one) is shown as the number of cards, and if it has a record method it is told each answer
+    # (the card, whether it was correct and the seconds taken)
+    # practice sessions (e.g. cram mode) only ask for correctness and don't change the cards' schedules or save results
+    def __init__(self, master, user_id, deck_ids, switch_page, db, source=None, practice=False):
         super().__init__(master, corner_radius=0, fg_color="white")
         self.difficulty_rated = False # makes a ed this line of code to fix testing issue
 
@@ -1172,22 +1805,59 @@ class QuizSession(ctk.CTkFrame):
         
         # rest of your initialization code will now use scrollable_frame as parent
         self.user_id = user_id
-        self.deck_id = deck_id
+        self.deck_ids = list(deck_ids)
         self.switch_page = switch_page
         self.db = db
-
-        # retrieve cards available for review for this deck
-        self.cards = self.db.get_available_for_review(self.user_id, self.deck_id)
-        if not self.cards:
+        self.source = source
+        self.practice = practice
+
+        # cards available for review in the selected decks are streamed in due order by a k-way merge of the decks
+        # (see stream.py), so only a page of cards per deck is loaded at a time instead of every due card,
+        # and there is no limit on how many cards a session can have
+        # the next page of each deck is fetched in the background by the prefetcher while the current one is used
+        # the session's start time is used as "now" for the whole session, so cards rated during it don't come back
+        self.session_start_time = datetime.now()
+        if source is None:
+            now_str = self.session_start_time.strftime("%Y-%m-%d %H:%M:%S")
+            self.prefetcher = PagePrefetcher(self.db)
+            # the prefetcher's thread is stopped when the session ends or is closed by switching page
+            self.bind("<Destroy>", lambda e: self.prefetcher.close() if e.widget is self else None)
+            self.card_stream = merge_due_cards(self.db, self.user_id, self.deck_ids, now_str, prefetcher=self.prefetcher)
+        else:
+            self.card_stream = iter(source)
+        # only the first card is drawn here, to know if there are any, the rest are drawn when they are shown
+        # (see take_next_card) so sources that adapt to the answers, like TimeBudgetPlan, pick each card after
+        # the previous one has been recorded
+        self.next_card = next(self.card_stream, None)
+        if self.next_card is None:
             self.show_no_cards_message()
             return
 
-        # get deck name
-        deck_name = self.db.get_deck_name(self.deck_id)
-        self.total_cards = len(self.cards)
+        # the number of due cards comes from the cached due forecast, so the cards don't need to be counted
+        # total_due is None if the source has no length (cram mode goes on until the user finishes)
+        if source is None:
+            due_counts = self.db.get_due_counts(self.user_id)
+            self.total_due = sum(due_counts.get(deck_id, 0) for deck_id in self.deck_ids)
+        else:
+            self.total_due = len(source) if hasattr(source, "__len__") else None
+        # get deck name, or the number of decks if there is more than one
+        if len(self.deck_ids) == 1:
+            deck_name = self.db.get_deck_name(self.deck_ids[0])
+        else:
+            deck_name = f"{len(self.deck_ids)} decks"
+        self.total_cards = 0
         self.correct_count = 0
-        self.session_start_time = datetime.now()
         self.current_card = 0
+        # deck_results maps each deck id to [cards reviewed, correct answers, seconds spent on its cards],
+        # so a result can be saved for each deck at the end
+        self.deck_results = {}
+        # failed cards waiting to be shown again in this session (see stream.RelearnQueue)
+        self.relearn_queue = RelearnQueue()
+        self.last_quality = None
+        # set when the last rated card was suspended as a leech, so it isn't brought back in the session
+        self.last_suspended = False
+        self.last_review_time = None
+        self.waiting_timer = None
 
         # header with title, progress, and timer
         self.header = ctk.CTkFrame(self.scrollable_frame, fg_color="#f3f4f6", height=60)
@@ -1197,11 +1867,20 @@ class QuizSession(ctk.CTkFrame):
         self.header_center.pack(expand=True, fill="x")
         
         self.title_label = ctk.CTkLabel(
-            self.header_center, text=f"Quiz Session - {deck_name}", font=("Inter", 18, "bold"), text_color="black"
+            self.header_center,
+            text=f"{'Cram' if practice else 'Quiz'} Session - {deck_name}",
+            font=("Inter", 18, "bold"),
+            text_color="black"
         )
         self.title_label.pack(side="left", padx=30)
+        # practice sessions have no set number of cards, so they can be finished at any time
+        if practice:
+            ctk.CTkButton(
+                self.header_center, text="Finish Session", width=120, height=32, corner_radius=16,
+                fg_color="white", text_color="black", hover_color="#e5e7eb", command=self.end_quiz
+            ).pack(side="right", padx=(0, 30))
         self.progress_label = ctk.CTkLabel(
-            self.header_center, text=f"Card 1/{self.total_cards}", font=("Inter", 14), text_color="#4b5563"
+            self.header_center, text="Card 1", font=("Inter", 14), text_color="#4b5563"
         )
         self.progress_label.pack(side="right", padx=30)
         self.timer_label = ctk.CTkLabel(
@@ -1280,6 +1959,13 @@ class QuizSession(ctk.CTkFrame):
             fg_color="#f3f4f6", text_color="black", hover_color="#e5e7eb", command=self.show_answer
         )
         self.show_answer_button.pack(anchor="center")
+
+        # waiting frame with a finish button, shown while waiting for failed cards to come back (hidden initially)
+        self.waiting_frame = ctk.CTkFrame(self.content, fg_color="transparent")
+        ctk.CTkButton(
+            self.waiting_frame, text="Finish Session", width=120, height=32, corner_radius=16,
+            fg_color="#f3f4f6", text_color="black", hover_color="#e5e7eb", command=self.finish_early
+        ).pack(anchor="center")
         
         # rating section with "difficulty" header - renamed from "recall quality"
         self.rating_section = ctk.CTkFrame(
@@ -1307,12 +1993,22 @@ class QuizSession(ctk.CTkFrame):
         self.rating_center = ctk.CTkFrame(self.rating_frame, fg_color="transparent")
         self.rating_center.pack(expand=True, anchor="center")
         
+        # the sm-2 scheduler's days for easy and very easy, which are 1 and 3 unless it has been fitted to the
+        # user's reviews (see optimizer.py), while decks using the leitner or fsrs schedulers give each card its own
+        # number of days (see scheduler.py), so no days are shown for them
+        day_counts = [None, None]
+        if not self.db.get_scheduler_names(self.deck_ids) - {"sm2"}:
+            day_counts = [
+                f"{days} day" if days == 1 else f"{days} days"
+                for days in self.db.get_scheduler("sm2", self.user_id).params["days"]
+            ]
+        easy_days, very_easy_days = day_counts
         rating_options = [
             ("Very Hard (2 mins)", 0),
             ("Hard (6 mins)", 1),
             ("Medium (10 mins)", 2),
-            ("Easy (1 day)", 3),
-            ("Very Easy (3 days)", 4)
+            (f"Easy (~{easy_days})" if easy_days else "Easy", 3),
+            (f"Very Easy (~{very_easy_days})" if very_easy_days else "Very Easy", 4)
         ]
         for text, quality in rating_options:
             if quality in (0, 1):
@@ -1347,13 +2043,14 @@ class QuizSession(ctk.CTkFrame):
                 " • Very Hard → review in 2 minutes   (you barely remembered it; need to review the card again)\n"
                 " • Hard → review in 6 minutes         (you struggled; repeat the card soon)\n"
                 " • Medium → review in 10 minutes      (you remembered with effort; revisit the card shortly)\n"
-                " • Easy → review tomorrow (1 day)     (you recalled it comfortably; check if you still remember the card tomorrow)\n"
-                " • Very Easy → review in 3 days       (you remembered effortlessly; check if you still remember the card after 3 days)\n"
+                f" • Easy → review in {easy_days or 'some days'}     (you recalled it comfortably; check if you still remember the card then)\n"
+                f" • Very Easy → review in {very_easy_days or 'more days'}       (you remembered effortlessly; check if you still remember the card after longer)\n"
+                "Easy and Very Easy cards may be moved a day either way, to whichever day has the fewest cards due.\n"
                 "\n"
                 "Cards “available for review” are those whose scheduled review time has arrived (or have never been reviewed) and are ready for practice.\n"
                 "\n"
                 "For example, pressing “Very Hard” will make the card available to practice in just 2 minutes.\n"
-                "While the option “Very Easy“ will make the card available to practice in 3 days\n"
+                f"While the option “Very Easy“ will make the card available to practice in {very_easy_days or 'the most days'}\n"
                 "This ensures that Easier cards are reviewed after longer periods of time, while harder ones are reviewed more frequently, thus enforcing Spaced Repitition"
 
 
@@ -1456,10 +2153,17 @@ class QuizSession(ctk.CTkFrame):
         self.after(1000, self.update_timer)
 
     def display_card(self):
-        self.difficulty_rated = False # makes a ed this line of code to fix testing issue
-        # if no more cards remain, end the quiz
-        if self.current_card >= self.total_cards:
-            self.end_quiz()
+        # practice sessions don't ask for a difficulty rating
+        self.difficulty_rated = self.practice # makes a ed this line of code to fix testing issue
+        self.waiting_timer = None
+        self.waiting_frame.pack_forget()
+        card = self.take_next_card()
+        if card is None:
+            # if failed cards are still waiting to come back, wait for the next one, otherwise end the quiz
+            if self.relearn_queue and not self.out_of_time():
+                self.show_waiting()
+            else:
+                self.end_quiz()
             return
 
         # hide answer, correctness, interval and rating ui
@@ -1469,22 +2173,72 @@ class QuizSession(ctk.CTkFrame):
         self.button_frame.pack(fill="x", pady=15)
         self.show_answer_button.pack(anchor="center")
         
-        # get current card (in a tuple with card_id, question, answer, next_review_date)
-        card = self.cards[self.current_card]
+        # current card is a tuple with card_id, question, answer, next_review_date, deck_id
+        self.current_card_data = card
         self.current_card_id = card[0]
+        self.current_deck_id = card[4]
         self.question_label.configure(text=card[1])
         self.answer_label.configure(text=card[2])
-        self.progress_label.configure(text=f"Card {self.current_card + 1}/{self.total_cards}")
+        # more cards than expected can come up if some became due just as the session started
+        if self.total_due is None:
+            self.progress_label.configure(text=f"Card {self.current_card + 1}")
+        else:
+            self.total_due = max(self.total_due, self.current_card + 1)
+            self.progress_label.configure(text=f"Card {self.current_card + 1}/{self.total_due}")
         self.card_start_time = datetime.now()
 
+    # returns the next card to show, or None if there are none right now
+    # failed cards that are due again are shown first, so relearning happens as soon as the card is due,
+    # otherwise the next card from the stream of due cards is shown
+    # once a time budgeted session's time is used up, failed cards aren't brought back, so it doesn't overrun
+    def take_next_card(self):
+        if not self.out_of_time():
+            card = self.relearn_queue.pop_due(datetime.now())
+            if card is not None:
+                return card
+        card = self.next_card
+        if card is None:
+            return next(self.card_stream, None)
+        self.next_card = None
+        return card
+
+    # true if the session has a time budget (see planner.TimeBudgetPlan) and it has been used up
+    def out_of_time(self):
+        return hasattr(self.source, "time_left") and self.source.time_left() <= 0
+
+    # shown when every due card has been seen but failed cards are still waiting to come back
+    # a single timer is set for when the earliest one is due (the queue is a min-heap, so that is the top card)
+    # instead of checking the queue repeatedly
+    def show_waiting(self):
+        self.answer_frame.pack_forget()
+        self.rating_section.pack_forget()
+        self.correctness_section.pack_forget()
+        self.button_frame.pack_forget()
+        next_due = self.relearn_queue.next_due()
+        self.question_label.configure(
+            text=f"{len(self.relearn_queue)} card(s) you found hard will come back for another try, "
+                 f"the next one at {next_due.strftime('%H:%M')}.\nYou can wait here or finish the session now."
+        )
+        self.waiting_frame.pack(fill="x", pady=15)
+        delay = max(int((next_due - datetime.now()).total_seconds() * 1000), 0)
+        self.waiting_timer = self.after(delay, self.display_card)
+
+    # ends the session while waiting for failed cards to come back
+    def finish_early(self):
+        if self.waiting_timer:
+            self.after_cancel(self.waiting_timer)
+            self.waiting_timer = None
+        self.end_quiz()
+
     def show_answer(self):
     
         # hide the "show answer" button and reveal the answer and rating options
         self.button_frame.pack_forget()
         self.answer_frame.pack(fill="x", pady=(5, 10))  # reduced spacing
         
-        # show rating section with explanation
-        self.rating_section.pack(fill="x", pady=(5, 5))  # reduced spacing
+        # show rating section with explanation (not in practice sessions, as they don't change the schedule)
+        if not self.practice:
+            self.rating_section.pack(fill="x", pady=(5, 5))  # reduced spacing
         self.correctness_section.pack(fill="x", pady=(5, 0))  # reduced spacing
 
     def record_correctness(self, was_correct):
@@ -1495,13 +2249,30 @@ class QuizSession(ctk.CTkFrame):
         # sets the correctness
         if was_correct:
             self.correct_count += 1
-        self.db.update_card_correctness(
-            user_id=self.user_id,
-            card_id=self.current_card_id,
-            is_correct=was_correct
-        )
+        if not self.practice:
+            self.db.update_card_correctness(
+                user_id=self.user_id,
+                card_id=self.current_card_id,
+                is_correct=was_correct
+            )
+        card_time = (datetime.now() - self.card_start_time).total_seconds()
+        # let the source know the answer and how long it took, e.g. so cram mode brings failed cards back more often
+        if hasattr(self.source, "record"):
+            self.source.record(self.current_card_data, was_correct, card_time)
+        # add the card to its deck's results
+        results = self.deck_results.setdefault(self.current_deck_id, [0, 0, 0.0])
+        results[0] += 1
+        results[1] += int(was_correct)
+        results[2] += card_time
+        # cards rated very hard, hard or medium are put in the relearning queue, to be shown again in this session
+        # when they are due (2 - 10 minutes later), rather than waiting for the next session
+        if self.last_quality is not None and self.last_quality <= 2 and not self.last_suspended:
+            self.relearn_queue.push(self.last_review_time, self.current_card_data)
+            if self.total_due is not None:
+                self.total_due += 1
         # move to next card
         self.current_card += 1
+        self.total_cards += 1
         self.display_card()
         
     # shows a confirmation message after rating option selected
@@ -1538,38 +2309,52 @@ class QuizSession(ctk.CTkFrame):
 
         # updates the  scheduling of card using spaced repitition algorithm
         card_time = (datetime.now() - self.card_start_time).total_seconds()
-        self.db.update_spaced_rep(
+        next_review_time, _, _, _, new_leech = self.db.update_spaced_rep(
             user_id=self.user_id,
             card_id=self.current_card_id,
             quality=quality,
             time_taken=card_time
         )
-        
-        difficulty_messages = {
-            0: "Rating received: Very Hard - Card will be reviewed in 2 minutes",
-            1: "Rating received: Hard - Card will be reviewed in 6 minutes",
-            2: "Rating received: Medium - Card will be reviewed in 10 minutes",
-            3: "Rating received: Easy - Card will be reviewed in 1 day",
-            4: "Rating received: Very Easy - Card will be reviewed in 3 days"
-        }
-        
-        message = difficulty_messages.get(quality, "Rating received")
+        # the latest rating decides whether the card comes back later in the session (see record_correctness)
+        self.last_quality = quality
+        self.last_review_time = next_review_time
+        self.last_suspended = new_leech == "suspend"
+        
+        # the message says when the card's scheduler has actually scheduled it for
+        difficulty_names = {0: "Very Hard", 1: "Hard", 2: "Medium", 3: "Easy", 4: "Very Easy"}
+        now = datetime.now()
+        days = (next_review_time.date() - now.date()).days
+        if days == 0:
+            minutes = round((next_review_time - now).total_seconds() / 60)
+            when = f"in {minutes} minute{'s' if minutes != 1 else ''}"
+        else:
+            when = f"in {days} day{'s' if days != 1 else ''}"
+        message = f"Rating received: {difficulty_names.get(quality, '')} - Card will be reviewed {when}"
+        # cards failed again and again are leeches (see Database.update_spaced_rep), which are best rewritten
+        if new_leech == "suspend":
+            message = f"Rating received: {difficulty_names.get(quality, '')} - Card suspended as a leech (see Settings)"
+        elif new_leech == "tag":
+            message += " - this card is now a leech, consider rewriting it"
         self.show_temporary_confirmation(message)
         
     def end_quiz(self):
-        # calculate total quiz session time and average time per card
-        deck_time = (datetime.now() - self.session_start_time).total_seconds()
-        self.total_time = deck_time
-        avg_time = deck_time / self.total_cards if self.total_cards > 0 else 0
-        # save the quiz result in the database
-        self.db.save_quiz_result(
-            user_id=self.user_id,
-            deck_id=self.deck_id,
-            total_cards=self.total_cards,
-            correct_count=self.correct_count,
-            avg_time=avg_time,
-            deck_time=deck_time
-        )
+        # calculate total quiz session time
+        self.total_time = (datetime.now() - self.session_start_time).total_seconds()
+        # save a quiz result for each deck in the session, the session time is split between the decks
+        # by how long was spent on each deck's cards (so a single deck session gets the whole session time)
+        card_time = sum(results[2] for results in self.deck_results.values())
+        # practice sessions aren't saved, so they don't change the quiz statistics
+        deck_results = {} if self.practice else self.deck_results
+        for deck_id, (cards, correct, time_spent) in deck_results.items():
+            deck_time = self.total_time * time_spent / card_time if card_time > 0 else self.total_time / len(self.deck_results)
+            self.db.save_quiz_result(
+                user_id=self.user_id,
+                deck_id=deck_id,
+                total_cards=cards,
+                correct_count=correct,
+                avg_time=deck_time / cards,
+                deck_time=deck_time
+            )
         self.show_summary()
 
     def show_summary(self):
@@ -1718,8 +2503,8 @@ class AnalyticsPage(BasePage):
     # initialises analytics page as a subclass of basepage (inheritance)
     def __init__(self, master, user_id, switch_page, db):
         super().__init__(master, user_id, switch_page, db=db)
-        # get quiz stats for the user and initialise deck details mapping
-        self.stats = self.db.get_quiz_stats(self.user_id)
+        # charts stores each line chart once it has been drawn, so collapsing and expanding its section reuses it
+        self.charts = {}
         # deck_details stores a mapping from each deck id to its details container widget
         # each key is a deck id and the value is the frame that holds detailed statistics for that deck
         self.deck_details = {}
@@ -1748,8 +2533,43 @@ class AnalyticsPage(BasePage):
         )
         self.analytics_container.pack(fill="both", expand=True, padx=30, pady=20)
 
-        # create overall stats section, deck performance section, graph controls and return button
+        # all the stats shown on this page come from one analytics snapshot (see analytics.py)
+        # if nothing has changed since the last one was built, the cached snapshot is shown straight away,
+        # otherwise a new one is built on a background thread while a loading message is shown
+        snapshot = self.db.get_analytics_snapshot(self.user_id)
+        if snapshot:
+            self.show_snapshot(snapshot)
+        else:
+            self.loading_label = ctk.CTkLabel(
+                self.analytics_container,
+                text="Loading analytics...",
+                font=("Inter", 16, "bold"),
+                text_color="#4B5563"
+            )
+            self.loading_label.pack(pady=50)
+            version = self.db.change_counter
+            run_in_background(
+                self,
+                build_snapshot,
+                lambda built: self.on_snapshot_built(built, version),
+                self.db.db_name,
+                self.user_id,
+                self.db.get_retention_engine(self.user_id)
+            )
+
+    # caches the snapshot built in the background and shows it
+    def on_snapshot_built(self, snapshot, version):
+        self.db.save_analytics_snapshot(self.user_id, version, snapshot)
+        self.loading_label.destroy()
+        self.show_snapshot(snapshot)
+
+    # create overall stats section, deck performance section, graph controls and return button
+    def show_snapshot(self, snapshot):
+        self.snapshot = snapshot
+        self.stats = snapshot.overall
         self.create_overall_stats_section()
+        self.create_study_patterns_section()
+        self.create_charts_section()
         self.create_deck_performance_section()
         self.create_info_section()
         self.create_return_button()
@@ -1772,6 +2592,17 @@ class AnalyticsPage(BasePage):
         ctk.CTkLabel(stat_info, text=label_text, font=("Inter", 12), text_color="#4B5563").pack(anchor="w", pady=(2, 0))
         ctk.CTkLabel(stat_info, text=value_text, font=("Inter", 20, "bold"), text_color="#111827").pack(anchor="w", pady=(5, 0))
 
+    # returns stat card layouts for the median, 90th and 99th percentile answer times
+    # the mean (avg time per card) hides slow answers, so the percentiles show how slow the slowest answers are
+    def answer_time_layout(self, answer_times, suffix):
+        if not answer_times:
+            return [(f"Answer Time Percentiles {suffix}", "No answers yet", "⏳")]
+        return [
+            (f"Median (p50) Answer Time {suffix}", f"{answer_times['p50']:.1f}s", "⏳"),
+            (f"Slow (p90) Answer Time {suffix}", f"{answer_times['p90']:.1f}s", "🐢"),
+            (f"Slowest (p99) Answer Time {suffix}", f"{answer_times['p99']:.1f}s", "🚨"),
+        ]
+
     # creates the overall statistics section
     def create_overall_stats_section(self):
         # stat container for overall stats
@@ -1812,13 +2643,14 @@ class AnalyticsPage(BasePage):
             ("Total Time Spent Quizzing Yourself Across All Decks", f"{total_time:.1f}s", "⏱️"),
             ("Avg Time Per Card Across All Decks", f"{avg_time_card:.1f}s", "⚡"),
         ]
+        stats_layout.extend(self.answer_time_layout(self.snapshot.answer_times, "Across All Decks"))
 
-        # create stat cards in a grid with 3 rows and 2 columns
-        row_count = 3
+        # create stat cards in a grid with 2 columns
         col_count = 2
+        row_count = (len(stats_layout) + col_count - 1) // col_count
         index = 0  # counter to iterate through stats_layout
         
-        # iterates through stats_layout and displays each stat as a container in a 2x3 grid
+        # iterates through stats_layout and displays each stat as a container in the grid
         for row in range(row_count):
             row_frame = ctk.CTkFrame(stat_cards_container, fg_color="white")
             row_frame.pack(fill="x", pady=5)
@@ -1831,6 +2663,134 @@ class AnalyticsPage(BasePage):
                     index += 1
   
 
+    # creates the study patterns section, with the activity heatmap, retention by interval and accuracy by hour of day
+    def create_study_patterns_section(self):
+        patterns_container = ctk.CTkFrame(
+            self.analytics_container,
+            fg_color="white",
+            corner_radius=8,
+            border_width=1,
+            border_color="#E5E7EB"
+        )
+        patterns_container.pack(fill="x", pady=(0, 20))
+
+        ctk.CTkLabel(
+            patterns_container,
+            text="Study Patterns",
+            font=("Inter", 18, "bold"),
+            text_color="#111827"
+        ).pack(anchor="w", padx=20, pady=(15, 10))
+
+        patterns = self.snapshot.patterns
+        if not patterns or patterns["total_reviews"] == 0:
+            ctk.CTkLabel(
+                patterns_container,
+                text="Rate some cards in a quiz to see your study patterns",
+                font=("Inter", 14),
+                text_color="#4B5563"
+            ).pack(anchor="w", padx=20, pady=(0, 15))
+            return
+
+        ctk.CTkLabel(
+            patterns_container,
+            text=f"Reviews in the last year ({patterns['total_reviews']} reviews in total)",
+            font=("Inter", 14, "bold"),
+            text_color="#4B5563"
+        ).pack(anchor="w", padx=20, pady=(5, 5))
+        draw_heatmap(patterns_container, patterns["heatmap_start"], patterns["heatmap"])
+
+        ctk.CTkLabel(
+            patterns_container,
+            text="Accuracy by time since last review",
+            font=("Inter", 14, "bold"),
+            text_color="#4B5563"
+        ).pack(anchor="w", padx=20, pady=(15, 5))
+        draw_bar_chart(patterns_container, [(label, rate, total) for label, total, rate in patterns["retention"]])
+
+        ctk.CTkLabel(
+            patterns_container,
+            text="Accuracy by hour of day",
+            font=("Inter", 14, "bold"),
+            text_color="#4B5563"
+        ).pack(anchor="w", padx=20, pady=(15, 5))
+        hour_bars = [(f"{hour:02d}", rate, total) for hour, (total, rate) in enumerate(patterns["hour_accuracy"])]
+        draw_bar_chart(patterns_container, hour_bars)
+
+        # small gap below the last chart
+        ctk.CTkFrame(patterns_container, fg_color="white", height=10).pack(fill="x")
+
+    # creates the charts section, where each chart is only drawn when its section is first expanded
+    def create_charts_section(self):
+        charts_container = ctk.CTkFrame(
+            self.analytics_container,
+            fg_color="white",
+            corner_radius=8,
+            border_width=1,
+            border_color="#E5E7EB"
+        )
+        charts_container.pack(fill="x", pady=(0, 20))
+
+        ctk.CTkLabel(
+            charts_container,
+            text="Charts",
+            font=("Inter", 18, "bold"),
+            text_color="#111827"
+        ).pack(anchor="w", padx=20, pady=(15, 10))
+
+        series = self.snapshot.series
+        # the due forecast comes from the database's cached forecast, so it is up to date even if the snapshot isn't
+        due_series = daily_series(self.db.get_due_forecast(self.user_id, days=30), fill=0)
+        self.create_expandable_chart_section(charts_container, "Quizzes Completed Per Day", "sessions", series["sessions"], "#3B82F6", "{:.0f}")
+        self.create_expandable_chart_section(charts_container, "Accuracy Per Day", "accuracy", series["accuracy"], "#10B981", "{:.0f}%")
+        self.create_expandable_chart_section(charts_container, "Time Studied Per Day", "time", series["time"], "#F59E0B", "{:.0f}s")
+        self.create_expandable_chart_section(charts_container, "Cards Due Over The Next 30 Days", "due", due_series, "#DC2626", "{:.0f}")
+
+        # small gap below the last section
+        ctk.CTkFrame(charts_container, fg_color="white", height=10).pack(fill="x")
+
+    # creates a collapsed section with a + / - toggle (like create_expandable_info_section) holding a line chart
+    # the chart is created the first time the section is expanded, so charts that aren't looked at are never drawn
+    def create_expandable_chart_section(self, parent, title, key, series, colour, value_format):
+        section_frame = ctk.CTkFrame(parent, fg_color="white")
+        section_frame.pack(fill="x", padx=20, pady=5)
+
+        header_frame = ctk.CTkFrame(section_frame, fg_color="#F9FAFB")
+        header_frame.pack(fill="x", pady=5)
+
+        ctk.CTkLabel(
+            header_frame,
+            text=title,
+            font=("Inter", 14, "bold"),
+            text_color="#4B5563"
+        ).pack(side="left", padx=15, pady=10)
+
+        toggle_button = ctk.CTkButton(
+            header_frame,
+            text="+",
+            width=30,
+            height=30,
+            corner_radius=15,
+            fg_color="#E5E7EB",
+            text_color="#4B5563",
+            hover_color="#D1D5DB",
+            font=("Inter", 16, "bold")
+        )
+        toggle_button.pack(side="right", padx=15, pady=10)
+
+        content_frame = ctk.CTkFrame(section_frame, fg_color="white")
+
+        def toggle_section():
+            if content_frame.winfo_ismapped():
+                content_frame.pack_forget()
+                toggle_button.configure(text="+")
+                return
+            content_frame.pack(fill="x", pady=5)
+            toggle_button.configure(text="-")
+            if key not in self.charts:
+                self.charts[key] = LineChart(content_frame, series, colour=colour, value_format=value_format)
+
+        toggle_button.configure(command=toggle_section)
+
     # creates the deck performance section
     def create_deck_performance_section(self):
         # container for deck performance stats
@@ -1850,24 +2810,11 @@ class AnalyticsPage(BasePage):
             text_color="#111827"
         ).pack(anchor="w", padx=20, pady=(15, 10))
 
-        # build a list of decks with performance scores
-        decks = self.db.get_decks(self.user_id)
-        deck_list = []
-        for deck_id, deck_name in decks:
-            performance_score = self.db.get_deck_performance_score(self.user_id, deck_id)
-            deck_list.append((deck_id, deck_name, performance_score))
-
-        # reverse=True is needed because sort() will sort in ascending order by default, but this needs to be descending
-        # get_performance_score returns the third element of each deck in deck_list
-        # which is performance_score, and then sort() sorts the deck_list based on these performance scores in descending order
-        def get_performance_score(x):
-            return x[2]
-        deck_list.sort(key=get_performance_score, reverse=True)
+        # list of decks with performance scores, already sorted by performance score (highest first) in the snapshot
+        deck_list = self.snapshot.decks
 
         # create a deck performance card for each deck
         for deck_id, deck_name, performance in deck_list:
-            self.db.get_deck_stats(self.user_id, deck_id)
-            # deck_stats = 
             # container for a single deck performance card
             deck_performance_card = ctk.CTkFrame(
                 performance_container,
@@ -1947,8 +2894,8 @@ class AnalyticsPage(BasePage):
             for widget in deck_details_frame.winfo_children():
                 widget.destroy()
 
-            # fetch deck statistics from the database for this deck
-            deck_stats = self.db.get_deck_stats(self.user_id, deck_id)
+            # get deck statistics for this deck from the snapshot, instead of querying the database again
+            deck_stats = self.snapshot.get_deck_stats(deck_id)
             # define layout for deck details: each tuple is (stat label, stat value, icon)
             deck_details_layout = [
                 ("Quizzes Completed For This Deck", f"{deck_stats.get('session_count', 0)}", "📊"),
@@ -1958,14 +2905,15 @@ class AnalyticsPage(BasePage):
                 ("Total Time Spent Quizzing For This Deck", f"{deck_stats.get('total_time', 0):.1f}s", "⏱️"),
                 ("Average Time Per Card For This Deck", f"{deck_stats.get('avg_time_per_card', 0):.1f}s", "⚡"),
             ]
+            deck_details_layout.extend(self.answer_time_layout(self.snapshot.deck_answer_times.get(deck_id), "For This Deck"))
 
             # create a container frame for the deck detail stat cards
             details_container = ctk.CTkFrame(deck_details_frame, fg_color="white")
             details_container.pack(fill="x", expand=True, padx=15, pady=15)
 
-            # set up grid: 3 rows and 2 columns for six stat cards
-            row_count = 3
+            # set up grid with 2 columns for the stat cards
             col_count = 2
+            row_count = (len(deck_details_layout) + col_count - 1) // col_count
             index = 0  # counter to iterate through deck_details_layout
             
             
@@ -2014,7 +2962,10 @@ class AnalyticsPage(BasePage):
                 ("Total Correct Answers", "The number of cards you marked as 'Correct' during your reviews. This reflects how many times you successfully recalled the information."),
                 ("Overall Accuracy", "The percentage of cards you marked as 'Correct' out of all cards reviewed. Higher percentages indicate better recall performance."),
                 ("Total Time Spent Quizzing Yourself", "The cumulative time you've spent in quiz sessions across all decks, measured in seconds."),
-                ("Avg Time Per Card", "The average time you spend on each card, calculated by dividing your total quiz time by the number of cards reviewed. This indicates your review speed.")
+                ("Avg Time Per Card", "The average time you spend on each card, calculated by dividing your total quiz time by the number of cards reviewed. This indicates your review speed."),
+                ("Study Patterns", "The heatmap shows how many cards you reviewed each day over the last year. The charts below it show how often you answered correctly depending on how long it had been since you last saw the card, and on the hour of the day you were studying."),
+                ("Charts", "Expand a chart to see how your quizzes, accuracy and study time have changed day by day, and how many cards will be due over the next 30 days. Long histories are simplified to fit the width of the chart while keeping their peaks and dips."),
+                ("Answer Time Percentiles", "p50 is your median answer time (half of your answers are faster). p90 and p99 are the times that 90% and 99% of your answers are faster than, so they show how long your slowest answers take, which the average can hide.")
             ]
         )
         
@@ -2271,6 +3222,40 @@ class SettingsPage(BasePage):
             command=self.delete_account
         ).pack(pady=10)
 
+        # add optimise scheduler button, which fits the scheduler settings to the user's own review history
+        self.optimise_button = ctk.CTkButton(
+            self.settings_container,
+            text="Optimise Scheduler",
+            width=300,
+            height=45,
+            corner_radius=16,
+            fg_color="#F3F4F6",
+            text_color="black",
+            hover_color="#E5E7EB",
+            command=self.optimise_scheduler
+        )
+        self.optimise_button.pack(pady=10)
+        fit = self.db.get_scheduler_fit(self.user_id)
+        self.optimise_label = ctk.CTkLabel(
+            self.settings_container,
+            text=f"Fitted to {fit['reviews']} answers" if fit else "Using the default scheduler settings",
+            text_color="#4B5563"
+        )
+        self.optimise_label.pack()
+
+        # add leeches button, which lists the cards failed again and again and sets when a card becomes a leech
+        ctk.CTkButton(
+            self.settings_container,
+            text="Leeches",
+            width=300,
+            height=45,
+            corner_radius=16,
+            fg_color="#F3F4F6",
+            text_color="black",
+            hover_color="#E5E7EB",
+            command=lambda: LeechesDialog(self, db=self.db)
+        ).pack(pady=10)
+
         # add status label for feedback messages
         self.status_label = ctk.CTkLabel(
             self.settings_container,
@@ -2279,6 +3264,36 @@ class SettingsPage(BasePage):
         )
         self.status_label.pack(pady=10)
 
+    # fits the scheduler to the user's reviews in a separate process (see optimizer.py), showing its progress
+    # the top level window is used to check on it, so the fit is still saved if the user leaves the settings page
+    def optimise_scheduler(self):
+        self.optimise_button.configure(state="disabled")
+        self.optimise_label.configure(text="Optimising... 0%")
+        run_in_process(
+            self.winfo_toplevel(), fit_user, self.on_scheduler_fitted, self.db.db_name, self.user_id,
+            on_progress=self.show_optimise_progress, on_error=self.on_optimise_failed
+        )
+
+    def show_optimise_progress(self, fraction):
+        if self.optimise_label.winfo_exists():
+            self.optimise_label.configure(text=f"Optimising... {fraction * 100:.0f}%")
+
+    def on_optimise_failed(self, error):
+        if self.optimise_label.winfo_exists():
+            self.optimise_button.configure(state="normal")
+            self.optimise_label.configure(text=f"Optimising failed: {error}")
+
+    def on_scheduler_fitted(self, fit):
+        if fit:
+            self.db.save_scheduler_fit(self.user_id, fit)
+        if not self.optimise_label.winfo_exists():
+            return
+        self.optimise_button.configure(state="normal")
+        if fit:
+            self.optimise_label.configure(text=f"Fitted to {fit['reviews']} answers")
+        else:
+            self.optimise_label.configure(text=f"Not enough marked answers yet (at least {MIN_REVIEWS} are needed)")
+
     def update(self):
         new_email = self.email_entry.get().strip()
         new_username = self.username_entry.get().strip()
@@ -2311,6 +3326,7 @@ class SettingsPage(BasePage):
         try:
             deleted = self.db.delete_user(self.user_id)
             if deleted:
+                self.db.stop_due_watcher()
                 messagebox.showinfo("Account deleted", "Your account has been deleted.")
                 from login import LoginPage
                 self.switch_page(LoginPage)
@@ -0,0 +1,124 @@
+# external imports
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from queue import Empty
+
+
+# runs work(*args) on a background thread so the window doesn't freeze, then calls on_done(result) on the main thread
+# tkinter widgets can only be used safely from the main thread, so instead of the thread calling on_done itself,
+# the widget checks every check_ms milliseconds (only while the work is running) whether the result is ready
+# if the work raises an error, on_error(error) is called instead (if it is given), so the caller can put its widgets
+# back (e.g. enable a button it disabled while the work ran)
+# if the widget has been destroyed by then (e.g. the user switched page), neither is called
+def run_in_background(widget, work, on_done, *args, on_error=None, check_ms=30):
+    result = {}
+
+    def run():
+        try:
+            result["value"] = work(*args)
+        except Exception as e:
+            print(f"Background task error: {e}")
+            result["error"] = e
+        result["done"] = True
+
+    def check():
+        if not widget.winfo_exists():
+            return
+        if "done" not in result:
+            widget.after(check_ms, check)
+        elif "error" not in result:
+            on_done(result["value"])
+        elif on_error:
+            on_error(result["error"])
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    widget.after(check_ms, check)
+    return thread
+
+
+# the queue a worker process sends its progress to, set in each worker process when it starts
+progress_queue = None
+
+
+def start_worker(queue):
+    global progress_queue
+    progress_queue = queue
+
+
+# called by work running in a worker process (see run_in_process) to report how far through it is, from 0 to 1
+def report_progress(fraction):
+    if progress_queue is not None:
+        progress_queue.put(fraction)
+
+
+# runs work(*args) in a separate process, for heavy numpy work that would otherwise hold up the window
+# (a thread can't use a second cpu core for python code, a process can), then calls on_done(result) on the main thread
+# work and its arguments are sent to the process, so work has to be a top level function and the arguments
+# simple values (e.g. the database file name rather than the Database object)
+# progress reported by the work with report_progress is passed to on_progress(fraction) as it comes in
+# like run_in_background, on_error(error) is called if the work raises, and nothing is called once the widget
+# has been destroyed
+def run_in_process(widget, work, on_done, *args, on_progress=None, on_error=None, check_ms=100):
+    queue = multiprocessing.Queue()
+    executor = ProcessPoolExecutor(max_workers=1, initializer=start_worker, initargs=(queue,))
+    future = executor.submit(work, *args)
+    # the process finishes the work and then stops, without the window waiting for it
+    executor.shutdown(wait=False)
+
+    def check():
+        fraction = None
+        while True:
+            try:
+                fraction = queue.get_nowait()
+            except Empty:
+                break
+        if not widget.winfo_exists():
+            return
+        if fraction is not None and on_progress:
+            on_progress(fraction)
+        if not future.done():
+            widget.after(check_ms, check)
+        elif future.exception() is not None:
+            print(f"Background task error: {future.exception()}")
+            if on_error:
+                on_error(future.exception())
+        else:
+            on_done(future.result())
+
+    widget.after(check_ms, check)
+    return future
+
+
+# runs work(*args) for each list of args in tasks, spread over a process for each cpu core, then calls
+# on_done(results) on the main thread with the results in the same order as the tasks
+# on_progress(fraction) is called with the share of tasks finished as they finish,
+# and on_error(error) with the first error if any of the tasks raise
+def run_in_processes(widget, work, tasks, on_done, on_progress=None, on_error=None, check_ms=100):
+    executor = ProcessPoolExecutor(max_workers=min(len(tasks), os.cpu_count() or 1))
+    futures = [executor.submit(work, *args) for args in tasks]
+    executor.shutdown(wait=False)
+
+    def check():
+        if not widget.winfo_exists():
+            for future in futures:
+                future.cancel()
+            return
+        finished = sum(future.done() for future in futures)
+        if on_progress:
+            on_progress(finished / len(futures))
+        if finished < len(futures):
+            widget.after(check_ms, check)
+            return
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            print(f"Background task error: {errors[0]}")
+            if on_error:
+                on_error(errors[0])
+        else:
+            on_done([future.result() for future in futures])
+
+    widget.after(check_ms, check)
+    return futures
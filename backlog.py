@@ -0,0 +1,93 @@
+# external imports
+from datetime import datetime
+import numpy as np
+
+# the number of days a backlog can be spread over
+SPREAD_DAYS = (3, 7, 14, 30)
+
+
+# gives each overdue card a day (0 is today) so the number of cards due each day is as even as possible
+# load is the number of other cards already due on each of the days, and urgency ranks the overdue cards:
+# the most urgent cards are kept for the earliest days
+# the days are filled up to a common level, like water poured over the existing load: the level is the lowest one
+# whose room above each day's load is enough for every overdue card, and days already over it get no extra cards
+def spread_days(load, urgency):
+    load = np.asarray(load, dtype=np.float64)
+    count = len(urgency)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+    # the level lies between the lowest load and the highest load plus every card, and is found by bisection
+    low, high = load.min(), load.max() + count
+    while high - low > 0.5:
+        level = (low + high) / 2
+        if np.maximum(level - load, 0).sum() >= count:
+            high = level
+        else:
+            low = level
+    room = np.floor(np.maximum(high - load, 0)).astype(np.int64)
+    # rounding down can leave a few cards without room, they go on the least loaded days
+    short = count - room.sum()
+    if short > 0:
+        room[np.argsort(load + room, kind="stable")[:short]] += 1
+    # cards ranked by urgency fill the days in order, up to each day's room
+    rank = np.empty(count, dtype=np.int64)
+    rank[np.argsort(-np.asarray(urgency), kind="stable")] = np.arange(count)
+    return np.searchsorted(np.cumsum(room), rank, side="right")
+
+
+class BacklogPlan:
+    # a plan for spreading a user's overdue cards (cards due before today, e.g. after a break) over the next days days,
+    # instead of every overdue card being due at once (cards only due since midnight are left alone)
+    # cards are ranked by how urgent they are: how far past their interval they are (overdue time over interval)
+    # and how hard they are (low ef), and the most urgent stay due today while the rest are moved to later days
+    # so the total number of cards due each day (see spread_days) is as flat as possible
+    # the plan is worked out when it is created, so the forecast can be previewed, and only changes the database
+    # when it is applied
+    def __init__(self, db, user_id, days, deck_id=None):
+        self.db = db
+        self.user_id = user_id
+        now = datetime.now()
+        now_str = now.strftime("%Y-%m-%d %H:%M:%S")
+        rows = db.get_backlog(user_id, now.strftime("%Y-%m-%d 00:00:00"), deck_id)
+        self.sr_ids = [row[0] for row in rows]
+        # columns are the due time and interval (both in seconds) and ef
+        values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(-1, 3)
+        due, interval, ef = values.T
+        now_seconds = np.datetime64(now_str, "s").astype(np.int64)
+        overdue_ratio = (now_seconds - due) / np.maximum(interval, 60)
+        urgency = np.log1p(overdue_ratio) / (np.maximum(ef, 1.3) - 1.0)
+
+        # the forecast counts overdue cards as due today, so they are taken off today to get the other cards' load
+        forecast = db.get_due_forecast(user_id, days=days, deck_id=deck_id)
+        self.dates = [date for date, _ in forecast]
+        self.before = [count for _, count in forecast]
+        load = np.array(self.before, dtype=np.int64)
+        load[0] -= len(rows)
+        day = spread_days(load, urgency)
+        self.after = (load + np.bincount(day, minlength=days)).tolist()
+
+        # moved cards are due at the start of their new day, and their interval grows by as much as they were moved,
+        # so the time since their last review is still worked out correctly when they are next answered
+        moved = day > 0
+        self.changes = []
+        if moved.any():
+            start = np.datetime64(now.date()).astype("datetime64[s]").astype(np.int64)
+            new_due = start + day[moved] * 86400
+            due_strings = np.char.replace(np.datetime_as_string(new_due.astype("datetime64[s]")), "T", " ")
+            added_minutes = (new_due - due[moved].astype(np.int64)) // 60
+            self.changes = list(zip(
+                due_strings.tolist(),
+                added_minutes.tolist(),
+                np.asarray(self.sr_ids, dtype=np.int64)[moved].tolist()
+            ))
+
+    # the number of overdue cards, and how many of them the plan moves to a later day
+    def overdue_count(self):
+        return len(self.sr_ids)
+
+    def moved_count(self):
+        return len(self.changes)
+
+    # writes the new due dates to the database, returning the number of cards moved
+    def apply(self):
+        return self.db.move_due_dates(self.changes)
@@ -0,0 +1,90 @@
+# external imports
+import random
+import sys
+import time
+
+# my imports
+from misc import MiscFunctions
+from ordering import sort_by_ef, top_k, PriorityOrder
+
+
+# the original merge sort from misc.py, kept here so the new versions can be compared against it
+# it slices lists at every level of recursion and builds its output with list.pop(0)
+def old_split(cards):
+    if len(cards) <= 1:
+        return cards
+    mid = len(cards) // 2
+    left = old_split(cards[:mid])
+    right = old_split(cards[mid:])
+    return old_merge_sort(left, right)
+
+
+def old_merge_sort(left, right):
+    result = []
+    while left and right:
+        if left[0][-1] < right[0][-1]:
+            result.append(left.pop(0))
+        else:
+            result.append(right.pop(0))
+    if left:
+        result.extend(left)
+    else:
+        result.extend(right)
+    return result
+
+
+# makes a list of fake cards as (card_id, question, answer, ef) tuples
+# ef is rounded to 2 decimal places so lots of cards share the same ef, like real decks do
+def make_cards(count):
+    cards = []
+    for card_id in range(count):
+        ef = round(random.uniform(1.3, 3.5), 2)
+        cards.append((card_id, f"Question {card_id}", f"Answer {card_id}", ef))
+    return cards
+
+
+# runs a function a few times and returns the fastest time in milliseconds
+def time_it(function, repeats=3):
+    best = None
+    for x in range(repeats):
+        start = time.perf_counter()
+        function()
+        taken = (time.perf_counter() - start) * 1000
+        if best is None or taken < best:
+            best = taken
+    return best
+
+
+def benchmark_ordering(sizes):
+    print(f"{'cards':>8} {'old split':>12} {'new split':>12} {'sort_by_ef':>12} {'top 25':>12} {'re-rank 1':>12}")
+    for size in sizes:
+        cards = make_cards(size)
+
+        # the old version is only timed once at large sizes, as it takes a long time
+        old_time = time_it(lambda: old_split(list(cards)), repeats=1 if size > 10000 else 3)
+        new_time = time_it(lambda: MiscFunctions.split(cards))
+        builtin_time = time_it(lambda: sort_by_ef(cards))
+        top_time = time_it(lambda: top_k(cards, 25))
+
+        # re-ranking times how long it takes to move one card after its ef changes
+        order = PriorityOrder(cards)
+        changed = random.choice(cards)
+        rerank_time = time_it(lambda: order.update((changed[0], changed[1], changed[2], random.uniform(1.3, 3.5))))
+
+        # checks the new sort and top k give the same order as the built in sort (all are stable)
+        expected = sort_by_ef(cards)
+        assert MiscFunctions.split(cards) == expected
+        assert top_k(cards, 25) == expected[:25]
+
+        print(f"{size:>8} {old_time:>10.1f}ms {new_time:>10.1f}ms {builtin_time:>10.1f}ms {top_time:>10.1f}ms {rerank_time:>10.3f}ms")
+
+
+# run with "python benchmark.py" to compare the card ordering functions at 1k, 10k and 100k cards
+# extra sizes can be passed in, e.g. "python benchmark.py 1000 50000"
+if __name__ == "__main__":
+    random.seed(0)
+    if len(sys.argv) > 1:
+        sizes = [int(size) for size in sys.argv[1:]]
+    else:
+        sizes = [1000, 10000, 100000]
+    benchmark_ordering(sizes)
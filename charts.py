@@ -0,0 +1,213 @@
+# external imports
+import customtkinter as ctk
+from datetime import date, timedelta
+import numpy as np
+
+
+# downsamples a series to threshold points with largest triangle three buckets (lttb)
+# the points between the first and last are split into buckets, and from each bucket the point that makes the largest
+# triangle with the previously chosen point and the average of the next bucket is kept,
+# so peaks and dips stay visible, unlike taking every nth point or averaging
+def lttb(xs, ys, threshold):
+    count = len(xs)
+    if threshold >= count or threshold < 3:
+        return xs, ys
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+    selected = [0]
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = edges[bucket]
+        end = edges[bucket + 1]
+        # the average of the next bucket, or the last point for the last bucket
+        if bucket + 2 < len(edges):
+            next_x = xs[end:edges[bucket + 2]].mean()
+            next_y = ys[end:edges[bucket + 2]].mean()
+        else:
+            next_x = xs[-1]
+            next_y = ys[-1]
+        # twice the area of the triangle for every point in this bucket at once
+        areas = np.abs(
+            (xs[previous] - next_x) * (ys[start:end] - ys[previous])
+            - (xs[previous] - xs[start:end]) * (next_y - ys[previous])
+        )
+        previous = start + int(areas.argmax())
+        selected.append(previous)
+    selected.append(count - 1)
+    return xs[selected], ys[selected]
+
+
+class TimeSeries:
+    # a daily series for a line chart, days are date ordinals (date.toordinal()) and values are floats
+    # downsampled copies are cached by width, so redrawing at the same size (or visiting the page again while
+    # the analytics snapshot is cached) doesn't downsample again
+    def __init__(self, days, values):
+        self.days = np.asarray(days, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.downsampled = {}
+
+    def __len__(self):
+        return len(self.days)
+
+    # returns the series with at most one point per pixel
+    def for_width(self, width):
+        if width not in self.downsampled:
+            self.downsampled[width] = lttb(self.days, self.values, max(width, 3))
+        return self.downsampled[width]
+
+
+# builds a daily series from (date, value) pairs, with fill (e.g. 0) for days that have no value
+# if fill is None, days without a value are left out, e.g. accuracy can't be worked out on days without quizzes
+def daily_series(rows, fill=None):
+    if not rows:
+        return TimeSeries([], [])
+    days = np.array([day.toordinal() for day, _ in rows], dtype=np.int64)
+    values = np.array([value for _, value in rows], dtype=np.float64)
+    if fill is None:
+        return TimeSeries(days, values)
+    first = days.min()
+    filled = np.full(days.max() - first + 1, float(fill))
+    filled[days - first] = values
+    return TimeSeries(np.arange(first, days.max() + 1), filled)
+
+
+class LineChart:
+    # a line chart of a TimeSeries drawn on a canvas that fills the width of its parent
+    # the line and labels are created once and moved with canvas.coords when the canvas is resized,
+    # rather than deleting and redrawing everything
+    def __init__(self, parent, series, colour="#3B82F6", value_format="{:.0f}", height=180):
+        self.series = series
+        self.colour = colour
+        self.value_format = value_format
+        self.height = height
+        self.width = None
+        self.items = {}
+        self.canvas = ctk.CTkCanvas(parent, height=height, bg="white", highlightthickness=0)
+        self.canvas.pack(fill="x", padx=20, pady=(0, 10))
+        self.canvas.bind("<Configure>", self.on_resize)
+
+    def on_resize(self, event):
+        if event.width != self.width:
+            self.render(event.width)
+
+    def render(self, width):
+        self.width = width
+        left = 45
+        right = 10
+        top = 10
+        bottom = 25
+        plot_width = max(width - left - right, 3)
+        plot_height = self.height - top - bottom
+
+        if len(self.series) == 0:
+            if "empty" not in self.items:
+                self.items["empty"] = self.canvas.create_text(0, 0, text="No data yet", font=("Inter", 12), fill="#6B7280")
+            self.canvas.coords(self.items["empty"], width / 2, self.height / 2)
+            return
+
+        xs, ys = self.series.for_width(int(plot_width))
+        low = min(0.0, float(ys.min()))
+        high = float(ys.max())
+        if high == low:
+            high = low + 1
+        first_day = self.series.days[0]
+        day_span = max(self.series.days[-1] - first_day, 1)
+        px = left + (xs - first_day) / day_span * plot_width
+        py = top + plot_height - (ys - low) / (high - low) * plot_height
+
+        # the axes and labels are created the first time and then only moved or relabelled
+        if "x_axis" not in self.items:
+            self.items["x_axis"] = self.canvas.create_line(0, 0, 0, 0, fill="#E5E7EB")
+            self.items["y_axis"] = self.canvas.create_line(0, 0, 0, 0, fill="#E5E7EB")
+            label_style = {"font": ("Inter", 8), "fill": "#6B7280"}
+            self.items["high"] = self.canvas.create_text(0, 0, anchor="e", **label_style)
+            self.items["low"] = self.canvas.create_text(0, 0, anchor="e", **label_style)
+            self.items["start"] = self.canvas.create_text(0, 0, anchor="nw", **label_style)
+            self.items["end"] = self.canvas.create_text(0, 0, anchor="ne", **label_style)
+        self.canvas.coords(self.items["x_axis"], left, top + plot_height, left + plot_width, top + plot_height)
+        self.canvas.coords(self.items["y_axis"], left, top, left, top + plot_height)
+        self.canvas.coords(self.items["high"], left - 5, top)
+        self.canvas.coords(self.items["low"], left - 5, top + plot_height)
+        self.canvas.coords(self.items["start"], left, top + plot_height + 5)
+        self.canvas.coords(self.items["end"], left + plot_width, top + plot_height + 5)
+        self.canvas.itemconfigure(self.items["high"], text=self.value_format.format(high))
+        self.canvas.itemconfigure(self.items["low"], text=self.value_format.format(low))
+        self.canvas.itemconfigure(self.items["start"], text=date.fromordinal(int(first_day)).strftime("%d %b %Y"))
+        self.canvas.itemconfigure(self.items["end"], text=date.fromordinal(int(self.series.days[-1])).strftime("%d %b %Y"))
+
+        # a single point is drawn as a dot, as a line needs at least two points
+        if len(xs) == 1:
+            if "dot" not in self.items:
+                self.items["dot"] = self.canvas.create_oval(0, 0, 0, 0, fill=self.colour, outline="")
+            self.canvas.coords(self.items["dot"], px[0] - 3, py[0] - 3, px[0] + 3, py[0] + 3)
+            return
+        coords = np.column_stack([px, py]).ravel().tolist()
+        if "line" not in self.items:
+            self.items["line"] = self.canvas.create_line(*coords, fill=self.colour, width=2)
+        else:
+            self.canvas.coords(self.items["line"], *coords)
+
+
+# draws a calendar heatmap with one square per day (one column per week, monday at the top)
+# where darker squares are days with more reviews
+def draw_heatmap(parent, start_date, counts):
+    cell = 12
+    gap = 2
+    left = 30
+    top = 18
+    weeks = (start_date.weekday() + len(counts) + 6) // 7
+    canvas = ctk.CTkCanvas(parent, width=left + weeks * (cell + gap), height=top + 7 * (cell + gap), bg="white", highlightthickness=0)
+    canvas.pack(anchor="w", padx=20)
+
+    # colours go from light grey (no reviews) to dark green, split at a quarter, half and three quarters of the busiest day
+    colours = ["#F3F4F6", "#BBF7D0", "#4ADE80", "#16A34A", "#14532D"]
+    busiest = max(counts) or 1
+    for day_label, row in (("Mon", 0), ("Wed", 2), ("Fri", 4)):
+        canvas.create_text(0, top + row * (cell + gap) + cell / 2, text=day_label, anchor="w", font=("Inter", 8), fill="#6B7280")
+
+    for index, count in enumerate(counts):
+        day = start_date + timedelta(days=index)
+        position = start_date.weekday() + index
+        column = position // 7
+        row = position % 7
+        x = left + column * (cell + gap)
+        y = top + row * (cell + gap)
+        level = 0 if count == 0 else min(4, 1 + int(4 * count / (busiest + 1)))
+        canvas.create_rectangle(x, y, x + cell, y + cell, fill=colours[level], outline="")
+        # month labels above the first week of each month
+        if day.day == 1:
+            canvas.create_text(x, 0, text=day.strftime("%b"), anchor="nw", font=("Inter", 8), fill="#6B7280")
+    return canvas
+
+
+# draws a bar chart of percentages, bars is a list of (label, percentage or None, number of reviews)
+# bars with no reviews are drawn as an empty outline
+def draw_bar_chart(parent, bars):
+    width = 760
+    height = 150
+    bottom = 20
+    top = 15
+    slot = width / len(bars)
+    bar_width = min(40, slot * 0.7)
+    canvas = ctk.CTkCanvas(parent, width=width, height=height, bg="white", highlightthickness=0)
+    canvas.pack(anchor="w", padx=20)
+    canvas.create_line(0, height - bottom, width, height - bottom, fill="#E5E7EB")
+
+    for index, (label, percentage, total) in enumerate(bars):
+        centre = slot * index + slot / 2
+        x0 = centre - bar_width / 2
+        x1 = centre + bar_width / 2
+        canvas.create_text(centre, height - bottom / 2, text=label, font=("Inter", 8), fill="#6B7280")
+        if percentage is None:
+            canvas.create_rectangle(x0, height - bottom - 2, x1, height - bottom, outline="#E5E7EB")
+            continue
+        bar_top = height - bottom - (height - bottom - top) * percentage / 100
+        # same colours as the deck performance scores
+        if percentage < 50:
+            colour = "#DC2626"
+        elif percentage < 80:
+            colour = "#F59E0B"
+        else:
+            colour = "#10B981"
+        canvas.create_rectangle(x0, bar_top, x1, height - bottom, fill=colour, outline="")
+        canvas.create_text(centre, bar_top - 7, text=f"{percentage:.0f}%", font=("Inter", 8), fill="#111827")
+    return canvas
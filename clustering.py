@@ -0,0 +1,195 @@
+# external imports
+import sqlite3
+from datetime import datetime
+import numpy as np
+
+# my imports
+from background import report_progress
+from retention import local_timestamp
+
+# the number of difficulty groups cards are put into
+CLUSTER_COUNT = 5
+# cards used in each step of mini-batch k-means, and the number of steps in a full run
+BATCH_SIZE = 1024
+ITERATIONS = 150
+# cards used to pick the starting centres (k-means++), so picking them doesn't take a pass over every card per centre
+SEED_SAMPLE = 4096
+
+# what a group's centre being well above or below average on each feature says about its cards,
+# in the order of the columns made by features: ef, lapses, median answer time and days since the last review
+FEATURE_NAMES = (
+    ("easy", "hard to remember"),
+    ("often forgotten", "rarely forgotten"),
+    ("slow to answer", "quick to answer"),
+    ("not seen lately", "seen recently")
+)
+# how far (in standard deviations) a centre has to be from average for a feature to be used in its name
+NAME_THRESHOLD = 0.5
+
+
+# turns card values into feature rows: ef, and the logs of lapses, median seconds taken to answer and days since the
+# last review, as counts and times are skewed (a few cards have many lapses or very long answer times)
+def features(ef, lapses, median_time, days_since):
+    return np.column_stack((
+        np.asarray(ef, dtype=np.float64),
+        np.log1p(np.asarray(lapses, dtype=np.float64)),
+        np.log1p(np.maximum(np.asarray(median_time, dtype=np.float64), 0)),
+        np.log1p(np.maximum(np.asarray(days_since, dtype=np.float64), 0))
+    ))
+
+
+# returns each card's median answer time from (card_id, time_taken) arrays sorted by card_id, as (card_ids, medians)
+def median_times(cards, times):
+    if len(cards) == 0:
+        return cards, times
+    order = np.lexsort((times, cards))
+    cards, times = cards[order], times[order]
+    starts = np.flatnonzero(np.r_[True, cards[1:] != cards[:-1]])
+    counts = np.diff(np.append(starts, len(cards)))
+    # the middle answer time, or the average of the two middle ones for cards with an even number of answers
+    medians = (times[starts + (counts - 1) // 2] + times[starts + counts // 2]) / 2
+    return cards[starts], medians
+
+
+# loads the features of each card the user has reviewed (apart from suspended cards), as (card_ids, feature rows)
+# the last review time comes from the due date and interval (like Database.reschedule_deck), and the answer times from
+# the review log, read in card order from the idx_review_log_user_card index; cards reviewed before there was a
+# review log use the time taken at their last review
+def load_features(conn, user_id, now=None):
+    now_seconds = local_timestamp(now or datetime.now())
+    rows = conn.execute("""
+        SELECT card_id, ef, lapses, time_taken,
+               CAST(strftime('%s', next_review_date) AS INTEGER) - interval * 60
+        FROM spaced_rep
+        WHERE user_id = ? AND suspended = 0 AND next_review_date IS NOT NULL
+        ORDER BY card_id
+    """, (user_id,)).fetchall()
+    values = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    card_ids = values[:, 0].astype(np.int64)
+    answers = np.array(conn.execute(
+        "SELECT card_id, time_taken FROM review_log WHERE user_id = ? ORDER BY card_id", (user_id,)
+    ).fetchall(), dtype=np.float64).reshape(-1, 2)
+    logged_cards, medians = median_times(answers[:, 0].astype(np.int64), answers[:, 1])
+    median_time = values[:, 3].copy()
+    position = np.searchsorted(logged_cards, card_ids)
+    found = position < len(logged_cards)
+    found[found] = logged_cards[position[found]] == card_ids[found]
+    median_time[found] = medians[position[found]]
+    days_since = (now_seconds - values[:, 4]) / 86400
+    return card_ids, features(values[:, 1], values[:, 2], median_time, days_since)
+
+
+# squared distance from every point to every centre, as a (points, centres) array
+def distances(points, centroids):
+    return (
+        (points ** 2).sum(axis=1)[:, None] - 2 * points @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+    )
+
+
+# picks k starting centres from the points with k-means++: each centre is picked with a chance proportional to
+# its squared distance from the closest centre already picked, so the centres start spread out
+def seed_centroids(points, k, rng):
+    centroids = [points[rng.integers(len(points))]]
+    closest = ((points - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = closest.sum()
+        chosen = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centroids.append(points[chosen])
+        closest = np.minimum(closest, ((points - points[chosen]) ** 2).sum(axis=1))
+    return np.array(centroids)
+
+
+# mini-batch k-means: each step assigns a random batch of points to their nearest centres and moves each centre
+# towards the average of its batch points, by a share that gets smaller the more points it has been given
+# (its count), so the centres settle down without every step reading every point
+# returns the centres and their counts
+def mini_batch_kmeans(points, k, rng, iterations=ITERATIONS, batch_size=BATCH_SIZE):
+    sample = points[rng.choice(len(points), min(len(points), SEED_SAMPLE), replace=False)]
+    centroids = seed_centroids(sample, k, rng)
+    counts = np.zeros(k)
+    for step in range(1, iterations + 1):
+        batch = points[rng.integers(len(points), size=batch_size)]
+        nearest = distances(batch, centroids).argmin(axis=1)
+        batch_counts = np.bincount(nearest, minlength=k)
+        sums = np.column_stack([np.bincount(nearest, weights=column, minlength=k) for column in batch.T])
+        counts += batch_counts
+        moved = batch_counts > 0
+        centroids[moved] += (sums[moved] - batch_counts[moved, None] * centroids[moved]) / counts[moved, None]
+        if step % 30 == 0:
+            report_progress(step / iterations)
+    return centroids, counts
+
+
+# a name for each group from the features its centre is furthest from average on, e.g. "often forgotten, slow to answer"
+def name_cluster(centroid):
+    order = np.argsort(-np.abs(centroid))
+    names = [
+        FEATURE_NAMES[feature][0 if centroid[feature] > 0 else 1]
+        for feature in order[:2] if abs(centroid[feature]) >= NAME_THRESHOLD
+    ]
+    return ", ".join(names) if names else "average"
+
+
+class DifficultyClusters:
+    # the difficulty groups found for a user's cards, which are kept up to date between full runs of cluster_user:
+    # when a card is answered it is put in the group with the nearest centre and that centre is moved towards it
+    # the same way as in a mini-batch k-means step (a batch of one card)
+    # centres are in standardised units (each feature minus its mean, over its standard deviation, from the full run),
+    # so every feature counts the same in the distances, and group 0 is the hardest (lowest ef, most lapses and
+    # slowest answers) with the groups getting easier from there
+    def __init__(self, model):
+        self.mean = np.array(model["mean"])
+        self.std = np.array(model["std"])
+        self.centroids = np.array(model["centroids"])
+        self.counts = np.array(model["counts"], dtype=np.float64)
+        self.names = list(model["names"])
+
+    # puts a card that has just been answered in a group and moves the group's centre towards it,
+    # returning the group number
+    def add_card(self, ef, lapses, median_time, days_since=0.0):
+        point = (features([ef], [lapses], [median_time], [days_since])[0] - self.mean) / self.std
+        cluster = int(distances(point[None, :], self.centroids)[0].argmin())
+        self.counts[cluster] += 1
+        self.centroids[cluster] += (point - self.centroids[cluster]) / self.counts[cluster]
+        return cluster
+
+    def to_model(self):
+        return {
+            "mean": self.mean.tolist(),
+            "std": self.std.tolist(),
+            "centroids": self.centroids.tolist(),
+            "counts": self.counts.tolist(),
+            "names": self.names
+        }
+
+
+# groups a user's reviewed cards by difficulty, run in a worker process by background.run_in_process
+# returns the model (see DifficultyClusters) and a list of (group, card_id) pairs for every card, or None if the user
+# has fewer reviewed cards than groups
+def cluster_user(db_name, user_id, seed=None):
+    conn = sqlite3.connect(db_name)
+    try:
+        card_ids, points = load_features(conn, user_id)
+    finally:
+        conn.close()
+    if len(card_ids) < CLUSTER_COUNT:
+        return None
+    mean = points.mean(axis=0)
+    std = points.std(axis=0)
+    std[std == 0] = 1.0
+    points = (points - mean) / std
+    centroids, counts = mini_batch_kmeans(points, CLUSTER_COUNT, np.random.default_rng(seed))
+
+    # the groups are numbered from hardest to easiest, and every card is put in its nearest group
+    hardness = -centroids[:, 0] + centroids[:, 1] + centroids[:, 2]
+    order = np.argsort(-hardness)
+    centroids, counts = centroids[order], counts[order]
+    clusters = distances(points, centroids).argmin(axis=1)
+    model = {
+        "mean": mean.tolist(),
+        "std": std.tolist(),
+        "centroids": centroids.tolist(),
+        "counts": counts.tolist(),
+        "names": [name_cluster(centroid) for centroid in centroids]
+    }
+    return model, list(zip(clusters.tolist(), card_ids.tolist()))
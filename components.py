@@ -90,6 +90,16 @@ class BasePage(ctk.CTkFrame):
         self.main_header_content = ctk.CTkFrame(self, fg_color="white")
         self.main_header_content.pack(side="right", fill="both", expand=True)
 
+        # ctrl+k opens the quick jump palette from any page (binding it again on each page replaces the old binding)
+        self.master.bind("<Control-k>", lambda e: self.open_command_palette())
+
+    # opens the quick jump palette, which is imported lazily to avoid circular imports (same as in sidebar.py)
+    def open_command_palette(self):
+        # the binding can outlive the page (e.g. during a quiz session), so do nothing if this page is gone
+        if not self.winfo_exists():
+            return
+        __import__('app').CommandPalette(self, db=self.db)
+
 class BaseContainer(ctk.CTkFrame):
     # initialises the base container as a subclass of CTkFrame (inheritance)
     # initialises base container with corner radius, border width, border colour, foreground colour
@@ -1,9 +1,26 @@
 # external imports
+import json
 import sqlite3
 from datetime import datetime, timedelta
+import numpy as np
 
 # my imports
 from misc import MiscFunctions
+from search import SearchIndex
+from graph import DeckIndex, top_down
+from ordering import PriorityOrder, top_k
+from sketch import TDigest
+from retention import EPOCH, RetentionEngine, local_timestamp
+from scheduler import SCHEDULERS, DueHistogram
+from watcher import DueWatcher
+from clustering import DifficultyClusters
+from tags import TagIndex, ids_from_bitset
+
+# a card becomes a leech when it has lapsed this many times, or been failed this many times in a row
+DEFAULT_LEECH_THRESHOLD = 8
+# days before a user's difficulty groups are worked out again from scratch (see clustering.py),
+# in between cards are moved between groups as they are answered
+CLUSTER_REFRESH_DAYS = 1
 
 class Database:
     # initialises the database class, establishes connection and cursor, and creates tables
@@ -11,6 +28,38 @@ class Database:
         self.db_name = "database.db"
         self.conn = sqlite3.connect(self.db_name)
         self.cursor = self.conn.cursor()
+        # search index for the logged in user, used by the quick jump (command palette), built at login
+        self.search_index = None
+        # due watcher for the logged in user, which updates due count badges as cards become due, started at login
+        self.due_watcher = None
+        # ordered deck indexes (AVL trees) for each user, kept up to date as decks, cards and ef values change
+        self.deck_indexes = {}
+        # the cards of each deck in priority order (see ordering.py), keyed by (user_id, deck_id)
+        # built when a cards page needs more than its first page, then re-ranked one card at a time as cards are rated
+        self.card_orders = {}
+        # change_counter goes up every time decks, cards, quiz results or spaced repetition data change,
+        # so cached results (like analytics snapshots) can tell if they are out of date
+        self.change_counter = 0
+        self.analytics_cache = {}
+        # answer time digests loaded from the database, keyed by (user_id, deck_id)
+        self.time_sketches = {}
+        # retention engines for each user, which keep their counts between visits to the analytics page
+        self.retention_engines = {}
+        # due forecasts for each user (see get_due_forecast), cached until a review or other change, or until a card becomes due
+        self.due_forecasts = {}
+        # scheduler objects (see scheduler.py), keyed by (scheduler name, user_id) as each user can have fitted params
+        self.schedulers = {}
+        # the number of cards due on each day for each user (see get_due_histogram), used to even out due dates
+        self.due_histograms = {}
+        # each user's (leech threshold, leech action), see get_leech_settings
+        self.leech_settings = {}
+        # each user's difficulty groups (see clustering.py), or None if they haven't been worked out yet
+        self.difficulty_clusters = {}
+        # users whose cards are being grouped in a worker process, so a second run isn't started at the same time
+        self.clustering_users = set()
+        # each user's tag index (see tags.py), and the bitset of the cards in the tag_filter temp table (see tag_condition)
+        self.tag_indexes = {}
+        self.tag_filter_bits = None
         self.create()
 
     # creates the database tables
@@ -74,8 +123,135 @@ class Database:
             FOREIGN KEY (card_id) REFERENCES cards(card_id)
         )
         """)
+        # answer time sketches table, one t-digest of answer times per user and deck (see sketch.py)
+        # rows are kept when a deck is deleted, like quiz results, so the user's overall answer times include them
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS answer_time_sketches (
+            user_id INTEGER NOT NULL,
+            deck_id INTEGER NOT NULL,
+            digest BLOB NOT NULL,
+            PRIMARY KEY (user_id, deck_id)
+        )
+        """)
+        # review log table, one row for every time a card is rated (spaced_rep only keeps the latest review of each card)
+        # reviewed_at is seconds since 1970 in local time (see retention.py) and elapsed is the number of seconds
+        # since the card's previous review, which is NULL for its first review
+        # rows are kept when cards or decks are deleted so the user's history doesn't change
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS review_log (
+            review_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            card_id INTEGER NOT NULL,
+            deck_id INTEGER NOT NULL,
+            reviewed_at INTEGER NOT NULL,
+            elapsed INTEGER,
+            quality INTEGER NOT NULL,
+            time_taken FLOAT DEFAULT 0.0,
+            is_correct BOOLEAN,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+        """)
+        # indexes used by the card and deck listings, so filtering a deck and joining spaced_rep
+        # reads only the rows needed instead of scanning the whole tables
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_cards_deck ON cards (deck_id, card_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_decks_user ON decks (user_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_spaced_rep_user_card ON spaced_rep (user_id, card_id, ef)")
+        # due index, used to find a user's cards due before a date without scanning all their spaced repetition rows
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_spaced_rep_user_due ON spaced_rep (user_id, next_review_date, card_id)")
+        # review log indexes for loading a user's reviews in order and finding a card's latest review
+        # (sqlite adds the review_id to the end of each index, so both are ordered by review_id)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_log_user ON review_log (user_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_log_user_card ON review_log (user_id, card_id)")
+        # partial index of the reviews that haven't been marked correct or incorrect yet, used by RetentionEngine.refresh
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_review_log_unmarked ON review_log (user_id, reviewed_at) WHERE is_correct IS NULL")
+        # scheduler fits table, the model fitted to each user's reviews by optimizer.py, stored as json
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_fits (
+            user_id INTEGER PRIMARY KEY,
+            fit TEXT NOT NULL,
+            fitted_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+        """)
+        # deck tree table, a closure table of the deck hierarchy (subdecks): a row for every deck and each of its
+        # ancestors, and one for the deck itself with a depth of 0, so a deck's whole subtree (or all its ancestors)
+        # is found with one indexed lookup rather than following parent_id one level at a time
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS deck_tree (
+            ancestor_id INTEGER NOT NULL,
+            descendant_id INTEGER NOT NULL,
+            depth INTEGER NOT NULL,
+            PRIMARY KEY (ancestor_id, descendant_id)
+        ) WITHOUT ROWID
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_deck_tree_descendant ON deck_tree (descendant_id, depth)")
+        # tags table, each user's tag names, and card tags table, which cards have which tags
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tags (
+            tag_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            UNIQUE (user_id, name),
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+        """)
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS card_tags (
+            card_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            PRIMARY KEY (card_id, tag_id),
+            FOREIGN KEY (card_id) REFERENCES cards(card_id),
+            FOREIGN KEY (tag_id) REFERENCES tags(tag_id)
+        ) WITHOUT ROWID
+        """)
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_card_tags_tag ON card_tags (tag_id, card_id)")
+        # the cards matching the current tag query (or not matching, for queries like "not easy"), which queries
+        # filtering by tags join against, kept only for this connection
+        self.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS tag_filter (card_id INTEGER PRIMARY KEY)")
+        # difficulty clusters table, the groups each user's cards were put in by clustering.py, stored as json
+        # (each card's group is kept in spaced_rep.cluster)
+        self.cursor.execute("""
+        CREATE TABLE IF NOT EXISTS difficulty_clusters (
+            user_id INTEGER PRIMARY KEY,
+            model TEXT NOT NULL,
+            clustered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+        """)
+        # columns added after the tables were first made, which older databases don't have yet
+        # the scheduler each deck uses (see scheduler.py), and each card's stability, which only the fsrs scheduler uses
+        self.add_column("decks", "scheduler", "TEXT NOT NULL DEFAULT 'sm2'")
+        self.add_column("spaced_rep", "stability", "FLOAT")
+        # leech detection: each card's number of lapses (failed after it had been remembered) and failures in a row,
+        # kept up to date by update_spaced_rep, whether it is a leech and whether it is suspended (left out of quizzes),
+        # and each user's leech threshold and what happens to a card when it becomes a leech ("tag" or "suspend")
+        self.add_column("spaced_rep", "lapses", "INTEGER NOT NULL DEFAULT 0")
+        self.add_column("spaced_rep", "failure_streak", "INTEGER NOT NULL DEFAULT 0")
+        self.add_column("spaced_rep", "leech", "INTEGER NOT NULL DEFAULT 0")
+        self.add_column("spaced_rep", "suspended", "INTEGER NOT NULL DEFAULT 0")
+        self.add_column("users", "leech_threshold", f"INTEGER NOT NULL DEFAULT {DEFAULT_LEECH_THRESHOLD}")
+        self.add_column("users", "leech_action", "TEXT NOT NULL DEFAULT 'tag'")
+        # each card's difficulty group (see clustering.py), NULL until the user's cards have been grouped
+        self.add_column("spaced_rep", "cluster", "INTEGER")
+        # each deck's parent deck, NULL for top level decks (the deck_tree table has the full hierarchy)
+        self.add_column("decks", "parent_id", "INTEGER REFERENCES decks(deck_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_decks_parent ON decks (user_id, parent_id)")
+        # decks made before there were subdecks only need their own row in the deck tree
+        self.cursor.execute("""
+            INSERT OR IGNORE INTO deck_tree (ancestor_id, descendant_id, depth) SELECT deck_id, deck_id, 0 FROM decks
+        """)
+        # partial indexes of just the leeches and suspended cards, which are few, so listing a user's leeches
+        # or leaving out their suspended cards doesn't read every card or the review history
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_spaced_rep_leeches ON spaced_rep (user_id, lapses) WHERE leech = 1")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_spaced_rep_suspended ON spaced_rep (user_id, card_id) WHERE suspended = 1")
         self.conn.commit()
 
+    # adds a column to a table if it doesn't have it yet
+    def add_column(self, table, column, definition):
+        self.cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in self.cursor.fetchall()]:
+            self.cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
     # verifies login credentials and returns user_id if successful, else None
     def verify_login(self, username, password):
         try:
@@ -151,24 +327,84 @@ class Database:
         try:
             self.cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
             self.conn.commit()
+            for key in [key for key in self.card_orders if key[0] == user_id]:
+                del self.card_orders[key]
             return self.cursor.rowcount > 0
         except Exception as e:
             print(f"Error deleting user: {e}")
             return False
 
+    # starts the background work a logged in user needs (called after both login and signup)
+    # the search index for the quick jump palette, and the due watcher that updates the due count badges
+    def start_user_session(self, root, user_id):
+        self.start_search_index(user_id)
+        self.start_due_watcher(root, user_id)
+
+    # starts building the search index for a user on a background thread (called when the user logs in)
+    def start_search_index(self, user_id):
+        self.search_index = SearchIndex(user_id)
+        self.search_index.build_in_background(self.db_name)
+        return self.search_index
+
+    # starts watching for the user's cards becoming due (called when the user logs in), using root's timer
+    def start_due_watcher(self, root, user_id):
+        self.stop_due_watcher()
+        self.due_watcher = DueWatcher(root, self, user_id)
+        return self.due_watcher
+
+    def stop_due_watcher(self):
+        if self.due_watcher is not None:
+            self.due_watcher.stop()
+            self.due_watcher = None
+
+    # records that data used by cached results has changed
+    # due dates may have changed too (a card rated, rescheduled, suspended, added or deleted), so the due watcher
+    # checks its timer again, as the next card to become due may now be sooner
+    def record_change(self):
+        self.change_counter += 1
+        if self.due_watcher is not None:
+            self.due_watcher.refresh()
+
+    # returns the cached analytics snapshot for a user, or None if there isn't one or data has changed since it was built
+    def get_analytics_snapshot(self, user_id):
+        cached = self.analytics_cache.get(user_id)
+        if cached and cached[0] == self.change_counter:
+            return cached[1]
+        return None
+
+    # caches an analytics snapshot, version is the change counter from when the snapshot started being built
+    def save_analytics_snapshot(self, user_id, version, snapshot):
+        self.analytics_cache[user_id] = (version, snapshot)
+
     # returns a list of decks (deck_id, deck_name) for the given user
     def get_decks(self, user_id):
         self.cursor.execute("SELECT deck_id, deck_name FROM decks WHERE user_id = ?", (user_id,))
         return self.cursor.fetchall()
 
-    # creates a new deck for the user and returns the new deck_id
-    def create_deck(self, user_id, deck_name):
+    # creates a new deck for the user, as a subdeck of parent_id if it is given, and returns the new deck_id
+    # the deck's deck tree rows are its own row and a copy of each of its parent's ancestor rows one level deeper
+    def create_deck(self, user_id, deck_name, parent_id=None):
         self.cursor.execute(
-            "INSERT INTO decks (user_id, deck_name) VALUES (?, ?)",
-            (user_id, deck_name)
+            "INSERT INTO decks (user_id, deck_name, parent_id) VALUES (?, ?, ?)",
+            (user_id, deck_name, parent_id)
         )
+        deck_id = self.cursor.lastrowid
+        self.cursor.execute(
+            "INSERT INTO deck_tree (ancestor_id, descendant_id, depth) VALUES (?, ?, 0)", (deck_id, deck_id)
+        )
+        if parent_id is not None:
+            self.cursor.execute("""
+                INSERT INTO deck_tree (ancestor_id, descendant_id, depth)
+                SELECT ancestor_id, ?, depth + 1 FROM deck_tree WHERE descendant_id = ?
+            """, (deck_id, parent_id))
         self.conn.commit()
-        return self.cursor.lastrowid
+        self.record_change()
+        if self.search_index:
+            self.search_index.add_deck(deck_id, deck_name)
+        # new decks have no cards, so start with the default ef of 2.5
+        if user_id in self.deck_indexes:
+            self.deck_indexes[user_id].insert(deck_id, deck_name, 2.5, 0)
+        return deck_id
 
     # updates the deck name for a given deck_id
     def update_deck_name(self, deck_id, new_name):
@@ -177,16 +413,54 @@ class Database:
             (new_name, deck_id)
         )
         self.conn.commit()
+        self.record_change()
+        if self.search_index:
+            self.search_index.add_deck(deck_id, new_name)
+        # the name isn't part of the ordering key, so the node can just be renamed
+        for index in self.deck_indexes.values():
+            node = index.get(deck_id)
+            if node:
+                node.deck_name = new_name
 
-    # deletes a deck and its cards
+    # deletes a deck, the cards' rows are left in the cards table but their tags are removed,
+    # so they no longer show up in tag counts or suggestions
+    # its subdecks are kept and move up a level, to the deleted deck's parent
     def delete_deck(self, deck_id):
+        self.cursor.execute("SELECT card_id FROM cards WHERE deck_id = ?", (deck_id,))
+        card_ids = [row[0] for row in self.cursor.fetchall()]
+        self.cursor.execute(
+            "DELETE FROM card_tags WHERE card_id IN (SELECT card_id FROM cards WHERE deck_id = ?)",
+            (deck_id,)
+        )
+        self.cursor.execute("""
+            UPDATE deck_tree SET depth = depth - 1
+            WHERE descendant_id IN (SELECT descendant_id FROM deck_tree WHERE ancestor_id = ? AND depth > 0)
+              AND ancestor_id IN (SELECT ancestor_id FROM deck_tree WHERE descendant_id = ? AND depth > 0)
+        """, (deck_id, deck_id))
+        self.cursor.execute("DELETE FROM deck_tree WHERE ancestor_id = ? OR descendant_id = ?", (deck_id, deck_id))
+        self.cursor.execute(
+            "UPDATE decks SET parent_id = (SELECT parent_id FROM decks WHERE deck_id = ?) WHERE parent_id = ?",
+            (deck_id, deck_id)
+        )
         self.cursor.execute("DELETE FROM decks WHERE deck_id = ?", (deck_id,))
         self.conn.commit()
+        self.record_change()
+        self.due_histograms.clear()
+        if self.search_index:
+            self.search_index.remove_deck(deck_id)
+        for index in self.deck_indexes.values():
+            index.delete(deck_id)
+        for index in self.tag_indexes.values():
+            for card_id in card_ids:
+                index.remove_card(card_id)
+        for key in [key for key in self.card_orders if key[1] == deck_id]:
+            del self.card_orders[key]
 
-    # retrieves deck information as a dict with keys: name and card_count
+    # retrieves deck information as a dict with keys: name, card_count, scheduler (the scheduler's name)
+    # and parent_id (None for a top level deck)
     def get_deck_info(self, deck_id):
         self.cursor.execute("""
-            SELECT d.deck_name, COUNT(c.card_id) as card_count
+            SELECT d.deck_name, COUNT(c.card_id) as card_count, d.scheduler, d.parent_id
             FROM decks d
             LEFT JOIN cards c ON d.deck_id = c.deck_id
             WHERE d.deck_id = ?
@@ -194,8 +468,83 @@ class Database:
         """, (deck_id,))
         result = self.cursor.fetchone()
         if result:
-            return {"name": result[0], "card_count": result[1]}
-        return {"name": "", "card_count": 0}
+            return {"name": result[0], "card_count": result[1], "scheduler": result[2], "parent_id": result[3]}
+        return {"name": "", "card_count": 0, "scheduler": "sm2", "parent_id": None}
+
+    # moves a deck (with all its subdecks) under a new parent deck, or to the top level if parent_id is None
+    # the subtree's links to its old ancestors are removed and a link from each new ancestor to each deck in the
+    # subtree is added, with two queries however deep the subtree is
+    # returns False without changing anything if the new parent is the deck itself or one of its subdecks
+    def move_deck(self, deck_id, parent_id):
+        if parent_id is not None:
+            self.cursor.execute(
+                "SELECT 1 FROM deck_tree WHERE ancestor_id = ? AND descendant_id = ?", (deck_id, parent_id)
+            )
+            if self.cursor.fetchone():
+                return False
+        try:
+            self.cursor.execute("""
+                DELETE FROM deck_tree
+                WHERE descendant_id IN (SELECT descendant_id FROM deck_tree WHERE ancestor_id = ?)
+                  AND ancestor_id IN (SELECT ancestor_id FROM deck_tree WHERE descendant_id = ? AND depth > 0)
+            """, (deck_id, deck_id))
+            if parent_id is not None:
+                self.cursor.execute("""
+                    INSERT INTO deck_tree (ancestor_id, descendant_id, depth)
+                    SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1
+                    FROM deck_tree above, deck_tree below
+                    WHERE above.descendant_id = ? AND below.ancestor_id = ?
+                """, (parent_id, deck_id))
+            self.cursor.execute("UPDATE decks SET parent_id = ? WHERE deck_id = ?", (parent_id, deck_id))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error moving deck: {e}")
+            self.conn.rollback()
+            return False
+        self.record_change()
+        return True
+
+    # returns {deck_id: parent_id} for all the user's decks, parent_id is None for top level decks
+    def get_deck_parents(self, user_id):
+        self.cursor.execute("SELECT deck_id, parent_id FROM decks WHERE user_id = ?", (user_id,))
+        return dict(self.cursor.fetchall())
+
+    # returns (deck_id, path) for all the user's decks sorted by path, where the path is the names of the deck's
+    # ancestors and its own name, e.g. "Languages / Spanish / Verbs"
+    # each path is its parent's path with the deck's name added, going down from the top level decks
+    def get_deck_paths(self, user_id):
+        self.cursor.execute("SELECT deck_id, deck_name, parent_id FROM decks WHERE user_id = ?", (user_id,))
+        rows = self.cursor.fetchall()
+        names = {deck_id: name for deck_id, name, _ in rows}
+        parents = {deck_id: parent_id for deck_id, _, parent_id in rows}
+        paths = {}
+        for deck_id in top_down(parents):
+            parent_path = paths.get(parents[deck_id])
+            paths[deck_id] = f"{parent_path} / {names[deck_id]}" if parent_path else names[deck_id]
+        return sorted(paths.items(), key=lambda deck: deck[1].lower())
+
+    # returns the ids of a deck and all its subdecks, from the deck tree
+    def get_subdeck_ids(self, deck_id):
+        self.cursor.execute("SELECT descendant_id FROM deck_tree WHERE ancestor_id = ? ORDER BY depth", (deck_id,))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    # returns the card count, average ef and number of cards available for review now of a deck and all its subdecks
+    # together as a dict, with one query joining the deck tree to the cards of every deck in the subtree
+    def get_subtree_stats(self, user_id, deck_id):
+        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.cursor.execute("""
+            SELECT
+                COUNT(c.card_id),
+                AVG(COALESCE(s.ef, 2.5)),
+                SUM(CASE WHEN (s.next_review_date IS NULL OR s.next_review_date <= ?)
+                          AND COALESCE(s.suspended, 0) = 0 THEN 1 ELSE 0 END)
+            FROM deck_tree t
+            JOIN cards c ON c.deck_id = t.descendant_id
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE t.ancestor_id = ?
+        """, (now_str, user_id, deck_id))
+        count, avg_ef, due = self.cursor.fetchone()
+        return {"card_count": count, "avg_ef": avg_ef if avg_ef is not None else 2.5, "due": due or 0}
     
     # returns the deck name with the corresponding deck_id
     def get_deck_name(self, deck_id):
@@ -232,7 +581,16 @@ class Database:
             (deck_id, question, answer)
         )
         self.conn.commit()
-        return self.cursor.lastrowid
+        self.record_change()
+        card_id = self.cursor.lastrowid
+        if self.search_index:
+            self.search_index.add_card(card_id, deck_id, question, answer)
+        # new cards have the default ef of 2.5
+        self.update_deck_index(deck_id, added_ef=2.5, count_change=1)
+        for key, order in self.card_orders.items():
+            if key[1] == deck_id:
+                order.add((card_id, question, answer, 2.5))
+        return card_id
 
     # updates an existing card's question and answer
     def update_card(self, card_id, question, answer):
@@ -241,11 +599,117 @@ class Database:
             (question, answer, card_id)
         )
         self.conn.commit()
+        if self.search_index:
+            self.cursor.execute("SELECT deck_id FROM cards WHERE card_id = ?", (card_id,))
+            row = self.cursor.fetchone()
+            if row:
+                self.search_index.add_card(card_id, row[0], question, answer)
+        # the ef doesn't change, so the card keeps its position in the order
+        for order in self.card_orders.values():
+            card = order.cards.get(card_id)
+            if card:
+                order.cards[card_id] = (card_id, question, answer, card[3])
 
     # deletes a card by its card_id
     def delete_card(self, card_id):
+        # the card's deck and ef are needed to update the deck's average ef in the deck index
+        self.cursor.execute("""
+            SELECT c.deck_id, COALESCE(s.ef, 2.5)
+            FROM cards c
+            JOIN decks d ON d.deck_id = c.deck_id
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = d.user_id
+            WHERE c.card_id = ?
+        """, (card_id,))
+        card = self.cursor.fetchone()
+        self.cursor.execute("DELETE FROM card_tags WHERE card_id = ?", (card_id,))
         self.cursor.execute("DELETE FROM cards WHERE card_id = ?", (card_id,))
         self.conn.commit()
+        self.record_change()
+        self.due_histograms.clear()
+        if self.search_index:
+            self.search_index.remove_card(card_id)
+        for index in self.tag_indexes.values():
+            index.remove_card(card_id)
+        for order in self.card_orders.values():
+            order.remove(card_id)
+        if card:
+            self.update_deck_index(card[0], removed_ef=card[1], count_change=-1)
+
+    # returns the user's TagIndex, loading every tagged card from card_tags the first time
+    def get_tag_index(self, user_id):
+        if user_id not in self.tag_indexes:
+            self.cursor.execute("""
+                SELECT t.name, ct.card_id
+                FROM tags t
+                JOIN card_tags ct ON ct.tag_id = t.tag_id
+                WHERE t.user_id = ?
+            """, (user_id,))
+            self.tag_indexes[user_id] = TagIndex(self.cursor.fetchall())
+        return self.tag_indexes[user_id]
+
+    # returns {card_id: [tag names]} for some cards (cards without tags are left out)
+    def get_card_tags(self, card_ids):
+        if not card_ids:
+            return {}
+        placeholders = ", ".join("?" * len(card_ids))
+        self.cursor.execute(f"""
+            SELECT ct.card_id, t.name
+            FROM card_tags ct
+            JOIN tags t ON t.tag_id = ct.tag_id
+            WHERE ct.card_id IN ({placeholders})
+            ORDER BY t.name
+        """, list(card_ids))
+        card_tags = {}
+        for card_id, name in self.cursor.fetchall():
+            card_tags.setdefault(card_id, []).append(name)
+        return card_tags
+
+    # replaces a card's tags with names (already normalised, see tags.parse_tag_list), making any new tags,
+    # and updates the tag index if it has been loaded
+    def set_card_tags(self, user_id, card_id, names):
+        old_names = self.get_card_tags([card_id]).get(card_id, [])
+        try:
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO tags (user_id, name) VALUES (?, ?)", [(user_id, name) for name in names]
+            )
+            self.cursor.execute("DELETE FROM card_tags WHERE card_id = ?", (card_id,))
+            placeholders = ", ".join("?" * len(names))
+            if names:
+                self.cursor.execute(f"""
+                    INSERT INTO card_tags (card_id, tag_id)
+                    SELECT ?, tag_id FROM tags WHERE user_id = ? AND name IN ({placeholders})
+                """, [card_id, user_id, *names])
+            self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error setting card tags: {e}")
+            self.conn.rollback()
+            return
+        self.record_change()
+        index = self.tag_indexes.get(user_id)
+        if index:
+            for name in old_names:
+                index.remove(name, card_id)
+            for name in names:
+                index.add(name, card_id)
+
+    # returns an sql condition on column (a card_id column) for the cards matching a tag query (see TagIndex.query),
+    # or None if tags is empty, raising ValueError if the query can't be read
+    # the query is worked out on the in memory bitsets, then the matching card ids (or for a query like "not easy",
+    # the ids that don't match) are put in the tag_filter temp table, which the condition looks up by primary key
+    # the table is only filled again when the result has changed, e.g. not when loading the next page of cards
+    def tag_condition(self, user_id, tags, column):
+        if not tags or not tags.strip():
+            return None
+        bits = self.get_tag_index(user_id).query(tags)
+        if bits != self.tag_filter_bits:
+            self.cursor.execute("DELETE FROM temp.tag_filter")
+            self.cursor.executemany(
+                "INSERT INTO temp.tag_filter (card_id) VALUES (?)",
+                [(card_id,) for card_id in ids_from_bitset(bits if bits >= 0 else ~bits)]
+            )
+            self.conn.commit()
+            self.tag_filter_bits = bits
+        return f"{column} {'IN' if bits >= 0 else 'NOT IN'} temp.tag_filter"
 
     # returns the number of cards in a deck
     def get_card_count(self, deck_id):
@@ -267,6 +731,243 @@ class Database:
             return row[0]
         return 2.5
         
+    # returns the sql condition for a priority filter ("high", "medium" or "low") applied to an ef expression
+    # the ranges are the same as the priority labels shown on decks and cards
+    @staticmethod
+    def priority_condition(priority, ef_expression):
+        if priority == "high":
+            return f"{ef_expression} < 2.0"
+        if priority == "medium":
+            return f"{ef_expression} >= 2.0 AND {ef_expression} < 2.5"
+        if priority == "low":
+            return f"{ef_expression} >= 2.5"
+        return None
+
+    # escapes the % and _ wildcards in search text, so they are matched literally by LIKE
+    @staticmethod
+    def like_pattern(search):
+        search = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"%{search}%"
+
+    # returns one page of cards in a deck as (card_id, question, answer, ef) tuples and a cursor for the next page
+    # search, priority filtering and sorting by ef all happen in sql, so only the rows shown are fetched
+    # order is "priority" (lowest ef first) or "recent" (newest card first)
+    # after is the cursor returned by the previous page (None for the first page), and next_cursor is None on the last page
+    # tags is a tag query (see TagIndex.query), raising ValueError if it can't be read
+    def list_cards(self, deck_id, user_id, search=None, priority=None, order="priority", after=None, limit=25, tags=None):
+        conditions = ["c.deck_id = ?"]
+        params = [user_id, deck_id]
+        if search:
+            # LIKE is case insensitive, the same as the lowercase comparison the cards page used before
+            conditions.append("c.question LIKE ? ESCAPE '\\'")
+            params.append(self.like_pattern(search))
+        priority_sql = self.priority_condition(priority, "COALESCE(s.ef, 2.5)")
+        if priority_sql:
+            conditions.append(priority_sql)
+        tag_sql = self.tag_condition(user_id, tags, "c.card_id")
+        if tag_sql:
+            conditions.append(tag_sql)
+
+        # keyset pagination: the next page starts after the last row of the previous page,
+        # which stays fast on later pages unlike OFFSET (which has to skip over every earlier row)
+        if order == "recent":
+            order_sql = "c.card_id DESC"
+            if after is not None:
+                conditions.append("c.card_id < ?")
+                params.append(after[0])
+        else:
+            order_sql = "ef ASC, c.card_id ASC"
+            if after is not None:
+                conditions.append("(COALESCE(s.ef, 2.5), c.card_id) > (?, ?)")
+                params.extend(after)
+
+        # one extra row is fetched to find out if there is another page
+        params.append(limit + 1)
+        self.cursor.execute(f"""
+            SELECT c.card_id, c.question, c.answer, COALESCE(s.ef, 2.5) AS ef
+            FROM cards c
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE {" AND ".join(conditions)}
+            ORDER BY {order_sql}
+            LIMIT ?
+        """, params)
+        rows = self.cursor.fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = (last[0],) if order == "recent" else (last[3], last[0])
+        return rows, next_cursor
+
+    # returns all the cards in a deck as (card_id, question, answer, ef) tuples, in no particular order
+    def get_deck_card_rows(self, user_id, deck_id):
+        self.cursor.execute("""
+            SELECT c.card_id, c.question, c.answer, COALESCE(s.ef, 2.5)
+            FROM cards c
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE c.deck_id = ?
+        """, (user_id, deck_id))
+        return self.cursor.fetchall()
+
+    # returns the deck's PriorityOrder (cards ordered by ef, lowest first), built the first time it's needed
+    # and then kept up to date as cards are added, edited, deleted and rated
+    def get_card_order(self, user_id, deck_id):
+        key = (user_id, deck_id)
+        if key not in self.card_orders:
+            self.card_orders[key] = PriorityOrder(self.get_deck_card_rows(user_id, deck_id))
+        return self.card_orders[key]
+
+    # returns count of a deck's cards from position start in priority order (lowest ef first, then card_id),
+    # the same order list_cards uses, but without a search, priority or tag filter
+    # the first page only needs the lowest count cards, so if the deck's order hasn't been built it picks them
+    # with a heap (top_k) instead of sorting every card in the deck
+    def get_priority_page(self, user_id, deck_id, start, count):
+        order = self.card_orders.get((user_id, deck_id))
+        if order is None and start == 0:
+            return top_k(self.get_deck_card_rows(user_id, deck_id), count, key=lambda card: (card[3], card[0]))
+        return self.get_card_order(user_id, deck_id).page(start, count)
+
+    # returns the user's decks as (deck_id, deck_name, avg_ef, card_count) tuples, sorted by avg_ef (lowest first)
+    # average ef and card count are worked out in one grouped query instead of one query per card,
+    # and cards without a spaced repetition record count as the default ef of 2.5 (as do empty decks)
+    def list_decks(self, user_id, search=None, priority=None):
+        conditions = ["d.user_id = ?"]
+        params = [user_id, user_id]
+        if search:
+            conditions.append("d.deck_name LIKE ? ESCAPE '\\'")
+            params.append(self.like_pattern(search))
+        having_sql = ""
+        priority_sql = self.priority_condition(priority, "avg_ef")
+        if priority_sql:
+            having_sql = f"HAVING {priority_sql}"
+        self.cursor.execute(f"""
+            SELECT d.deck_id, d.deck_name, AVG(COALESCE(s.ef, 2.5)) AS avg_ef, COUNT(c.card_id) AS card_count
+            FROM decks d
+            LEFT JOIN cards c ON c.deck_id = d.deck_id
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE {" AND ".join(conditions)}
+            GROUP BY d.deck_id, d.deck_name
+            {having_sql}
+            ORDER BY avg_ef ASC, d.deck_id ASC
+        """, params)
+        return self.cursor.fetchall()
+
+    # returns the user's deck index (decks ordered by avg_ef), which is built from one list_decks query
+    # the first time it's needed and then kept up to date instead of being rebuilt every time decks are shown
+    def get_deck_index(self, user_id):
+        if user_id not in self.deck_indexes:
+            self.deck_indexes[user_id] = DeckIndex(self.list_decks(user_id))
+        return self.deck_indexes[user_id]
+
+    # returns the user's decks as (deck_id, deck_name, avg_ef, card_count) tuples sorted by avg_ef (lowest first)
+    # from the deck index, a priority filter only visits the decks in that priority's ef range
+    def get_ordered_decks(self, user_id, search=None, priority=None):
+        priority_bands = {"high": (None, 2.0), "medium": (2.0, 2.5), "low": (2.5, None)}
+        low, high = priority_bands.get(priority, (None, None))
+        search = search.lower() if search else ""
+        decks = []
+        for node in self.get_deck_index(user_id).range(low, high):
+            if search in node.deck_name.lower():
+                decks.append((node.deck_id, node.deck_name, node.avg_ef, node.card_count))
+        return decks
+
+    # updates a deck's average ef and card count in any deck index it is in
+    # added_ef and removed_ef are the ef values of cards added, removed or changed, e.g. rating a card
+    # removes its old ef and adds its new ef, so the new average is worked out without reading every card
+    def update_deck_index(self, deck_id, added_ef=0.0, removed_ef=0.0, count_change=0):
+        for index in self.deck_indexes.values():
+            node = index.get(deck_id)
+            if node:
+                index.update_key(deck_id, node.total_ef + added_ef - removed_ef, node.card_count + count_change)
+
+    # loads how many cards are due for every deck of a user, over the next horizon days, with one grouped query
+    # cards that are overdue or have never been reviewed are due now, and count towards today
+    # the result is a dict with:
+    # due_now: {deck_id: cards available for review now}
+    # days: {deck_id: [cards due today, tomorrow, ...]} and total: the same added up over all decks
+    def load_due_forecast(self, user_id, horizon):
+        now = datetime.now()
+        now_str = now.strftime("%Y-%m-%d %H:%M:%S")
+        today = now.date()
+        end_str = (today + timedelta(days=horizon)).strftime("%Y-%m-%d %H:%M:%S")
+        self.cursor.execute("""
+            SELECT deck_id, day, due_now, COUNT(*)
+            FROM (
+                SELECT
+                    c.deck_id AS deck_id,
+                    MAX(CAST(julianday(DATE(s.next_review_date)) - julianday(?) AS INTEGER), 0) AS day,
+                    s.next_review_date <= ? AS due_now
+                FROM spaced_rep s
+                JOIN cards c ON c.card_id = s.card_id
+                JOIN decks d ON d.deck_id = c.deck_id AND d.user_id = s.user_id
+                WHERE s.user_id = ? AND s.next_review_date < ? AND s.suspended = 0
+                UNION ALL
+                SELECT c.deck_id, 0, 1
+                FROM decks d
+                JOIN cards c ON c.deck_id = d.deck_id
+                WHERE d.user_id = ?
+                  AND NOT EXISTS (
+                      -- without the hint sqlite picks the (user_id, next_review_date) index as it covers the query,
+                      -- and scans all the user's reviewed cards for every card
+                      SELECT 1 FROM spaced_rep s INDEXED BY idx_spaced_rep_user_card
+                      WHERE s.card_id = c.card_id AND s.user_id = d.user_id AND s.next_review_date IS NOT NULL
+                  )
+            )
+            GROUP BY deck_id, day, due_now
+        """, (today.isoformat(), now_str, user_id, end_str, user_id))
+
+        due_now = {}
+        days = {}
+        total = [0] * horizon
+        for deck_id, day, is_due_now, count in self.cursor.fetchall():
+            if deck_id not in days:
+                days[deck_id] = [0] * horizon
+                due_now[deck_id] = 0
+            days[deck_id][day] += count
+            total[day] += count
+            if is_due_now:
+                due_now[deck_id] += count
+
+        # the forecast changes without any database change when the next scheduled card becomes due (or at midnight),
+        # so it is only kept until then
+        self.cursor.execute(
+            "SELECT MIN(next_review_date) FROM spaced_rep WHERE user_id = ? AND next_review_date > ? AND suspended = 0",
+            (user_id, now_str)
+        )
+        next_due = self.cursor.fetchone()[0]
+        valid_until = datetime.combine(today + timedelta(days=1), datetime.min.time())
+        if next_due:
+            valid_until = min(valid_until, datetime.strptime(next_due, "%Y-%m-%d %H:%M:%S"))
+        return {"due_now": due_now, "days": days, "total": total, "start": today, "valid_until": valid_until}
+
+    # returns the cached due forecast for a user covering at least the next days days, loading it if needed
+    def get_cached_due_forecast(self, user_id, days=30):
+        cached = self.due_forecasts.get(user_id)
+        if (
+            cached is None
+            or cached[0] != self.change_counter
+            or len(cached[1]["total"]) < days
+            or datetime.now() >= cached[1]["valid_until"]
+        ):
+            cached = (self.change_counter, self.load_due_forecast(user_id, max(days, 30)))
+            self.due_forecasts[user_id] = cached
+        return cached[1]
+
+    # returns [(date, cards due)] for each of the next days days (starting today) for one deck,
+    # or for all the user's decks if deck_id is None
+    def get_due_forecast(self, user_id, days=7, deck_id=None):
+        forecast = self.get_cached_due_forecast(user_id, days)
+        if deck_id is None:
+            counts = forecast["total"]
+        else:
+            counts = forecast["days"].get(deck_id, [0] * days)
+        return [(forecast["start"] + timedelta(days=day), counts[day]) for day in range(days)]
+
+    # returns {deck_id: cards available for review now} for all of a user's decks, from the cached due forecast
+    def get_due_counts(self, user_id):
+        return self.get_cached_due_forecast(user_id)["due_now"]
+
     # returns the count of cards available for review for a given deck and user
     def get_available_for_review_count(self, user_id, deck_id):
         now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -276,26 +977,167 @@ class Database:
             LEFT JOIN spaced_rep s ON c.card_id = s.card_id AND s.user_id = ?
             WHERE c.deck_id = ?
               AND (s.next_review_date IS NULL OR s.next_review_date <= ?)
+              AND COALESCE(s.suspended, 0) = 0
         """, (user_id, deck_id, now_str))
         result = self.cursor.fetchone()
         return result[0] if result else 0
 
-    # returns cards available for review, if testing is True, returns all cards in the deck
-    def get_available_for_review(self, user_id, deck_id):
-        # returns all cards for the given deck that are due for review (or have no scheduled review date)
-        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.cursor.execute("""
-            SELECT c.card_id, c.question, c.answer, COALESCE(s.next_review_date, ?) as next_review_date
+    # returns one page of a deck's due cards as (card_id, question, answer, due, deck_id) tuples and a cursor for the next page
+    # cards are ordered by when they became due (cards that have never been reviewed count as due at now_str), then card_id
+    # now_str is fixed when a quiz session starts, so cards rated during the session don't come back as due
+    # after is the (due, card_id) of the last card of the previous page, and next_cursor is None on the last page
+    # cursor can be given to run the query on another connection, e.g. when prefetching pages on a background thread
+    def get_due_cards_page(self, user_id, deck_id, now_str, after=None, limit=20, cursor=None):
+        cursor = cursor or self.cursor
+        conditions = [
+            "c.deck_id = ?", "(s.next_review_date IS NULL OR s.next_review_date <= ?)", "COALESCE(s.suspended, 0) = 0"
+        ]
+        params = [now_str, user_id, deck_id, now_str]
+        if after is not None:
+            conditions.append("(COALESCE(s.next_review_date, ?), c.card_id) > (?, ?)")
+            params.extend([now_str, after[0], after[1]])
+        # one extra row is fetched to find out if there is another page (same as list_cards)
+        params.append(limit + 1)
+        cursor.execute(f"""
+            SELECT c.card_id, c.question, c.answer, COALESCE(s.next_review_date, ?) AS due, c.deck_id
             FROM cards c
-            LEFT JOIN spaced_rep s ON c.card_id = s.card_id AND s.user_id = ?
-            WHERE c.deck_id = ?
-            AND (s.next_review_date IS NULL OR s.next_review_date <= ?)
-            ORDER BY next_review_date ASC
-            LIMIT 100
-        """, (now_str, user_id, deck_id, now_str))
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE {" AND ".join(conditions)}
+            ORDER BY due ASC, c.card_id ASC
+            LIMIT ?
+        """, params)
+        rows = cursor.fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1][3], rows[-1][0])
+        return rows, next_cursor
+
+    # returns (sr_id, due time, interval in seconds, ef) for a user's cards that were due before before_str,
+    # in one deck or in all their decks if deck_id is None, used to spread a backlog of overdue cards (see backlog.py)
+    # due times are local seconds since 1970, like review_log.reviewed_at
+    def get_backlog(self, user_id, before_str, deck_id=None):
+        condition = "c.deck_id = ?" if deck_id is not None else "c.deck_id IN (SELECT deck_id FROM decks WHERE user_id = ?)"
+        self.cursor.execute(f"""
+            SELECT s.sr_id, CAST(strftime('%s', s.next_review_date) AS INTEGER), s.interval * 60, s.ef
+            FROM spaced_rep s
+            JOIN cards c ON c.card_id = s.card_id
+            WHERE s.user_id = ? AND s.next_review_date < ? AND s.suspended = 0 AND {condition}
+        """, (user_id, before_str, deck_id if deck_id is not None else user_id))
+        return self.cursor.fetchall()
+
+    # moves cards to new due dates, from (new due date, minutes added to the interval, sr_id) tuples,
+    # all in one transaction so either every card is moved or none are, and returns the number of cards moved
+    def move_due_dates(self, changes):
+        try:
+            self.cursor.executemany(
+                "UPDATE spaced_rep SET next_review_date = ?, interval = interval + ? WHERE sr_id = ?",
+                changes
+            )
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        self.record_change()
+        self.due_histograms.clear()
+        return len(changes)
+
+    # returns (card_id, deck_id, due, ef, number of reviews, average seconds taken or None) for the decks' due cards,
+    # used to plan time limited sessions (see planner.py)
+    # the answer times are averaged with the idx_review_log_user_card index, so only the due cards' reviews are read
+    # tags is a tag query (see TagIndex.query) the cards have to match
+    def get_due_card_stats(self, user_id, deck_ids, now_str, tags=None):
+        placeholders = ", ".join("?" * len(deck_ids))
+        tag_sql = self.tag_condition(user_id, tags, "c.card_id") or "1"
+        self.cursor.execute(f"""
+            SELECT c.card_id, c.deck_id, COALESCE(s.next_review_date, ?), COALESCE(s.ef, 2.5),
+                   COUNT(r.review_id), AVG(r.time_taken)
+            FROM cards c
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            LEFT JOIN review_log r ON r.user_id = ? AND r.card_id = c.card_id
+            WHERE c.deck_id IN ({placeholders}) AND {tag_sql}
+              AND (s.next_review_date IS NULL OR s.next_review_date <= ?)
+              AND COALESCE(s.suspended, 0) = 0
+            GROUP BY c.card_id
+        """, [now_str, user_id, user_id, *deck_ids, now_str])
         return self.cursor.fetchall()
 
+    # returns (card_id, ef, 1 if the last answer was incorrect else 0) for every card in the decks, used to weight cram mode
+    # tags is a tag query (see TagIndex.query) the cards have to match
+    def get_cram_weights(self, user_id, deck_ids, tags=None):
+        placeholders = ", ".join("?" * len(deck_ids))
+        tag_sql = self.tag_condition(user_id, tags, "c.card_id") or "1"
+        self.cursor.execute(f"""
+            SELECT c.card_id, COALESCE(s.ef, 2.5), COALESCE(s.is_correct = 0, 0)
+            FROM cards c
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE c.deck_id IN ({placeholders}) AND {tag_sql} AND COALESCE(s.suspended, 0) = 0
+        """, [user_id, *deck_ids])
+        return self.cursor.fetchall()
 
+    # returns a cursor over the ids of the cards in the decks (optionally only those with a priority), as (card_id,) rows
+    # suspended cards are left out, found with the idx_spaced_rep_suspended partial index
+    # the rows are read one at a time as the cursor is iterated, so the ids are never all in memory at once
+    # it has its own cursor, so other queries can run while it is being read
+    # tags is a tag query (see TagIndex.query) the cards have to match
+    def iter_card_ids(self, user_id, deck_ids, priority=None, tags=None):
+        placeholders = ", ".join("?" * len(deck_ids))
+        condition = self.priority_condition(priority, "COALESCE(s.ef, 2.5)")
+        tag_sql = self.tag_condition(user_id, tags, "card_id" if condition is None else "c.card_id") or "1"
+        if condition is None:
+            return self.conn.execute(f"""
+                SELECT card_id FROM cards
+                WHERE deck_id IN ({placeholders}) AND {tag_sql}
+                  AND card_id NOT IN (SELECT card_id FROM spaced_rep WHERE user_id = ? AND suspended = 1)
+            """, [*deck_ids, user_id])
+        return self.conn.execute(f"""
+            SELECT c.card_id
+            FROM cards c
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE c.deck_id IN ({placeholders}) AND {condition} AND {tag_sql} AND COALESCE(s.suspended, 0) = 0
+        """, [user_id, *deck_ids])
+
+    # returns the due cards in some decks that match a tag query (see TagIndex.query) as (card_id, question, answer,
+    # due, deck_id) tuples in due order, which can be used as a quiz session's source
+    # (cards that have never been reviewed count as due at now_str, like get_due_cards_page)
+    def get_tagged_due_cards(self, user_id, deck_ids, now_str, tags):
+        placeholders = ", ".join("?" * len(deck_ids))
+        tag_sql = self.tag_condition(user_id, tags, "c.card_id") or "1"
+        self.cursor.execute(f"""
+            SELECT c.card_id, c.question, c.answer, s.next_review_date, c.deck_id
+            FROM cards c
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE c.deck_id IN ({placeholders}) AND {tag_sql}
+              AND (s.next_review_date IS NULL OR s.next_review_date <= ?)
+              AND COALESCE(s.suspended, 0) = 0
+            ORDER BY COALESCE(s.next_review_date, ?), c.card_id
+        """, [user_id, *deck_ids, now_str, now_str])
+        return self.cursor.fetchall()
+
+    # returns cards as (card_id, question, answer, due, deck_id) tuples (see get_session_card), in no particular order
+    def get_session_cards(self, user_id, card_ids):
+        if not card_ids:
+            return []
+        placeholders = ", ".join("?" * len(card_ids))
+        self.cursor.execute(f"""
+            SELECT c.card_id, c.question, c.answer, s.next_review_date, c.deck_id
+            FROM cards c
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE c.card_id IN ({placeholders})
+        """, [user_id, *card_ids])
+        return self.cursor.fetchall()
+
+    # returns a card as a (card_id, question, answer, due, deck_id) tuple, the same as get_due_cards_page, or None
+    # due is None if the card has never been reviewed
+    def get_session_card(self, user_id, card_id):
+        self.cursor.execute("""
+            SELECT c.card_id, c.question, c.answer, s.next_review_date, c.deck_id
+            FROM cards c
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE c.card_id = ?
+        """, (user_id, card_id))
+        return self.cursor.fetchone()
 
     # saves a quiz result in the database and returns the new result id
     def save_quiz_result(self, user_id, deck_id, total_cards, correct_count, avg_time, deck_time):
@@ -306,6 +1148,7 @@ class Database:
             VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
         """, (user_id, deck_id, total_cards, correct_count, avg_time, deck_time))
         self.conn.commit()
+        self.record_change()
         return self.cursor.lastrowid
 
     # returns overall quiz statistics for a user as a dict
@@ -445,26 +1288,254 @@ class Database:
             """,
             (int(is_correct), user_id, card_id)
         )
+        # also marks the card's latest review in the review log
+        self.cursor.execute(
+            """
+            UPDATE review_log
+               SET is_correct = ?
+             WHERE review_id = (SELECT MAX(review_id) FROM review_log WHERE user_id = ? AND card_id = ?)
+            """,
+            (int(is_correct), user_id, card_id)
+        )
         self.conn.commit()
+        self.record_change()
     
 
+    # returns the answer time digest for a user's deck, loading it from the database the first time
+    def get_time_sketch(self, user_id, deck_id):
+        key = (user_id, deck_id)
+        if key not in self.time_sketches:
+            self.cursor.execute(
+                "SELECT digest FROM answer_time_sketches WHERE user_id = ? AND deck_id = ?",
+                (user_id, deck_id)
+            )
+            row = self.cursor.fetchone()
+            self.time_sketches[key] = TDigest.from_bytes(row[0]) if row else TDigest()
+        return self.time_sketches[key]
+
+    # adds an answer time to the digest for the card's deck and saves the digest
+    def record_answer_time(self, user_id, card_id, time_taken):
+        self.cursor.execute("SELECT deck_id FROM cards WHERE card_id = ?", (card_id,))
+        row = self.cursor.fetchone()
+        if not row:
+            return
+        digest = self.get_time_sketch(user_id, row[0])
+        digest.add(time_taken)
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO answer_time_sketches (user_id, deck_id, digest) VALUES (?, ?, ?)",
+            (user_id, row[0], digest.to_bytes())
+        )
+        self.conn.commit()
+
+    # adds a review to the review log, with the time since the card was last reviewed
+    def log_review(self, user_id, card_id, quality, time_taken):
+        reviewed_at = local_timestamp(datetime.now())
+        self.cursor.execute(
+            "SELECT MAX(review_id), reviewed_at FROM review_log WHERE user_id = ? AND card_id = ?",
+            (user_id, card_id)
+        )
+        previous = self.cursor.fetchone()
+        elapsed = reviewed_at - previous[1] if previous and previous[0] is not None else None
+        self.cursor.execute("""
+            INSERT INTO review_log (user_id, card_id, deck_id, reviewed_at, elapsed, quality, time_taken)
+            SELECT ?, card_id, deck_id, ?, ?, ?, ?
+            FROM cards
+            WHERE card_id = ?
+        """, (user_id, reviewed_at, elapsed, quality, time_taken, card_id))
+        self.conn.commit()
+
+    # returns the retention engine for a user, which is refreshed by analytics.build_snapshot
+    def get_retention_engine(self, user_id):
+        if user_id not in self.retention_engines:
+            self.retention_engines[user_id] = RetentionEngine(user_id)
+        return self.retention_engines[user_id]
+
+    # returns a digest of a user's answer times for one deck, or for all their decks merged together if deck_id is None
+    def get_answer_time_sketch(self, user_id, deck_id=None):
+        if deck_id is not None:
+            return self.get_time_sketch(user_id, deck_id)
+        merged = TDigest()
+        self.cursor.execute("SELECT deck_id FROM answer_time_sketches WHERE user_id = ?", (user_id,))
+        for (sketch_deck_id,) in self.cursor.fetchall():
+            merged.merge(self.get_time_sketch(user_id, sketch_deck_id))
+        return merged
+
+    # returns (card_id, due time or None, interval, repetition, ef, stability) for every card in a deck, or in all a user's
+    # decks if deck_id is None, for simulator.initial_state (the values are None for cards that have never been reviewed)
+    # due times are local seconds since 1970, like review_log.reviewed_at
+    def get_simulation_state(self, user_id, deck_id=None):
+        condition = "c.deck_id = ?" if deck_id is not None else "c.deck_id IN (SELECT deck_id FROM decks WHERE user_id = ?)"
+        self.cursor.execute(f"""
+            SELECT c.card_id, CAST(strftime('%s', s.next_review_date) AS INTEGER), s.interval, s.repetition, s.ef, s.stability
+            FROM cards c
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE {condition} AND COALESCE(s.suspended, 0) = 0
+        """, (user_id, deck_id if deck_id is not None else user_id))
+        return self.cursor.fetchall()
+
+    # returns the set of scheduler names used by some decks
+    def get_scheduler_names(self, deck_ids):
+        placeholders = ", ".join("?" * len(deck_ids))
+        self.cursor.execute(f"SELECT DISTINCT scheduler FROM decks WHERE deck_id IN ({placeholders})", deck_ids)
+        return {row[0] for row in self.cursor.fetchall()}
+
+    # returns the scheduler object for a scheduler name and user, creating it the first time
+    # with the params fitted to the user's reviews if they have been fitted, otherwise the defaults
+    def get_scheduler(self, name, user_id=None):
+        key = (name, user_id)
+        if key not in self.schedulers:
+            scheduler_class = SCHEDULERS.get(name, SCHEDULERS["sm2"])
+            fit = self.get_scheduler_fit(user_id) if user_id is not None else None
+            self.schedulers[key] = scheduler_class(scheduler_class.fitted_params(fit) if fit else None)
+        return self.schedulers[key]
+
+    # returns the model fitted to a user's reviews (see optimizer.fit_user) as a dict, or None if it hasn't been fitted
+    def get_scheduler_fit(self, user_id):
+        self.cursor.execute("SELECT fit FROM scheduler_fits WHERE user_id = ?", (user_id,))
+        row = self.cursor.fetchone()
+        return json.loads(row[0]) if row else None
+
+    # saves a model fitted to a user's reviews, which their schedulers use from then on
+    def save_scheduler_fit(self, user_id, fit):
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO scheduler_fits (user_id, fit, fitted_at) VALUES (?, ?, datetime('now'))",
+            (user_id, json.dumps(fit))
+        )
+        self.conn.commit()
+        for key in [key for key in self.schedulers if key[1] == user_id]:
+            del self.schedulers[key]
+
+    # returns the user's DifficultyClusters (see clustering.py), or None if their cards haven't been grouped yet
+    def get_difficulty_clusters(self, user_id):
+        if user_id not in self.difficulty_clusters:
+            self.cursor.execute("SELECT model FROM difficulty_clusters WHERE user_id = ?", (user_id,))
+            row = self.cursor.fetchone()
+            self.difficulty_clusters[user_id] = DifficultyClusters(json.loads(row[0])) if row else None
+        return self.difficulty_clusters[user_id]
+
+    # returns True if the user's cards haven't been grouped by difficulty, or not in the last CLUSTER_REFRESH_DAYS days
+    def difficulty_clusters_out_of_date(self, user_id):
+        self.cursor.execute(
+            "SELECT julianday('now') - julianday(clustered_at) FROM difficulty_clusters WHERE user_id = ?", (user_id,)
+        )
+        row = self.cursor.fetchone()
+        return row is None or row[0] >= CLUSTER_REFRESH_DAYS
+
+    # saves the groups found by clustering.cluster_user, with assignments as (group, card_id) pairs for every grouped card
+    # cards left out of the run (e.g. suspended cards) are taken out of their old groups
+    def save_difficulty_clusters(self, user_id, model, assignments):
+        try:
+            self.cursor.execute(
+                "INSERT OR REPLACE INTO difficulty_clusters (user_id, model, clustered_at) VALUES (?, ?, datetime('now'))",
+                (user_id, json.dumps(model))
+            )
+            self.cursor.execute("UPDATE spaced_rep SET cluster = NULL WHERE user_id = ?", (user_id,))
+            self.cursor.executemany(
+                "UPDATE spaced_rep SET cluster = ? WHERE user_id = ? AND card_id = ?",
+                [(cluster, user_id, card_id) for cluster, card_id in assignments]
+            )
+            self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error saving difficulty clusters: {e}")
+            self.conn.rollback()
+            return
+        self.difficulty_clusters[user_id] = DifficultyClusters(model)
+
+    # puts a card that has just been answered in its nearest difficulty group (see DifficultyClusters.add_card) and saves
+    # the group's moved centre, returning the group or None if the user's cards haven't been grouped yet
+    # the card's median answer time includes the answer being saved, which isn't in the review log yet
+    def add_to_difficulty_cluster(self, user_id, card_id, ef, lapses, time_taken):
+        clusters = self.get_difficulty_clusters(user_id)
+        if clusters is None:
+            return None
+        self.cursor.execute("SELECT time_taken FROM review_log WHERE user_id = ? AND card_id = ?", (user_id, card_id))
+        times = [row[0] for row in self.cursor.fetchall()] + [time_taken]
+        cluster = clusters.add_card(ef, lapses, float(np.median(times)))
+        self.cursor.execute(
+            "UPDATE difficulty_clusters SET model = ? WHERE user_id = ?", (json.dumps(clusters.to_model()), user_id)
+        )
+        return cluster
+
+    # returns (group, name, card count) for each difficulty group with cards in a deck, hardest group first
+    # (suspended cards and cards not grouped yet aren't counted)
+    def get_cluster_counts(self, user_id, deck_id):
+        clusters = self.get_difficulty_clusters(user_id)
+        if clusters is None:
+            return []
+        self.cursor.execute("""
+            SELECT s.cluster, COUNT(*)
+            FROM cards c
+            JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE c.deck_id = ? AND s.cluster IS NOT NULL AND s.suspended = 0
+            GROUP BY s.cluster
+            ORDER BY s.cluster
+        """, (user_id, deck_id))
+        return [
+            (cluster, clusters.names[cluster], count)
+            for cluster, count in self.cursor.fetchall() if cluster < len(clusters.names)
+        ]
+
+    # returns up to limit cards from a deck's difficulty group as (card_id, question, answer, due, deck_id) tuples
+    # (see get_session_card), lowest ef first, to be studied together as a quiz session's source
+    def get_cluster_cards(self, user_id, deck_id, cluster, limit):
+        self.cursor.execute("""
+            SELECT c.card_id, c.question, c.answer, s.next_review_date, c.deck_id
+            FROM cards c
+            JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE c.deck_id = ? AND s.cluster = ? AND s.suspended = 0
+            ORDER BY s.ef, c.card_id
+            LIMIT ?
+        """, (user_id, deck_id, cluster, limit))
+        return self.cursor.fetchall()
+
+    # returns the user's DueHistogram, loading the number of cards due on each day the first time
+    # it is dropped (and loaded again when next needed) whenever due dates change other than by answering a card
+    def get_due_histogram(self, user_id):
+        if user_id not in self.due_histograms:
+            self.cursor.execute("""
+                SELECT CAST(strftime('%s', s.next_review_date) AS INTEGER) / 86400 AS day, COUNT(*)
+                FROM spaced_rep s
+                JOIN cards c ON c.card_id = s.card_id
+                WHERE s.user_id = ? AND s.next_review_date IS NOT NULL AND s.suspended = 0
+                GROUP BY day
+            """, (user_id,))
+            self.due_histograms[user_id] = DueHistogram(self.cursor.fetchall())
+        return self.due_histograms[user_id]
+
     # updates spaced repetition data for a card based on quality rating (difficulty the user selected during quiz session)
     # and time taken and returns new review time info
+    # the new schedule comes from the scheduler chosen for the card's deck (see scheduler.py)
     def update_spaced_rep(self, user_id, card_id, quality, time_taken):
-        # retrieve current spaced repetition record for the user and card
+        # retrieve current spaced repetition record for the user and card, and the card's deck and its scheduler
         self.cursor.execute("""
-            SELECT repetition, interval, ef
-            FROM spaced_rep
-            WHERE user_id = ? AND card_id = ?
+            SELECT s.repetition, s.interval, s.ef, s.stability, s.next_review_date, c.deck_id, d.scheduler,
+                   s.lapses, s.failure_streak, s.leech, s.suspended
+            FROM cards c
+            JOIN decks d ON d.deck_id = c.deck_id
+            LEFT JOIN spaced_rep s ON s.card_id = c.card_id AND s.user_id = ?
+            WHERE c.card_id = ?
         """, (user_id, card_id))
         record = self.cursor.fetchone()
+        now = datetime.now()
+        reviewed_at = local_timestamp(now)
+        # loaded before a new card's record is inserted, so the card is only counted on the day it is scheduled for
+        histogram = self.get_due_histogram(user_id)
 
         # if a record exists, assign the values; otherwise, initialize default values and insert a new record
-        if record:
-            repetition, old_interval, ef = record
+        deck_id, scheduler_name = (record[5], record[6]) if record else (None, "sm2")
+        if record and record[0] is not None:
+            repetition, old_interval, ef, stability, previous_due = record[:5]
+            lapses, failure_streak, leech, suspended = record[7:]
+            # the interval is the number of minutes from the previous review to the due date, so it gives the previous review time
+            previous_due = datetime.strptime(previous_due, "%Y-%m-%d %H:%M:%S")
+            previous_review = previous_due - timedelta(minutes=old_interval)
+            elapsed = (now - previous_review).total_seconds() / 86400
+            previous_day = local_timestamp(previous_due) // 86400
         else:
-            repetition, old_interval, ef = 0, 2, 2.5
-            now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            repetition, old_interval, ef, stability, elapsed = 0, 2, 2.5, None, 0.0
+            lapses, failure_streak, leech, suspended = 0, 0, 0, 0
+            previous_day = None
+            now_str = now.strftime("%Y-%m-%d %H:%M:%S")
             self.cursor.execute("""
                 INSERT INTO spaced_rep (
                     user_id, card_id, repetition, interval, ef, next_review_date, time_taken
@@ -473,37 +1544,171 @@ class Database:
             """, (user_id, card_id, repetition, old_interval, ef, now_str, time_taken))
             self.conn.commit()
 
-        # if the quality is low (2 or less), schedule review in minutes and reset repetition count
-        if quality <= 2:
-            mapping_minutes = {0: 2, 1: 6, 2: 10}
-            new_interval = mapping_minutes.get(quality, 10)
-            repetition = 0  # reset repetition for minute intervals
-            next_review_time = datetime.now() + timedelta(minutes=new_interval)
-        # for higher quality responses, schedule review in days and increment repetition count
-        else:
-            mapping_days = {3: 1, 4: 3}
-            days = mapping_days.get(quality, 1)
-            next_day = (datetime.now() + timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
-            new_interval = int((next_day - datetime.now()).total_seconds() // 60)
-            next_review_time = next_day
-            repetition += 1
-
-        # update the ef (easiness factor) based on quality and ensure it does not fall below 1.3
-        new_ef = ef + (0.1 - (4 - quality) * (0.08 + (4 - quality) * 0.02))
-        if new_ef < 1.3:
-            new_ef = 1.3
+        # work out the new repetition count, stability, ef and due time with the deck's scheduler
+        # (the sm-2 scheduler brings cards rated 0 - 2 back in 2, 6 or 10 minutes and others at midnight in 1 or 3 days,
+        # and keeps ef at 1.3 or more)
+        scheduler = self.get_scheduler(scheduler_name, user_id)
+        repetition, new_stability = scheduler.review(
+            quality, repetition, ef, np.nan if stability is None else stability, elapsed
+        )
+        repetition = int(repetition)
+        new_stability = None if np.isnan(new_stability) else float(new_stability)
+        new_ef = float(scheduler.next_ef(ef, quality))
+        due = int(scheduler.due_time(reviewed_at, quality, repetition, np.nan if new_stability is None else new_stability))
+        # cards due in some days are moved to the least busy day near their due date, so cards answered together
+        # are spread out rather than all due again on the same day
+        today = reviewed_at // 86400
+        if quality >= 3:
+            due = (today + histogram.fuzz(today, due // 86400 - today)) * 86400
+        histogram.move(previous_day, due // 86400)
+        next_review_time = EPOCH + timedelta(seconds=due)
+        new_interval = (due - reviewed_at) // 60
+
+        # leech detection: a rating of 0 - 2 is a failure, and a lapse if the card had been remembered before
+        # (its repetition count was above 0), and the card becomes a leech when either count reaches the user's threshold
+        failed = quality <= 2
+        lapses += 1 if failed and record and record[0] else 0
+        failure_streak = failure_streak + 1 if failed else 0
+        threshold, action = self.get_leech_settings(user_id)
+        new_leech = None
+        if not leech and (lapses >= threshold or failure_streak >= threshold):
+            leech = 1
+            suspended = 1 if action == "suspend" else suspended
+            new_leech = action
+        # suspended cards aren't counted as due, so the histogram is loaded again without them
+        if suspended:
+            self.due_histograms.pop(user_id, None)
+        # the card is put in the difficulty group nearest its new values, which moves the group a little towards it
+        cluster = None if suspended else self.add_to_difficulty_cluster(user_id, card_id, new_ef, lapses, time_taken)
 
         # format the next review time and update the spaced repetition record in the database
         next_review_str = next_review_time.strftime("%Y-%m-%d %H:%M:%S")
+        # the failure counters are written with the rest of the review, so they are never out of step with it
         self.cursor.execute("""
             UPDATE spaced_rep
-            SET repetition = ?, interval = ?, ef = ?, next_review_date = ?, time_taken = ?
+            SET repetition = ?, interval = ?, ef = ?, stability = ?, next_review_date = ?, time_taken = ?,
+                lapses = ?, failure_streak = ?, leech = ?, suspended = ?, cluster = ?
             WHERE user_id = ? AND card_id = ?
-        """, (repetition, new_interval, new_ef, next_review_str, time_taken, user_id, card_id))
+        """, (
+            repetition, new_interval, new_ef, new_stability, next_review_str, time_taken,
+            lapses, failure_streak, leech, suspended, cluster, user_id, card_id
+        ))
         self.conn.commit()
+        self.record_answer_time(user_id, card_id, time_taken)
+        self.log_review(user_id, card_id, quality, time_taken)
+        self.record_change()
+
+        # moves the card's deck to its new position in the deck index, as its average ef has changed
+        if self.deck_indexes and deck_id is not None:
+            self.update_deck_index(deck_id, added_ef=new_ef, removed_ef=ef)
+        # and moves the card to its new position in the deck's card order, without sorting the deck again
+        order = self.card_orders.get((user_id, deck_id))
+        if order is not None and card_id in order.cards:
+            card = order.cards[card_id]
+            order.update((card_id, card[1], card[2], new_ef))
         
-        # return the updated review time, repetition count, new interval, and new easiness factor
-        return next_review_time, repetition, new_interval, new_ef
+        # return the updated review time, repetition count, new interval, new easiness factor,
+        # and the leech action ("tag" or "suspend") if the card has just become a leech, otherwise None
+        return next_review_time, repetition, new_interval, new_ef, new_leech
+
+    # returns the user's (leech threshold, leech action), cached as it is needed for every answer
+    def get_leech_settings(self, user_id):
+        if user_id not in self.leech_settings:
+            self.cursor.execute("SELECT leech_threshold, leech_action FROM users WHERE user_id = ?", (user_id,))
+            row = self.cursor.fetchone()
+            self.leech_settings[user_id] = tuple(row) if row else (DEFAULT_LEECH_THRESHOLD, "tag")
+        return self.leech_settings[user_id]
+
+    # changes the user's leech threshold and action, which apply to cards failed from then on
+    def set_leech_settings(self, user_id, threshold, action):
+        self.cursor.execute(
+            "UPDATE users SET leech_threshold = ?, leech_action = ? WHERE user_id = ?", (threshold, action, user_id)
+        )
+        self.conn.commit()
+        self.leech_settings[user_id] = (threshold, action)
+
+    # returns (card_id, question, deck_name, lapses, failure_streak, suspended) for the user's leeches, most lapses first,
+    # read from the idx_spaced_rep_leeches partial index rather than the user's cards or review history
+    def get_leeches(self, user_id):
+        self.cursor.execute("""
+            SELECT c.card_id, c.question, d.deck_name, s.lapses, s.failure_streak, s.suspended
+            FROM spaced_rep s
+            JOIN cards c ON c.card_id = s.card_id
+            JOIN decks d ON d.deck_id = c.deck_id
+            WHERE s.user_id = ? AND s.leech = 1
+            ORDER BY s.lapses DESC
+        """, (user_id,))
+        return self.cursor.fetchall()
+
+    # suspends a card (leaving it out of quizzes and due counts) or brings it back
+    def set_card_suspended(self, user_id, card_id, suspended):
+        self.cursor.execute(
+            "UPDATE spaced_rep SET suspended = ? WHERE user_id = ? AND card_id = ?", (int(suspended), user_id, card_id)
+        )
+        self.conn.commit()
+        self.record_change()
+        self.due_histograms.clear()
+
+    # stops a card being a leech (e.g. after the user has rewritten it), clearing its failure counts and suspension
+    def reset_leech(self, user_id, card_id):
+        self.cursor.execute("""
+            UPDATE spaced_rep SET leech = 0, lapses = 0, failure_streak = 0, suspended = 0
+            WHERE user_id = ? AND card_id = ?
+        """, (user_id, card_id))
+        self.conn.commit()
+        self.record_change()
+        self.due_histograms.clear()
+
+    # recalculates the due dates of every reviewed card in a deck with the deck's scheduler, as if the scheduler had
+    # scheduled each card's last review, and returns the number of cards rescheduled
+    # the cards are loaded into numpy arrays and rescheduled together, then written back with a single executemany,
+    # rather than one query per card, so changing the scheduler of a large deck takes a few seconds at most
+    def reschedule_deck(self, user_id, deck_id):
+        scheduler = self.get_scheduler(self.get_deck_info(deck_id)["scheduler"], user_id)
+        # each card's last review comes from the review log, or for cards reviewed before there was a review log,
+        # from its due date and interval (and a rating of easy for day intervals, very hard otherwise)
+        self.cursor.execute("""
+            SELECT
+                s.sr_id, s.repetition, s.stability, s.interval,
+                COALESCE(r.quality, CASE WHEN s.interval >= 1440 THEN 3 ELSE 0 END),
+                COALESCE(r.reviewed_at, CAST(strftime('%s', s.next_review_date) AS INTEGER) - s.interval * 60)
+            FROM spaced_rep s
+            JOIN cards c ON c.card_id = s.card_id
+            LEFT JOIN review_log r ON r.review_id = (
+                SELECT MAX(review_id) FROM review_log WHERE user_id = s.user_id AND card_id = s.card_id
+            )
+            WHERE c.deck_id = ? AND s.user_id = ? AND s.next_review_date IS NOT NULL
+        """, (deck_id, user_id))
+        rows = self.cursor.fetchall()
+        if not rows:
+            return 0
+        sr_ids = [row[0] for row in rows]
+        # None stabilities become nan in a float array
+        values = np.array([row[1:] for row in rows], dtype=np.float64)
+        repetition = values[:, 0].astype(np.int64)
+        quality = values[:, 3].astype(np.int64)
+        reviewed_at = values[:, 4].astype(np.int64)
+        repetition, stability, due = scheduler.reschedule(reviewed_at, quality, repetition, values[:, 1], values[:, 2])
+
+        due_strings = np.char.replace(np.datetime_as_string(due.astype("datetime64[s]")), "T", " ")
+        intervals = (due - reviewed_at) // 60
+        stabilities = np.where(np.isnan(stability), None, stability)
+        self.cursor.executemany(
+            "UPDATE spaced_rep SET repetition = ?, interval = ?, stability = ?, next_review_date = ? WHERE sr_id = ?",
+            zip(repetition.tolist(), intervals.tolist(), stabilities.tolist(), due_strings.tolist(), sr_ids)
+        )
+        self.conn.commit()
+        self.record_change()
+        self.due_histograms.clear()
+        return len(rows)
+
+    # changes the scheduler a deck uses and reschedules its cards with it, returning the number of cards rescheduled
+    def set_deck_scheduler(self, deck_id, scheduler_name):
+        self.cursor.execute("UPDATE decks SET scheduler = ? WHERE deck_id = ?", (scheduler_name, deck_id))
+        self.conn.commit()
+        self.cursor.execute("SELECT user_id FROM decks WHERE deck_id = ?", (deck_id,))
+        row = self.cursor.fetchone()
+        return self.reschedule_deck(row[0], deck_id) if row else 0
 
     # commits any changes and closes the database connection
     def close(self):
@@ -1,30 +1,222 @@
-# BST means Binary Search Tree
+# AVL tree is a self-balancing BST (Binary Search Tree)
 # ef is easiness factor (determined by spaced repitition algorithm)
 class DeckNode:
-    # initialises each deck as a node with deck id, deck name, avg ef, card count, left pointer and right pointer
+    # initialises each deck as a node with deck id, deck name, avg ef, card count, left pointer, right pointer and height
+    # total_ef (the sum of the deck's card efs) is kept as well, so the average is worked out from the total each time
+    # it changes rather than from the previous average, which would drift further from the real average every update
     def __init__(self, deck_id, deck_name, avg_ef, card_count):
         self.deck_id = deck_id
         self.deck_name = deck_name
-        self.avg_ef = avg_ef  
+        self.avg_ef = avg_ef
         self.card_count = card_count
+        self.total_ef = avg_ef * card_count
         self.left = None
         self.right = None
+        self.height = 1
 
-# inserts a node into the BST based on avg ef (lower avg ef goes to left, else equal or higher avg ef goes to right)
+    # nodes are ordered by avg ef (lower avg ef goes to the left), and decks with the same avg ef are ordered by deck id
+    # using deck id as well means every key is different, so decks with equal ef (e.g. new decks at 2.5)
+    # no longer all go to the right, which made the old BST a long chain (like a linked list)
+    def key(self):
+        return (self.avg_ef, self.deck_id)
+
+
+# returns the height of a node (an empty subtree has height 0)
+def height(node):
+    return node.height if node else 0
+
+
+def update_height(node):
+    node.height = 1 + max(height(node.left), height(node.right))
+
+
+# balance is how much taller the left subtree is than the right, the tree is rebalanced if this goes above 1 or below -1
+def balance(node):
+    return height(node.left) - height(node.right)
+
+
+#     y            x
+#    / \          / \
+#   x   c  -->   a   y
+#  / \              / \
+# a   b            b   c
+def rotate_right(y):
+    x = y.left
+    y.left = x.right
+    x.right = y
+    update_height(y)
+    update_height(x)
+    return x
+
+
+# the mirror image of rotate_right
+def rotate_left(x):
+    y = x.right
+    x.right = y.left
+    y.left = x
+    update_height(x)
+    update_height(y)
+    return y
+
+
+# rotates a node after an insert or delete so that its subtrees differ in height by at most 1
+def rebalance(node):
+    update_height(node)
+    if balance(node) > 1:
+        # left-right case, the left child is right heavy so is rotated first
+        if balance(node.left) < 0:
+            node.left = rotate_left(node.left)
+        return rotate_right(node)
+    if balance(node) < -1:
+        # right-left case, the right child is left heavy so is rotated first
+        if balance(node.right) > 0:
+            node.right = rotate_right(node.right)
+        return rotate_left(node)
+    return node
+
+
+# inserts a node into the tree and returns the new root of the subtree
 def insert_node(root, node):
     if root is None:
         return node
-    if node.avg_ef < root.avg_ef:
+    if node.key() < root.key():
         root.left = insert_node(root.left, node)
     else:
         root.right = insert_node(root.right, node)
-    return root
+    return rebalance(root)
+
+
+# removes the node with the given key and returns the new root of the subtree
+def delete_node(root, key):
+    if root is None:
+        return None
+    if key < root.key():
+        root.left = delete_node(root.left, key)
+    elif key > root.key():
+        root.right = delete_node(root.right, key)
+    else:
+        # a node with one or no children is replaced by its child
+        if root.left is None:
+            return root.right
+        if root.right is None:
+            return root.left
+        # a node with two children is replaced by the smallest node in its right subtree (its in order successor)
+        successor = root.right
+        while successor.left:
+            successor = successor.left
+        root.right = delete_node(root.right, successor.key())
+        successor.left = root.left
+        successor.right = root.right
+        root = successor
+    return rebalance(root)
+
 
-# performs in order traversal of the BST, returning decks sorted by avg_ef (lowest first, e.g higher deck priority) 
+# performs in order traversal of the tree, returning decks sorted by avg_ef (lowest first, e.g higher deck priority)
+# this uses a stack instead of recursion so large numbers of decks can't hit python's recursion limit
 def in_order(root):
     nodes = []
-    if root:
-        nodes.extend(in_order(root.left))
-        nodes.append(root)
-        nodes.extend(in_order(root.right))
+    stack = []
+    node = root
+    while stack or node:
+        while node:
+            stack.append(node)
+            node = node.left
+        node = stack.pop()
+        nodes.append(node)
+        node = node.right
     return nodes
+
+
+class DeckIndex:
+    # keeps a user's decks ordered by (avg_ef, deck_id) in an AVL tree, which stays balanced so inserting,
+    # deleting and moving a deck are all O(log n), and the order is updated instead of being rebuilt every time
+    # nodes maps each deck id to its node, so a deck can be found without searching the tree
+    def __init__(self, decks=()):
+        self.root = None
+        self.nodes = {}
+        for deck_id, deck_name, avg_ef, card_count in decks:
+            self.insert(deck_id, deck_name, avg_ef, card_count)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, deck_id):
+        return deck_id in self.nodes
+
+    def __iter__(self):
+        return iter(in_order(self.root))
+
+    def get(self, deck_id):
+        return self.nodes.get(deck_id)
+
+    def insert(self, deck_id, deck_name, avg_ef, card_count):
+        node = DeckNode(deck_id, deck_name, avg_ef, card_count)
+        self.nodes[deck_id] = node
+        self.root = insert_node(self.root, node)
+        return node
+
+    def delete(self, deck_id):
+        node = self.nodes.pop(deck_id, None)
+        if node:
+            self.root = delete_node(self.root, node.key())
+
+    # moves a deck to its new position when its total ef or card count changes (e.g. after one of its cards is rated)
+    # the node is taken out, given its new average ef and put back in, rather than rebuilding the whole tree
+    # the average is rounded so the tiny float errors in the total can't move a deck across a priority band's edge
+    # (e.g. a deck of 2.5 cards to 2.4999999), and a deck with no cards has the default ef of 2.5
+    def update_key(self, deck_id, total_ef, card_count):
+        node = self.nodes.get(deck_id)
+        if node is None:
+            return
+        self.root = delete_node(self.root, node.key())
+        node.left = None
+        node.right = None
+        node.height = 1
+        node.card_count = card_count
+        node.total_ef = total_ef if card_count > 0 else 0.0
+        node.avg_ef = round(total_ef / card_count, 6) if card_count > 0 else 2.5
+        self.root = insert_node(self.root, node)
+
+    # returns decks with low <= avg_ef < high in order, where None means no limit
+    # subtrees that are completely outside the range are skipped, so this doesn't visit every deck
+    # used for the priority bands, e.g. high priority is range(None, 2.0)
+    def range(self, low=None, high=None):
+        nodes = []
+        stack = []
+        node = self.root
+        while stack or node:
+            while node:
+                stack.append(node)
+                # only go left if smaller values could still be in range
+                node = node.left if low is None or node.avg_ef >= low else None
+            node = stack.pop()
+            if high is not None and node.avg_ef >= high:
+                break
+            if low is None or node.avg_ef >= low:
+                nodes.append(node)
+            node = node.right
+        return nodes
+
+
+# returns the decks in {deck_id: parent_id} ordered from the top level down, so every deck comes after its parent
+# (decks whose parent isn't in parents count as top level)
+def top_down(parents):
+    children = {}
+    for deck_id, parent_id in parents.items():
+        children.setdefault(parent_id if parent_id in parents else None, []).append(deck_id)
+    order = list(children.get(None, []))
+    for deck_id in order:
+        order.extend(children.get(deck_id, []))
+    return order
+
+
+# adds up a count (e.g. cards due) over each deck and all its subdecks, from {deck_id: parent_id} and {deck_id: count}
+# each deck's total is added to its parent's going up from the deepest decks (top_down in reverse),
+# so every deck is visited once however deep the hierarchy is, with no query per deck
+def subtree_totals(parents, counts):
+    totals = {deck_id: counts.get(deck_id, 0) for deck_id in parents}
+    for deck_id in reversed(top_down(parents)):
+        parent_id = parents[deck_id]
+        if parent_id in totals:
+            totals[parent_id] += totals[deck_id]
+    return totals
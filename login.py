@@ -12,6 +12,8 @@ class LoginPage(ctk.CTkFrame):
     def __init__(self, master, db):
         super().__init__(master, fg_color="#FFFFFF")
         self.db = db
+        # removes the quick jump shortcut, as it should only work once logged in
+        master.unbind("<Control-k>")
         self.login_container = ctk.CTkFrame(
             self,
             fg_color="white",
@@ -130,6 +132,8 @@ class LoginPage(ctk.CTkFrame):
             # if user_id isn't returned (user does not exist in database), then an error message is shown
 
             if user_id:
+                # starts the quick jump search index and the due watcher for the user's due count badges
+                self.db.start_user_session(self.master, user_id)
                 self.master.switch_page(DecksPage, user_id=user_id, switch_page=self.master.switch_page)
             else:
                 messagebox.showerror("Login Failed", "Invalid username or password. Please try again.")
@@ -40,35 +40,28 @@ class MiscFunctions:
 
     @staticmethod
     def split(cards):
-        # this is the base case --> if the list has 0 or 1 cards, it means it is already sorted
-        if len(cards) <= 1:
-            return cards
-        # recursively splits the list, until each sublist has 1 card in it
-        mid = len(cards) // 2
-        left = MiscFunctions.split(cards[:mid])
-        right = MiscFunctions.split(cards[mid:])
-        # calls merge_sort to sort to recursively combine each left and right sublists into a single sorted list
-        return MiscFunctions.merge_sort(left, right)
-
-    @staticmethod
-    def merge_sort(left, right):
-        result = []
-        # continues to compare both lists, left and right while they both still have cards
-        # each card is a tuple, and its last element is the easiness factor (ef)
-        # lower ef means higher priority (e.g. more difficult card), so it should come first
-        while left and right:
-            if left[0][-1] < right[0][-1]: # checks which card has lower ef
-                # pops the first card from the left list and appends it to result, if this has lower ef
-                result.append(left.pop(0))
-            else:
-                # pops the first card from the right list and appends it to result, if this has lower ef
-                result.append(right.pop(0))
-        # once one list is empty, the below code adds the remaining cards from the other list to the result
-        # extend adds each item from the list individually, unlike append which would add the whole list as one element
-        if left:
-            result.extend(left)
-        else:
-            result.extend(right)
-        return result
-
-
+        # sorts cards by easiness factor (ef), lower ef means higher priority (e.g. more difficult card), so it comes first
+        # this is a bottom up merge sort: instead of recursively splitting the list into new slices,
+        # it starts with runs of 1 card, merges neighbouring runs into runs of 2, then 4, and so on until one run is left
+        # cards are merged between two lists that are only made once, so no new lists are made at each level
+        keys = [card[-1] for card in cards]  # each card is a tuple, and its last element is the ef
+        source = list(range(len(cards)))     # positions of the cards, in the order they have been sorted into so far
+        target = [0] * len(cards)
+        width = 1
+        while width < len(cards):
+            for start in range(0, len(cards), 2 * width):
+                middle = min(start + width, len(cards))
+                end = min(start + 2 * width, len(cards))
+                left, right = start, middle
+                for position in range(start, end):
+                    # <= takes from the left run when both cards have the same ef, which keeps the sort stable
+                    if left < middle and (right >= end or keys[source[left]] <= keys[source[right]]):
+                        target[position] = source[left]
+                        left += 1
+                    else:
+                        target[position] = source[right]
+                        right += 1
+            # the merged runs become the source for the next level, so the two lists swap roles
+            source, target = target, source
+            width *= 2
+        return [cards[position] for position in source]
@@ -0,0 +1,108 @@
+# external imports
+import sqlite3
+import numpy as np
+
+# my imports
+from background import report_progress
+from scheduler import FSRSScheduler
+
+# reviews needed before fitting is worth it, with fewer the defaults are kept
+MIN_REVIEWS = 50
+
+ITERATIONS = 400
+LEARNING_RATE = 0.05
+
+# stabilities are kept between about 15 minutes and 10 years
+LOG_STABILITY_RANGE = (np.log(0.01), np.log(3650))
+
+
+# loads a user's reviews as an array with a row of (card_id, quality, elapsed seconds or -1, is_correct or -1)
+# for each review, ordered by card and then by time (the order of the idx_review_log_user_card index)
+def load_reviews(conn, user_id):
+    rows = conn.execute("""
+        SELECT card_id, quality, COALESCE(elapsed, -1), COALESCE(is_correct, -1)
+        FROM review_log
+        WHERE user_id = ?
+        ORDER BY card_id, review_id
+    """, (user_id,)).fetchall()
+    return np.array(rows, dtype=np.int64).reshape(-1, 4)
+
+
+# turns the reviews into the examples the model is fitted to, one for every review that had a review of the same card
+# before it and was marked correct or incorrect, as arrays of:
+# the rating at the previous review, the number of reviews before it, the days since the previous review and
+# whether it was remembered (1 or 0)
+def training_data(reviews):
+    cards, quality, elapsed, correct = reviews.T
+    count = len(cards)
+    same_card = np.zeros(count, dtype=bool)
+    same_card[1:] = cards[1:] == cards[:-1]
+    # each review's position among its card's reviews, from where each card's reviews start
+    starts = np.flatnonzero(~same_card)
+    number = np.arange(count) - np.repeat(starts, np.diff(np.append(starts, count)))
+    usable = same_card & (elapsed >= 0) & (correct >= 0)
+    previous_quality = np.roll(quality, 1)[usable]
+    return previous_quality, number[usable], np.maximum(elapsed[usable], 1) / 86400, correct[usable]
+
+
+# the model: a card's stability (days until the chance of remembering it falls to 90%) is the stability for its last
+# rating times the number of reviews it has had to the power of growth, and the chance of remembering it t days
+# after a review is 1 / (1 + t / (9 * stability)), the forgetting curve used by FSRSScheduler
+# params is the log stability for each rating 0 - 4 followed by growth
+def predict(params, previous_quality, log_reviews, elapsed_days):
+    stability = np.exp(params[:5][previous_quality] + params[5] * log_reviews)
+    return elapsed_days / (9.0 * stability)
+
+
+# the average log likelihood of the answers (higher is better), from predict's output
+def log_likelihood(ratio, correct):
+    recall = 1.0 / (1.0 + ratio)
+    return float(np.mean(np.where(correct == 1, np.log(recall), np.log(np.maximum(1.0 - recall, 1e-12)))))
+
+
+# fits the model's parameters to the answers by gradient ascent on the log likelihood (using adam step sizes),
+# with every review handled at once by numpy in each step
+def fit(previous_quality, reviews_before, elapsed_days, correct):
+    log_reviews = np.log(reviews_before)
+    params = np.append(np.log(FSRSScheduler.DEFAULTS["initial_stability"]), 0.0)
+    starting_likelihood = log_likelihood(predict(params, previous_quality, log_reviews, elapsed_days), correct)
+    mean = np.zeros(6)
+    variance = np.zeros(6)
+    for step in range(1, ITERATIONS + 1):
+        ratio = predict(params, previous_quality, log_reviews, elapsed_days)
+        # the derivative of each answer's log likelihood with respect to its log stability
+        # works out as recall * (ratio if remembered, -1 if forgotten)
+        slope = np.where(correct == 1, ratio, -1.0) / (1.0 + ratio)
+        gradient = np.append(
+            np.bincount(previous_quality, weights=slope, minlength=5),
+            np.dot(slope, log_reviews)
+        ) / len(correct)
+        mean = 0.9 * mean + 0.1 * gradient
+        variance = 0.999 * variance + 0.001 * gradient ** 2
+        params += LEARNING_RATE * (mean / (1 - 0.9 ** step)) / (np.sqrt(variance / (1 - 0.999 ** step)) + 1e-8)
+        params[:5] = np.clip(params[:5], *LOG_STABILITY_RANGE)
+        if step % 20 == 0:
+            report_progress(step / ITERATIONS)
+    return params, starting_likelihood, log_likelihood(predict(params, previous_quality, log_reviews, elapsed_days), correct)
+
+
+# fits a user's scheduler parameters to their review history, run in a worker process by background.run_in_process
+# returns a dict with the fitted stability for each rating, growth, the number of answers used and the average
+# log likelihood before and after fitting, or None if the user hasn't got enough marked reviews yet
+def fit_user(db_name, user_id):
+    conn = sqlite3.connect(db_name)
+    try:
+        reviews = load_reviews(conn, user_id)
+    finally:
+        conn.close()
+    previous_quality, reviews_before, elapsed_days, correct = training_data(reviews)
+    if len(correct) < MIN_REVIEWS:
+        return None
+    params, before, after = fit(previous_quality, reviews_before, elapsed_days, correct)
+    return {
+        "stability": np.exp(params[:5]).tolist(),
+        "growth": float(params[5]),
+        "reviews": int(len(correct)),
+        "log_likelihood_before": before,
+        "log_likelihood_after": after
+    }
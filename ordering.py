@@ -0,0 +1,72 @@
+# external imports
+import heapq
+from bisect import bisect_left, insort
+
+
+# the default sort key for cards, each card is a tuple and its last element is the easiness factor (ef)
+def get_ef(card):
+    return card[-1]
+
+
+# returns a new list sorted by key (lowest first, so highest priority cards come first)
+# python's built in sort (timsort) is a merge sort written in c, so it is O(n log n) and stable,
+# meaning cards with equal ef stay in the order they were given
+# it is much faster than a merge sort written in python (see MiscFunctions.split and benchmark.py)
+def sort_by_ef(items, key=get_ef):
+    return sorted(items, key=key)
+
+
+# returns the k items with the lowest key in order, without sorting the whole list
+# used when only the first page of cards is needed, a heap of size k makes this O(n log k)
+# the position of each item is used as a tie breaker so the result matches the stable sort
+def top_k(items, k, key=get_ef):
+    def get_rank(pair):
+        return (key(pair[1]), pair[0])
+    return [item for _, item in heapq.nsmallest(k, enumerate(items), key=get_rank)]
+
+
+class PriorityOrder:
+    # keeps cards sorted by ef so that when one card's ef changes it can be moved to its new position,
+    # instead of sorting every card again
+    # entries are (ef, card_id) tuples in a sorted list, so equal ef cards are ordered by card_id
+    def __init__(self, cards=(), key=get_ef):
+        self.key = key
+        self.cards = {}
+        self.entries = []
+        for card in cards:
+            self.cards[card[0]] = card
+            self.entries.append((key(card), card[0]))
+        self.entries.sort()
+
+    def __len__(self):
+        return len(self.entries)
+
+    # iterates through the cards from highest priority (lowest ef) to lowest priority
+    def __iter__(self):
+        for _, card_id in self.entries:
+            yield self.cards[card_id]
+
+    # returns count cards starting from position start, e.g. for showing one page of cards
+    def page(self, start, count):
+        return [self.cards[card_id] for _, card_id in self.entries[start:start + count]]
+
+    # returns the position of a card in the order, found with a binary search
+    def position(self, card_id):
+        return bisect_left(self.entries, (self.key(self.cards[card_id]), card_id))
+
+    def add(self, card):
+        self.cards[card[0]] = card
+        insort(self.entries, (self.key(card), card[0]))
+
+    def remove(self, card_id):
+        card = self.cards.pop(card_id, None)
+        if card is None:
+            return
+        index = bisect_left(self.entries, (self.key(card), card_id))
+        del self.entries[index]
+
+    # re-ranks a single card after its ef (or any other field) changes, e.g. after it is rated in a quiz
+    # the card is found and moved with binary searches, so this is O(log n) comparisons rather than a full re-sort
+    def update(self, card):
+        self.remove(card[0])
+        self.add(card)
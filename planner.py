@@ -0,0 +1,117 @@
+# external imports
+import time
+from datetime import datetime
+import numpy as np
+
+# my imports
+from sketch import percentiles
+
+# answer time used for decks that have no answer times yet, in seconds
+DEFAULT_ANSWER_TIME = 10.0
+
+# a card's own average answer time counts as this many answers of the deck's typical time,
+# so a card answered once isn't predicted from that one answer alone
+PRIOR_ANSWERS = 2
+
+# seconds of predicted and actual time added before comparing them, so the first answer or two of a session
+# don't change the predictions too much
+CORRECTION_PRIOR = 20.0
+
+
+# predicts how long each card will take to answer from numpy arrays of each card's number of reviews
+# and average answer time (nan if never reviewed) and its deck's typical answer time
+def predict_times(reviews, average_times, deck_times):
+    own_time = np.where(reviews > 0, np.nan_to_num(average_times), 0.0)
+    return (reviews * own_time + PRIOR_ANSWERS * deck_times) / (reviews + PRIOR_ANSWERS)
+
+
+class TimeBudgetPlan:
+    # a quiz session source that picks the due cards to fit a time limit ("study for 10 minutes")
+    # every due card's answer time is predicted when the session starts (see predict_times), then cards are taken
+    # greedily by how much they are worth per second (harder and more overdue cards are worth more), skipping any that
+    # won't fit in the time left, like the greedy method for the knapsack problem
+    # the plan adapts as the session goes on: the time left is the time limit minus the real time since the session
+    # started (so cards brought back after failing are counted too), and predictions are scaled by how long
+    # answers have actually taken compared with their predictions
+    # tags is an optional tag query (see tags.py) the cards have to match
+    def __init__(self, db, user_id, deck_ids, minutes, tags=None):
+        self.db = db
+        self.user_id = user_id
+        self.budget = minutes * 60
+        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = db.get_due_card_stats(user_id, deck_ids, now_str, tags)
+        self.card_ids = [row[0] for row in rows]
+        # each card's position in card_ids, to find its prediction when it is answered
+        self.positions = {card_id: index for index, card_id in enumerate(self.card_ids)}
+
+        # each deck's typical answer time is the median from its answer time digest
+        deck_times = {}
+        for deck_id in deck_ids:
+            deck_percentiles = percentiles(db.get_answer_time_sketch(user_id, deck_id))
+            deck_times[deck_id] = deck_percentiles["p50"] if deck_percentiles else DEFAULT_ANSWER_TIME
+        # columns are the deck's typical time, ef, number of reviews and average time (nan if never reviewed)
+        stats = np.array(
+            [(deck_times[row[1]], row[3], row[4], np.nan if row[5] is None else row[5]) for row in rows],
+            dtype=np.float64
+        ).reshape(-1, 4)
+        self.predicted = predict_times(stats[:, 2], stats[:, 3], stats[:, 0])
+
+        # a card is worth more the lower its ef and the longer it has been overdue
+        due = np.array([row[2] for row in rows], dtype="datetime64[s]")
+        overdue_days = np.maximum((np.datetime64(now_str) - due).astype(np.float64), 0) / 86400
+        value = (1 + np.log1p(overdue_days)) / (np.maximum(stats[:, 1], 1.3) - 1.0)
+        # candidates are card indexes, best value per second first
+        self.order = np.argsort(-value / np.maximum(self.predicted, 1.0), kind="stable")
+        self.position = 0
+        self.predicted_total = 0.0
+        self.actual_total = 0.0
+        self.start = None
+
+        # the planned number of cards if every answer takes as long as predicted
+        times_in_order = self.predicted[self.order]
+        left = self.budget
+        self.planned = 0
+        for seconds in times_in_order:
+            if seconds <= left:
+                left -= seconds
+                self.planned += 1
+
+    def __len__(self):
+        return self.planned
+
+    # how much longer answers are taking than predicted (below 1 if they are quicker)
+    def correction(self):
+        return (self.actual_total + CORRECTION_PRIOR) / (self.predicted_total + CORRECTION_PRIOR)
+
+    # the seconds left in the session, which starts when the first card is taken
+    def time_left(self):
+        if self.start is None:
+            self.start = time.monotonic()
+        return self.budget - (time.monotonic() - self.start)
+
+    # returns the index of the next card that fits in the time left, or None when no more cards fit
+    def next_index(self):
+        left = self.time_left()
+        correction = self.correction()
+        while self.position < len(self.order):
+            index = self.order[self.position]
+            self.position += 1
+            if self.predicted[index] * correction <= left:
+                return index
+        return None
+
+    def __iter__(self):
+        while True:
+            index = self.next_index()
+            if index is None:
+                return
+            card = self.db.get_session_card(self.user_id, self.card_ids[index])
+            # the card may have been deleted since the session started
+            if card is not None:
+                yield card
+
+    # called by the quiz session after each answer with the seconds it took, to correct the predictions
+    def record(self, card, was_correct, seconds):
+        if card[0] in self.positions:
+            self.predicted_total += self.predicted[self.positions[card[0]]]
+            self.actual_total += seconds
@@ -0,0 +1,194 @@
+# external imports
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+
+# review times are stored as whole seconds since 1970-01-01 in local time (not utc), so the day and hour of a review
+# can be worked out with integer division, the same as the local times shown everywhere else in the app
+EPOCH = datetime(1970, 1, 1)
+
+# retention is grouped by how long it had been since the card's previous review, as (label, start in seconds)
+INTERVAL_BUCKETS = [
+    ("< 1 hour", 0),
+    ("1 hour - 1 day", 3600),
+    ("1 - 3 days", 86400),
+    ("3 - 7 days", 3 * 86400),
+    ("1 - 2 weeks", 7 * 86400),
+    ("2 weeks - 1 month", 14 * 86400),
+    ("> 1 month", 30 * 86400),
+]
+BUCKET_STARTS = np.array([start for _, start in INTERVAL_BUCKETS], dtype=np.int64)
+
+# number of days shown in the activity heatmap
+HEATMAP_DAYS = 365
+
+# reviews that haven't been marked correct or incorrect are checked again on the next refresh for this long,
+# as correctness is marked just after the card is rated, and older unmarked reviews were abandoned
+PENDING_SECONDS = 86400
+
+
+# converts a datetime into the local seconds stored in review_log
+def local_timestamp(moment):
+    return int((moment - EPOCH).total_seconds())
+
+
+# turns a comma separated string from group_concat into an array of integers
+def to_array(text):
+    if not text:
+        return np.zeros(0, dtype=np.int64)
+    return np.fromstring(text, dtype=np.int64, sep=",")
+
+
+class RetentionEngine:
+    # works out a user's retention by interval, accuracy by hour of day and daily activity from their review history
+    # the history is loaded into numpy arrays and counted with vectorised operations (np.bincount) rather than
+    # looping over reviews in python, and the counts are kept between refreshes,
+    # so each refresh only loads the reviews added since the last one (tracked by last_review_id)
+    def __init__(self, user_id):
+        self.user_id = user_id
+        # refreshes run on a background thread, so the lock stops two refreshes changing the counts at once
+        self.lock = threading.Lock()
+        self.last_review_id = 0
+        self.bucket_total = np.zeros(len(INTERVAL_BUCKETS), dtype=np.int64)
+        self.bucket_correct = np.zeros(len(INTERVAL_BUCKETS), dtype=np.int64)
+        self.hour_total = np.zeros(24, dtype=np.int64)
+        self.hour_correct = np.zeros(24, dtype=np.int64)
+        # day_counts[i] is the number of reviews on day first_day + i (days since EPOCH)
+        self.first_day = None
+        self.day_counts = np.zeros(0, dtype=np.int64)
+        # reviews loaded before they were marked correct or incorrect, as arrays of review ids, times and elapsed times
+        self.pending_ids = np.zeros(0, dtype=np.int64)
+        self.pending_times = np.zeros(0, dtype=np.int64)
+        self.pending_elapsed = np.zeros(0, dtype=np.int64)
+
+    # loads the reviews with review_id > after_id, returning the newest review_id and arrays of review times,
+    # elapsed times and correctness (elapsed is -1 for a card's first review and correctness is -1 if it wasn't marked)
+    # group_concat returns each column as one string which numpy parses in one go, this is much faster than sqlite3
+    # building a python tuple for each of a million rows, and correctness is packed into the review time
+    # (time * 3 + correctness + 1) so there are fewer numbers to convert
+    def load(self, conn, after_id):
+        row = conn.execute("""
+            SELECT
+                MAX(review_id),
+                group_concat(reviewed_at * 3 + COALESCE(is_correct, -1) + 1),
+                group_concat(COALESCE(elapsed, -1))
+            FROM review_log
+            WHERE user_id = ? AND review_id > ?
+        """, (self.user_id, after_id)).fetchone()
+        packed = to_array(row[1])
+        return row[0], packed // 3, to_array(row[2]), packed % 3 - 1
+
+    # adds marked reviews to the retention and hour of day counts
+    def count_correctness(self, times, elapsed, correct):
+        hours = (times % 86400) // 3600
+        self.hour_total += np.bincount(hours, minlength=24)
+        self.hour_correct += np.bincount(hours, weights=correct, minlength=24).astype(np.int64)
+
+        # first reviews have no previous review, so they aren't part of retention
+        has_interval = elapsed >= 0
+        buckets = np.searchsorted(BUCKET_STARTS, elapsed[has_interval], side="right") - 1
+        self.bucket_total += np.bincount(buckets, minlength=len(INTERVAL_BUCKETS))
+        self.bucket_correct += np.bincount(buckets, weights=correct[has_interval], minlength=len(INTERVAL_BUCKETS)).astype(np.int64)
+
+    # adds reviews to the daily activity counts, growing the array when reviews are on new days
+    def count_days(self, times):
+        days = times // 86400
+        lowest = int(days.min())
+        if self.first_day is None:
+            self.first_day = lowest
+        elif lowest < self.first_day:
+            # only happens if the clock was moved back a day or more
+            self.day_counts = np.concatenate([np.zeros(self.first_day - lowest, dtype=np.int64), self.day_counts])
+            self.first_day = lowest
+        counts = np.bincount(days - self.first_day)
+        if len(counts) > len(self.day_counts):
+            self.day_counts = np.concatenate([self.day_counts, np.zeros(len(counts) - len(self.day_counts), dtype=np.int64)])
+        self.day_counts[:len(counts)] += counts
+
+    # brings the counts up to date with the database and returns the results
+    def refresh(self, conn, now=None):
+        with self.lock:
+            now = local_timestamp(now or datetime.now())
+            # a read transaction makes every query below see the database at the same moment,
+            # so a review can't be marked in between loading it and checking if it is pending
+            conn.execute("BEGIN")
+            try:
+                # pending reviews that have been marked since the last refresh are counted now
+                if len(self.pending_ids):
+                    marked_rows = conn.execute("""
+                        SELECT review_id, is_correct
+                        FROM review_log
+                        WHERE user_id = ? AND review_id BETWEEN ? AND ? AND is_correct IS NOT NULL
+                        ORDER BY review_id
+                    """, (self.user_id, int(self.pending_ids[0]), self.last_review_id)).fetchall()
+                    ids = np.array([row[0] for row in marked_rows], dtype=np.int64)
+                    correct = np.array([row[1] for row in marked_rows], dtype=np.int64)
+                    marked = np.isin(self.pending_ids, ids)
+                    if marked.any():
+                        # both id arrays are sorted, so each marked review's position can be found with a binary search
+                        marked_correct = correct[np.searchsorted(ids, self.pending_ids[marked])]
+                        self.count_correctness(self.pending_times[marked], self.pending_elapsed[marked], marked_correct)
+                    self.keep_pending(~marked, now)
+
+                newest_id, times, elapsed, correct = self.load(conn, self.last_review_id)
+                if newest_id is not None:
+                    self.count_days(times)
+                    known = correct >= 0
+                    self.count_correctness(times[known], elapsed[known], correct[known])
+
+                    # recent unmarked reviews are found with the idx_review_log_unmarked partial index
+                    pending_rows = conn.execute("""
+                        SELECT review_id, reviewed_at, COALESCE(elapsed, -1)
+                        FROM review_log
+                        WHERE user_id = ? AND is_correct IS NULL AND reviewed_at >= ?
+                        ORDER BY review_id
+                    """, (self.user_id, now - PENDING_SECONDS)).fetchall()
+                    new_pending = np.array(pending_rows, dtype=np.int64).reshape(-1, 3)
+                    # only the reviews just loaded are added, older ones are already pending
+                    new_pending = new_pending[new_pending[:, 0] > self.last_review_id]
+                    self.pending_ids = np.concatenate([self.pending_ids, new_pending[:, 0]])
+                    self.pending_times = np.concatenate([self.pending_times, new_pending[:, 1]])
+                    self.pending_elapsed = np.concatenate([self.pending_elapsed, new_pending[:, 2]])
+                    self.last_review_id = newest_id
+            finally:
+                conn.rollback()
+            return self.results(now)
+
+    # keeps the pending reviews selected by mask that are recent enough to still be marked
+    def keep_pending(self, mask, now):
+        mask = mask & (self.pending_times >= now - PENDING_SECONDS)
+        self.pending_ids = self.pending_ids[mask]
+        self.pending_times = self.pending_times[mask]
+        self.pending_elapsed = self.pending_elapsed[mask]
+
+    # returns a dict with:
+    # retention: (label, reviews, percentage correct or None) for each interval bucket
+    # hour_accuracy: (reviews, percentage correct or None) for each hour of the day, 0 to 23
+    # heatmap_start: the date of the first day in the heatmap, and heatmap: the number of reviews on each day up to today
+    # total_reviews: the number of reviews logged
+    def results(self, now):
+        def rates(correct, total):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                percentages = np.where(total > 0, correct * 100.0 / np.maximum(total, 1), np.nan)
+            return [None if np.isnan(value) else float(value) for value in percentages]
+
+        # the heatmap is the last HEATMAP_DAYS days ending today, taken out of the day counts
+        today = now // 86400
+        start = today - HEATMAP_DAYS + 1
+        heatmap = np.zeros(HEATMAP_DAYS, dtype=np.int64)
+        if self.first_day is not None:
+            low = max(start, self.first_day)
+            high = min(today + 1, self.first_day + len(self.day_counts))
+            if low < high:
+                heatmap[low - start:high - start] = self.day_counts[low - self.first_day:high - self.first_day]
+
+        return {
+            "retention": [
+                (label, int(total), rate)
+                for (label, _), total, rate in zip(INTERVAL_BUCKETS, self.bucket_total, rates(self.bucket_correct, self.bucket_total))
+            ],
+            "hour_accuracy": list(zip(self.hour_total.tolist(), rates(self.hour_correct, self.hour_total))),
+            "heatmap_start": (EPOCH + timedelta(days=int(start))).date(),
+            "heatmap": heatmap.tolist(),
+            "total_reviews": int(self.day_counts.sum())
+        }
@@ -0,0 +1,147 @@
+# external imports
+import math
+import random
+from itertools import islice
+import numpy as np
+
+# in cram mode a card whose last answer was marked incorrect is this many times more likely to come up
+FAILED_WEIGHT = 3.0
+
+# while cards have been failed in a cram session, this share of the cards shown are picked from them
+SESSION_FAILED_SHARE = 0.3
+
+
+# returns how likely each card is to be picked in cram mode, from numpy arrays of ef values and whether
+# each card's last answer was incorrect (0 or 1)
+# cards with a low ef (the ones the user finds hard) come up more often, a card at the 1.3 minimum
+# is about 5 times as likely as a new card at 2.5
+def cram_weights(efs, failed):
+    return 1.0 / (np.maximum(efs, 1.3) - 1.0) * np.where(failed > 0, FAILED_WEIGHT, 1.0)
+
+
+class AliasTable:
+    # picks random indexes with probability proportional to their weights, using walker's alias method
+    # building the table takes one pass over the weights, and then each pick is one random index and one
+    # random number, no matter how many weights there are (rather than a search through the cumulative weights)
+    # every slot in the table holds the probability of keeping its own index and an alias index to use otherwise,
+    # built by topping up each slot that is below the average weight with part of a slot that is above it
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        count = len(weights)
+        scaled = (weights * count / weights.sum()).tolist()
+        self.probability = [1.0] * count
+        self.alias = list(range(count))
+        small = [index for index in range(count) if scaled[index] < 1.0]
+        large = [index for index in range(count) if scaled[index] >= 1.0]
+        while small and large:
+            low = small.pop()
+            high = large.pop()
+            self.probability[low] = scaled[low]
+            self.alias[low] = high
+            # the part of the large slot used to fill up the small one is taken off it
+            scaled[high] += scaled[low] - 1.0
+            if scaled[high] < 1.0:
+                small.append(high)
+            else:
+                large.append(high)
+        # anything left over is (apart from rounding errors) exactly the average, so always keeps its own index
+
+    def __len__(self):
+        return len(self.alias)
+
+    def sample(self, rng=random):
+        index = rng.randrange(len(self.alias))
+        if rng.random() < self.probability[index]:
+            return index
+        return self.alias[index]
+
+
+class CramSampler:
+    # an endless stream of cards from some decks for cram (practice) mode, picked at random weighted by
+    # cram_weights instead of in due order, for drilling a deck whatever its schedule
+    # only the card ids and weights are loaded when the session starts, the alias table is built from them once,
+    # and each card's question and answer are loaded when it is picked, so large decks start straight away
+    # cards failed during the session are kept in a separate list and picked from SESSION_FAILED_SHARE of the time
+    # until they are answered correctly, so the table never has to be rebuilt after an answer
+    # tags is an optional tag query (see tags.py) the cards have to match
+    def __init__(self, db, user_id, deck_ids, rng=None, tags=None):
+        self.db = db
+        self.user_id = user_id
+        self.rng = rng or random.Random()
+        rows = db.get_cram_weights(user_id, deck_ids, tags)
+        self.card_ids = [row[0] for row in rows]
+        self.table = None
+        if rows:
+            values = np.array([row[1:] for row in rows], dtype=np.float64)
+            self.table = AliasTable(cram_weights(values[:, 0], values[:, 1]))
+        # failed cards are a list (to pick from) and a dict of their positions in it (to remove them quickly)
+        self.failed = []
+        self.failed_positions = {}
+        self.last_card_id = None
+
+    # returns the id of the next card, avoiding showing the same card twice in a row when possible
+    def draw(self):
+        for _ in range(5):
+            if self.failed and self.rng.random() < SESSION_FAILED_SHARE:
+                card_id = self.rng.choice(self.failed)
+            else:
+                card_id = self.card_ids[self.table.sample(self.rng)]
+            if card_id != self.last_card_id:
+                break
+        self.last_card_id = card_id
+        return card_id
+
+    def __iter__(self):
+        if self.table is None:
+            return
+        while True:
+            card = self.db.get_session_card(self.user_id, self.draw())
+            # the card may have been deleted since the session started
+            if card is not None:
+                yield card
+
+    # called by the quiz session after each answer, moves the card into or out of the failed list
+    def record(self, card, was_correct, seconds):
+        card_id = card[0]
+        if not was_correct and card_id not in self.failed_positions:
+            self.failed_positions[card_id] = len(self.failed)
+            self.failed.append(card_id)
+        elif was_correct and card_id in self.failed_positions:
+            # the last card in the list takes the removed card's place
+            position = self.failed_positions.pop(card_id)
+            last = self.failed.pop()
+            if last != card_id:
+                self.failed[position] = last
+                self.failed_positions[last] = position
+
+
+# picks k items uniformly at random from an iterable of unknown length in one pass, keeping only k items in memory
+# (reservoir sampling, algorithm l): after the first k items, the number of items to skip before the next one
+# replaces a random item in the reservoir is worked out directly, so most items are skipped by islice without
+# any python code running for them
+def reservoir_sample(items, k, rng=random):
+    items = iter(items)
+    reservoir = list(islice(items, k))
+    if len(reservoir) < k or k == 0:
+        return reservoir
+    # 1 - random() is never 0, so it is safe to take the log of
+    w = math.exp(math.log(1.0 - rng.random()) / k)
+    while True:
+        skip = int(math.log(1.0 - rng.random()) / math.log(1 - w))
+        chosen = next(islice(items, skip, None), None)
+        if chosen is None:
+            return reservoir
+        reservoir[rng.randrange(k)] = chosen
+        w *= math.exp(math.log(1.0 - rng.random()) / k)
+
+
+# returns k cards picked at random from some decks (optionally only cards with a priority of "high", "medium" or "low",
+# or matching a tag query, see tags.py)
+# as a list of (card_id, question, answer, due, deck_id) tuples in random order, which can be used as a quiz session's source
+# only the card ids are streamed through the reservoir, then the chosen cards are loaded in one query
+def random_cards(db, user_id, deck_ids, k, priority=None, rng=None, tags=None):
+    rng = rng or random.Random()
+    rows = reservoir_sample(db.iter_card_ids(user_id, deck_ids, priority, tags), k, rng)
+    cards = db.get_session_cards(user_id, [row[0] for row in rows])
+    rng.shuffle(cards)
+    return cards
@@ -0,0 +1,194 @@
+# external imports
+from abc import ABC, abstractmethod
+import numpy as np
+
+# share of a day interval that a due date can be moved by to even out the number of cards due each day,
+# intervals of a day or two can still move by a day
+FUZZ_SHARE = 0.15
+
+
+class Scheduler(ABC):
+    # a scheduler decides when a card is next reviewed after it is rated 0 (very hard) to 4 (very easy)
+    # every method works on numpy arrays (one value per card) as well as on single numbers, so the same code
+    # schedules one card after an answer (Database.update_spaced_rep) and a whole deck at once (Database.reschedule_deck)
+    # times are local seconds since 1970 (see retention.local_timestamp), cards rated 0 - 2 come back after a few minutes
+    # and other ratings give an interval in days, which ends at midnight
+    # params can replace any of the DEFAULTS, e.g. with values fitted to the user's own reviews
+    name = None
+    label = None
+    DEFAULTS = {
+        # minutes until a card rated 0, 1 or 2 comes back
+        "minutes": (2, 6, 10),
+        # the easiness factor update, ef + (base - (4 - quality) * (linear + (4 - quality) * quadratic)), and its minimum
+        "ef_base": 0.1,
+        "ef_linear": 0.08,
+        "ef_quadratic": 0.02,
+        "ef_floor": 1.3
+    }
+
+    def __init__(self, params=None):
+        self.params = dict(self.DEFAULTS)
+        if params:
+            self.params.update(params)
+
+    # returns the params to use for a user from the model fitted to their reviews (see optimizer.py), where
+    # fit["stability"][quality] is the number of days until a card rated quality falls to a 90% chance of being remembered
+    @staticmethod
+    def fitted_params(fit):
+        return {}
+
+    # the number of days to wait for a stability, so cards are due when they reach a 90% chance of being remembered
+    @staticmethod
+    def days_for(stability):
+        return max(1, round(stability))
+
+    # returns the new easiness factor, every scheduler keeps it up to date as it is used for the priority labels
+    def next_ef(self, ef, quality):
+        params = self.params
+        change = params["ef_base"] - (4 - quality) * (params["ef_linear"] + (4 - quality) * params["ef_quadratic"])
+        return np.maximum(ef + change, params["ef_floor"])
+
+    # returns the card's new (repetition, stability) after a review
+    # elapsed is the number of days since the card's previous review, stability is nan if the scheduler hasn't set it
+    @abstractmethod
+    def review(self, quality, repetition, ef, stability, elapsed):
+        pass
+
+    # returns the number of days until a card rated 3 or 4 is next due, from its state after the review
+    @abstractmethod
+    def interval_days(self, quality, repetition, stability):
+        pass
+
+    # returns when a card reviewed at reviewed_at is next due, from its rating and state after the review
+    def due_time(self, reviewed_at, quality, repetition, stability):
+        minutes = np.take(np.asarray(self.params["minutes"], dtype=np.int64), quality, mode="clip")
+        days = np.asarray(self.interval_days(quality, repetition, stability), dtype=np.int64)
+        return np.where(quality <= 2, reviewed_at + minutes * 60, (reviewed_at // 86400 + days) * 86400)
+
+    # returns (repetition, stability, due time) for cards already reviewed under another scheduler, as if their
+    # last review had been scheduled by this one, used when a deck changes scheduler
+    def reschedule(self, reviewed_at, quality, repetition, stability, interval):
+        return repetition, stability, self.due_time(reviewed_at, quality, repetition, stability)
+
+
+class SM2Scheduler(Scheduler):
+    # the original scheduler: a fixed number of days for easy (1) and very easy (3) ratings,
+    # with the repetition count going back to 0 when a card is rated 0 - 2
+    name = "sm2"
+    label = "SM-2"
+    DEFAULTS = dict(Scheduler.DEFAULTS, days=(1, 3))
+
+    @staticmethod
+    def fitted_params(fit):
+        return {"days": (Scheduler.days_for(fit["stability"][3]), Scheduler.days_for(fit["stability"][4]))}
+
+    def review(self, quality, repetition, ef, stability, elapsed):
+        return np.where(quality <= 2, 0, repetition + 1), stability
+
+    def interval_days(self, quality, repetition, stability):
+        return np.take(np.asarray(self.params["days"], dtype=np.int64), quality - 3, mode="clip")
+
+
+class LeitnerScheduler(Scheduler):
+    # cards move up a box each time they are remembered (two for very easy) and back to box 0 when they aren't,
+    # and the interval doubles with each box: 1, 2, 4, 8 ... days
+    # the box is stored as the repetition count
+    name = "leitner"
+    label = "Leitner"
+    DEFAULTS = dict(Scheduler.DEFAULTS, first_days=1, boxes=7)
+
+    @staticmethod
+    def fitted_params(fit):
+        return {"first_days": Scheduler.days_for(fit["stability"][3])}
+
+    def review(self, quality, repetition, ef, stability, elapsed):
+        moved_up = np.minimum(repetition + np.where(quality == 4, 2, 1), self.params["boxes"])
+        return np.where(quality <= 2, 0, moved_up), stability
+
+    def interval_days(self, quality, repetition, stability):
+        box = np.clip(repetition, 1, self.params["boxes"])
+        return self.params["first_days"] * 2 ** (box - 1)
+
+
+class FSRSScheduler(Scheduler):
+    # an fsrs-style scheduler, which keeps each card's stability: the number of days until the chance of remembering
+    # it falls to 90%, and schedules it for when the chance falls to desired_retention
+    # remembering a card increases its stability, by more when the card is easy (high ef) and when it was nearly
+    # forgotten (a long time since the last review), and forgetting it cuts its stability
+    name = "fsrs"
+    label = "FSRS"
+    DEFAULTS = dict(
+        Scheduler.DEFAULTS,
+        # stability after a card's first review, for each rating
+        initial_stability=(0.3, 0.6, 1.2, 3.0, 8.0),
+        growth=1.5,
+        stability_decay=0.2,
+        recall_weight=1.0,
+        lapse=0.3,
+        easy_bonus=1.3,
+        desired_retention=0.9
+    )
+
+    @staticmethod
+    def fitted_params(fit):
+        return {"initial_stability": tuple(fit["stability"])}
+
+    # the chance of remembering a card elapsed days after its last review
+    @staticmethod
+    def retrievability(elapsed, stability):
+        return 1.0 / (1.0 + elapsed / (9.0 * stability))
+
+    def review(self, quality, repetition, ef, stability, elapsed):
+        params = self.params
+        initial = np.take(np.asarray(params["initial_stability"], dtype=np.float64), quality, mode="clip")
+        # difficulty goes from 1 (easiest) to 10 (hardest) and is worked out from ef, as ef changes with every rating
+        difficulty = np.clip(10.0 - (ef - 1.3) * 4.5, 1.0, 10.0)
+        unknown = np.isnan(stability)
+        known = np.where(unknown, 1.0, stability)
+        recall = self.retrievability(np.maximum(elapsed, 0.0), known)
+        growth = (
+            np.exp(params["growth"]) * (11.0 - difficulty) * known ** -params["stability_decay"]
+            * (np.exp(params["recall_weight"] * (1.0 - recall)) - 1.0)
+        )
+        remembered = known * (1.0 + growth * np.where(quality == 4, params["easy_bonus"], 1.0))
+        forgotten = np.maximum(known * params["lapse"], 0.1)
+        new_stability = np.where(unknown, initial, np.where(quality <= 2, forgotten, remembered))
+        return np.where(quality <= 2, 0, repetition + 1), new_stability
+
+    def interval_days(self, quality, repetition, stability):
+        stability = np.nan_to_num(stability, nan=1.0)
+        days = 9.0 * stability * (1.0 / self.params["desired_retention"] - 1.0)
+        return np.maximum(np.round(days), 1)
+
+    # cards that have never had a stability get one from their current interval (how long they were expected to be
+    # remembered for), or the first review stability for their rating if that is longer
+    def reschedule(self, reviewed_at, quality, repetition, stability, interval):
+        initial = np.take(np.asarray(self.params["initial_stability"], dtype=np.float64), quality, mode="clip")
+        stability = np.where(np.isnan(stability), np.maximum(interval / 1440.0, initial), stability)
+        return repetition, stability, self.due_time(reviewed_at, quality, repetition, stability)
+
+
+# the schedulers a deck can use, by name
+SCHEDULERS = {scheduler.name: scheduler for scheduler in (SM2Scheduler, LeitnerScheduler, FSRSScheduler)}
+
+
+class DueHistogram:
+    # the number of a user's cards due on each day, days being local seconds since 1970 // 86400 (see due_time)
+    # it is loaded once and then kept up to date as cards are answered (see Database.update_spaced_rep), so picking
+    # a due date doesn't need a query for every answer
+    def __init__(self, counts):
+        self.counts = dict(counts)
+
+    # moves a card from the day it was due on (None if it had no due date) to its new day
+    def move(self, old_day, new_day):
+        if old_day is not None and self.counts.get(old_day, 0) > 0:
+            self.counts[old_day] -= 1
+        self.counts[new_day] = self.counts.get(new_day, 0) + 1
+
+    # returns the number of days to wait instead of days, from the days within FUZZ_SHARE of it, picking the one with
+    # the fewest cards due (and the one closest to days when there is a tie), so cards studied together don't all
+    # come back on the same day
+    def fuzz(self, today, days):
+        spread = max(1, round(days * FUZZ_SHARE))
+        candidates = range(max(1, days - spread), days + spread + 1)
+        return min(candidates, key=lambda candidate: (self.counts.get(today + candidate, 0), abs(candidate - days)))
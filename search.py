@@ -0,0 +1,229 @@
+# external imports
+import re
+import sqlite3
+import threading
+from heapq import nsmallest
+from itertools import islice
+from bisect import bisect_left, insort
+from math import ceil
+
+
+# splits text into lowercase words, treating anything that isn't a letter or number as a separator
+# [^\W_]+ is a regular expression matching one or more letters or digits in a row
+def tokenise(text):
+    return re.findall(r"[^\W_]+", text.lower())
+
+
+# returns the set of trigrams (3 character chunks) for some text
+# each word is padded with spaces so the start and end of words get their own trigrams,
+# e.g. "ram" becomes "  ram " which gives "  r", " ra", "ram", "am "
+def trigrams(text):
+    grams = set()
+    for word in tokenise(text):
+        padded = f"  {word} "
+        for x in range(len(padded) - 2):
+            grams.add(padded[x:x + 3])
+    return grams
+
+
+class SearchIndex:
+    # initialises an empty index for one user
+    # documents are decks and cards, each keyed by a tuple like ("deck", deck_id) or ("card", card_id)
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.documents = {}     # key -> (text, deck_id)
+        self.doc_grams = {}     # key -> set of trigrams in that document's text
+        self.doc_words = {}     # key -> set of words in that document's text
+        self.postings = {}      # trigram -> set of keys whose text contains that trigram
+        self.words = []         # sorted list of (word, key) used for prefix matching on short queries
+        self.deck_cards = {}    # deck_id -> set of card keys, so deleting a deck also removes its cards
+        # the lock stops the background build thread and the main (ui) thread changing the index at the same time
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        # changes made by the app while the index is still being built are stored here and replayed afterwards,
+        # otherwise a card deleted during the build could be added back from the build's older snapshot
+        self.pending = []
+
+    # builds the index on a background thread so logging in isn't slowed down
+    # a separate sqlite connection is used because sqlite connections can't be shared between threads
+    def build_in_background(self, db_name):
+        thread = threading.Thread(target=self.build, args=(db_name,), daemon=True)
+        thread.start()
+        return thread
+
+    def build(self, db_name):
+        conn = sqlite3.connect(db_name)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT deck_id, deck_name FROM decks WHERE user_id = ?", (self.user_id,))
+            with self.lock:
+                for deck_id, deck_name in cursor.fetchall():
+                    self._add(("deck", deck_id), deck_name, deck_id)
+
+            cursor.execute("""
+                SELECT c.card_id, c.deck_id, c.question, c.answer
+                FROM cards c
+                JOIN decks d ON c.deck_id = d.deck_id
+                WHERE d.user_id = ?
+            """, (self.user_id,))
+            # cards are added in batches so the lock is released regularly and searches aren't blocked for long
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                with self.lock:
+                    for card_id, deck_id, question, answer in rows:
+                        self._add(("card", card_id), f"{question} {answer}", deck_id, display=question, bulk=True)
+        finally:
+            conn.close()
+
+        # replays any changes that happened while the build was running and then marks the index as ready
+        with self.lock:
+            # during the build words were appended unsorted (inserting each one in order is far slower), so sort once now
+            self.words.sort()
+            for method, args in self.pending:
+                method(*args)
+            self.pending = []
+            self.ready.set()
+
+    # public methods used by the database class to keep the index in sync when decks or cards change
+    def add_deck(self, deck_id, deck_name):
+        self._apply(self._add, ("deck", deck_id), deck_name, deck_id)
+
+    def add_card(self, card_id, deck_id, question, answer):
+        self._apply(self._add, ("card", card_id), f"{question} {answer}", deck_id, question)
+
+    def remove_card(self, card_id):
+        self._apply(self._remove, ("card", card_id))
+
+    def remove_deck(self, deck_id):
+        self._apply(self._remove_deck, deck_id)
+
+    # runs a change straight away if the index is ready, otherwise queues it for after the build
+    def _apply(self, method, *args):
+        with self.lock:
+            if self.ready.is_set():
+                method(*args)
+            else:
+                self.pending.append((method, args))
+
+    def _add(self, key, text, deck_id, display=None, bulk=False):
+        # remove the old version first, so adding an existing key works as an update
+        if key in self.documents:
+            self._remove(key)
+        grams = trigrams(text)
+        self.documents[key] = (display if display is not None else text, deck_id)
+        self.doc_grams[key] = grams
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(key)
+        self.doc_words[key] = set(tokenise(text))
+        for word in self.doc_words[key]:
+            if bulk:
+                self.words.append((word, key))
+            else:
+                insort(self.words, (word, key))
+        if key[0] == "card":
+            self.deck_cards.setdefault(deck_id, set()).add(key)
+
+    def _remove(self, key):
+        if key not in self.documents:
+            return
+        _, deck_id = self.documents.pop(key)
+        for gram in self.doc_grams.pop(key):
+            keys = self.postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[gram]
+        # each (word, key) entry is found with a binary search instead of scanning the whole list
+        for word in self.doc_words.pop(key):
+            index = bisect_left(self.words, (word, key))
+            if index < len(self.words) and self.words[index] == (word, key):
+                del self.words[index]
+        if key[0] == "card" and deck_id in self.deck_cards:
+            self.deck_cards[deck_id].discard(key)
+
+    def _remove_deck(self, deck_id):
+        self._remove(("deck", deck_id))
+        for key in list(self.deck_cards.pop(deck_id, set())):
+            self._remove(key)
+
+    # returns up to limit results as (kind, id, text, deck_id), best matches first
+    def search(self, query, limit=10):
+        query = query.strip().lower()
+        if not query:
+            return []
+        with self.lock:
+            query_grams = trigrams(query)
+            # queries shorter than 3 characters don't have useful trigrams, so match word prefixes instead
+            if len(query.replace(" ", "")) < 3:
+                scored = self._prefix_matches(query, limit * 4)
+            else:
+                scored = self._trigram_matches(query, query_grams)
+
+            results = []
+            for key, score in scored.items():
+                text, deck_id = self.documents[key]
+                # exact substring matches are boosted above fuzzy matches, and decks above cards
+                if query in text.lower():
+                    score += 1
+                if key[0] == "deck":
+                    score += 0.1
+                results.append((score, key, text, deck_id))
+
+        # picks the best results by score, highest first, using the key to keep the order the same between keystrokes
+        # nsmallest avoids sorting every candidate when only the top few are shown
+        def get_rank(result):
+            return (-result[0], result[1])
+        best = nsmallest(limit, results, key=get_rank)
+        return [(key[0], key[1], text, deck_id) for _, key, text, deck_id in best]
+
+    def _prefix_matches(self, query, limit):
+        scored = {}
+        words = tokenise(query)
+        prefix = words[-1] if words else query
+        index = bisect_left(self.words, (prefix,))
+        while index < len(self.words) and len(scored) < limit:
+            word, key = self.words[index]
+            if not word.startswith(prefix):
+                break
+            scored[key] = len(prefix) / len(word)
+            index += 1
+        return scored
+
+    # finds documents sharing at least half of the query's trigrams, which allows for small typos
+    def _trigram_matches(self, query, query_grams, threshold=0.5, max_candidates=2000):
+        if not query_grams:
+            return {}
+
+        def get_posting_size(gram):
+            return len(self.postings.get(gram, ()))
+        ordered = sorted(query_grams, key=get_posting_size)
+
+        # first tries documents containing every trigram, found by intersecting the sets (which python does quickly)
+        # if there are enough of these there is no need to look for fuzzy (typo) matches at all
+        exact = set(self.postings.get(ordered[0], ()))
+        for gram in ordered[1:]:
+            if not exact:
+                break
+            exact &= self.postings.get(gram, set())
+        if len(exact) >= max_candidates // 100:
+            return {key: 1.0 for key in islice(exact, max_candidates)}
+
+        # any document sharing "needed" trigrams must contain at least one of the
+        # (total - needed + 1) rarest trigrams, so only those posting lists are read (prefix filtering)
+        # this keeps very common trigrams like " th" from making every keystroke scan the whole collection
+        needed = max(1, ceil(len(query_grams) * threshold))
+        candidates = set()
+        for gram in ordered[:len(ordered) - needed + 1]:
+            candidates.update(islice(self.postings.get(gram, ()), max_candidates - len(candidates)))
+            # stops collecting once there are enough candidates, so very vague queries still finish quickly
+            if len(candidates) >= max_candidates:
+                break
+
+        scored = {}
+        for key in candidates:
+            shared = len(query_grams & self.doc_grams[key])
+            if shared >= needed:
+                scored[key] = shared / len(query_grams)
+        return scored
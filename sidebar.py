@@ -3,6 +3,12 @@ import customtkinter as ctk
 from tkinter import messagebox
 from PIL import Image
 
+# my imports
+from graph import subtree_totals
+
+# pixels each level of subdecks is indented by in the sidebar
+DECK_INDENT = 14
+
 class Sidebar(ctk.CTkFrame):
     # initialises the sidebar as a subclass of CTkFrame (inheritance)
     # CTkFrame is allows sidebar to be a widget on the screen
@@ -12,6 +18,18 @@ class Sidebar(ctk.CTkFrame):
         self.switch_page = switch_page
         self.user_id = user_id
         self.db = db
+        # the due count badges, kept so they can be changed when cards become due (see watcher.py)
+        self.quiz_button = None
+        self.quiz_badge = None
+        self.deck_rows = {}
+        self.deck_badges = {}
+        self.shown_due_counts = {}
+        # the deck hierarchy, loaded with the deck list: each deck's parent, and each deck's subdecks (in deck list order)
+        # only the rows of top level decks and the subdecks of expanded decks are made
+        self.deck_parents = {}
+        self.deck_children = {}
+        self.expanded_decks = set()
+        self.deck_arrows = {}
         show_decks = True # show decks is true by default so the sidebar always shows all the decks the user has
 
         self.right_border = ctk.CTkFrame(self, width=1, fg_color="#E5E7EB", corner_radius=0)
@@ -31,6 +49,18 @@ class Sidebar(ctk.CTkFrame):
 
         self.create_buttons(nav_container, show_decks)
 
+        # quick jump button, which opens the same palette as pressing ctrl+k
+        ctk.CTkButton(
+            nav_container,
+            text="Quick jump (Ctrl+K)",
+            anchor="w",
+            fg_color="transparent",
+            text_color="#6B7280",
+            hover_color="#F3F4F6",
+            font=("Inter", 12),
+            command=self.master.open_command_palette
+        ).pack(fill="x", padx=20, pady=5)
+
         user_info = db.get_user(self.user_id)
         if user_info:
             username = user_info["username"]
@@ -39,6 +69,9 @@ class Sidebar(ctk.CTkFrame):
         # Removed db.close() so that the shared connection remains open
         self.create_bottom_section(username)
 
+        if self.db.due_watcher is not None:
+            self.db.due_watcher.subscribe(self, self.update_due_badges)
+
     def create_buttons(self, parent, show_decks):
         # circular import happens because all pages inherit from BasePage (in components.py),
         # which imports sidebar, and sidebar tries to import the pages again
@@ -73,6 +106,58 @@ class Sidebar(ctk.CTkFrame):
                     self.update_deck_list()
             else:
                 button.pack(fill="x", padx=20, pady=5)  # all other buttons are added to the sidebar
+            # badge on the quiz button with the number of cards available for review across all decks
+            if text == "Quiz yourself":
+                self.quiz_button = button
+                self.set_quiz_badge(sum(self.db.get_due_counts(self.user_id).values()))
+
+    # creates a small red badge showing a count, e.g. the number of cards due
+    def create_badge(self, parent, count):
+        return ctk.CTkLabel(
+            parent,
+            text=str(count) if count < 100 else "99+",
+            width=24,
+            height=18,
+            corner_radius=9,
+            fg_color="#FEE2E2",
+            text_color="#DC2626",
+            font=("Inter", 11, "bold")
+        )
+
+    # shows the number of cards due across all decks on the quiz button, or no badge if none are due
+    def set_quiz_badge(self, count):
+        if count > 0 and self.quiz_badge is None:
+            self.quiz_badge = self.create_badge(self.quiz_button, count)
+            self.quiz_badge.place(relx=1.0, rely=0.5, anchor="e", x=-10)
+        elif count > 0:
+            self.quiz_badge.configure(text=str(count) if count < 100 else "99+")
+        elif self.quiz_badge is not None:
+            self.quiz_badge.destroy()
+            self.quiz_badge = None
+
+    # shows the number of cards due in a deck next to its name, or no badge if none are due
+    def set_deck_badge(self, deck_id, count):
+        badge = self.deck_badges.get(deck_id)
+        if count > 0 and badge is None:
+            deck, deck_btn = self.deck_rows[deck_id]
+            # packed before the deck button so it stays on the right
+            self.deck_badges[deck_id] = self.create_badge(deck, count)
+            self.deck_badges[deck_id].pack(side="right", padx=(4, 0), before=deck_btn)
+        elif count > 0:
+            badge.configure(text=str(count) if count < 100 else "99+")
+        elif badge is not None:
+            badge.destroy()
+            del self.deck_badges[deck_id]
+
+    # called by the due watcher with the latest due counts, only the badges whose counts changed are updated
+    # each deck's badge counts the cards due in it and all its subdecks
+    def update_due_badges(self, due_counts):
+        self.set_quiz_badge(sum(due_counts.values()))
+        totals = subtree_totals(self.deck_parents, due_counts)
+        for deck_id in self.deck_rows:
+            if totals.get(deck_id, 0) != self.shown_due_counts.get(deck_id, 0):
+                self.set_deck_badge(deck_id, totals.get(deck_id, 0))
+        self.shown_due_counts = totals
 
     # defines styling for each individual button
     def create_button(self, parent, text, icon_path, command): 
@@ -128,38 +213,24 @@ class Sidebar(ctk.CTkFrame):
         # destroys all current decks in deck_container
         for widget in self.deck_container.winfo_children():
             widget.destroy()
+        self.deck_rows = {}
+        self.deck_badges = {}
+        self.deck_arrows = {}
 
         # Use the shared database instance instead of creating a new one
-        decks = self.db.get_decks(self.user_id)
-
-        if decks:
-            deck_list = []
-            for deck_id, deck_name in decks:
-                # retrieves cards for each deck
-                cards = self.db.get_cards(deck_id)
-                if cards:
-                    total_ef = 0
-                    # calculates average ef by getting each card's easiness from database,
-                    # adding them together (total_ef) and dividing by number of cards (len(cards))
-                    for card in cards:
-                        total_ef += self.db.get_card_easiness(self.user_id, card[0])
-                    avg_ef = total_ef / len(cards)
-                else:
-                    # if card doesn't have ef, uses 2.5 as default value
-                    avg_ef = 2.5
-
-                # appends deck id, deck name and average ef to deck list
-                deck_list.append((deck_id, deck_name, avg_ef))
-            
-            # sorts deck list by ascending ef
-            # works by looping through deck_list, passing each tuple in it to get_ef, which returns a list of ef like [0, 2, 1.2]
-            # once all ef are gathered into the list, sort() function sorts deck_list in ascending order of these efs
-            def get_ef(deck):
-                return deck[2]
-            deck_list.sort(key=get_ef)
+        # deck_list is a list of (deck_id, deck_name, avg_ef, card_count) tuples, already sorted by ascending avg_ef
+        # the decks come from the deck index (explained in graph.py), so they don't need sorting again here
+        deck_list = self.db.get_ordered_decks(self.user_id)
+        # subdecks are listed under their parent deck, each level in the same order as the deck list
+        self.deck_parents = self.db.get_deck_parents(self.user_id)
+        self.deck_children = {}
+        for deck_id, deck_name, _, _ in deck_list:
+            parent_id = self.deck_parents.get(deck_id)
+            self.deck_children.setdefault(parent_id if parent_id in self.deck_parents else None, []).append((deck_id, deck_name))
 
+        if deck_list:
             # create a scrollable frame for decks to be displayed in
-            decks_frame = ctk.CTkScrollableFrame(
+            self.decks_frame = ctk.CTkScrollableFrame(
                 self.deck_container,
                 fg_color="transparent",
                 height=min(len(deck_list) * 36, 108), # calculates the pixel height if each deck gets a height of 36px, making sure to not exceed a height of 108px
@@ -167,28 +238,94 @@ class Sidebar(ctk.CTkFrame):
                 scrollbar_button_color="#E5E7EB",
                 scrollbar_button_hover_color="#D1D5DB"
             )
-            decks_frame.pack(fill="x", padx=20, pady=(0, 10))
-
-            # imports cards page here to avoid circular imports at the top
-            from app import CardsPage
-            
-            # iterate through deck id and deck name in deck list and make a button for each deck
-            for deck_id, deck_name, _ in deck_list:
-                deck = ctk.CTkFrame(decks_frame, fg_color="transparent", height=36)
-                deck.pack(fill="x", expand=False)
-                deck.pack_propagate(False)
-
-                deck_btn = ctk.CTkButton(
-                    deck,
-                    text=deck_name,
-                    fg_color="transparent",
-                    text_color="#6B7280",
-                    hover_color="#F3F4F6",
-                    anchor="w",
-                    height=35,
-                    command=lambda d_id=deck_id: self.switch_page(CardsPage, user_id=self.user_id, deck_id=d_id, switch_page=self.switch_page)
-                )
-                deck_btn.pack(fill="x", pady=(0, 1))
+            self.decks_frame.pack(fill="x", padx=20, pady=(0, 10))
+
+            # cards due in each deck and its subdecks, from the cached due forecast (one query for all decks)
+            self.shown_due_counts = subtree_totals(self.deck_parents, self.db.get_due_counts(self.user_id))
+
+            # make a row for each top level deck, and the subdecks of decks that were expanded before the list was updated
+            self.add_deck_rows(None, 0)
+
+    # makes the rows for a deck's subdecks (or the top level decks if parent_id is None), after the row given by after,
+    # and the rows of any of them that are expanded, returning the last row made
+    def add_deck_rows(self, parent_id, depth, after=None):
+        for deck_id, deck_name in self.deck_children.get(parent_id, []):
+            after = self.create_deck_row(deck_id, deck_name, depth, after)
+            if deck_id in self.expanded_decks:
+                after = self.add_deck_rows(deck_id, depth + 1, after)
+        return after
+
+    def create_deck_row(self, deck_id, deck_name, depth, after=None):
+        # imports cards page here to avoid circular imports at the top
+        from app import CardsPage
+
+        deck = ctk.CTkFrame(self.decks_frame, fg_color="transparent", height=36)
+        if after is None:
+            deck.pack(fill="x", expand=False)
+        else:
+            deck.pack(fill="x", expand=False, after=after)
+        deck.pack_propagate(False)
+
+        # decks with subdecks get an arrow to show or hide them, other decks get a gap of the same width
+        if deck_id in self.deck_children:
+            self.deck_arrows[deck_id] = ctk.CTkButton(
+                deck,
+                text="▾" if deck_id in self.expanded_decks else "▸",
+                width=20,
+                height=35,
+                fg_color="transparent",
+                text_color="#6B7280",
+                hover_color="#F3F4F6",
+                command=lambda d_id=deck_id: self.toggle_deck(d_id)
+            )
+            self.deck_arrows[deck_id].pack(side="left", padx=(depth * DECK_INDENT, 0))
+        else:
+            ctk.CTkFrame(deck, fg_color="transparent", width=20, height=35).pack(side="left", padx=(depth * DECK_INDENT, 0))
+
+        deck_btn = ctk.CTkButton(
+            deck,
+            text=deck_name,
+            fg_color="transparent",
+            text_color="#6B7280",
+            hover_color="#F3F4F6",
+            anchor="w",
+            height=35,
+            command=lambda d_id=deck_id: self.switch_page(CardsPage, user_id=self.user_id, deck_id=d_id, switch_page=self.switch_page)
+        )
+        deck_btn.pack(side="left", fill="x", expand=True, pady=(0, 1))
+
+        # badge with the number of cards due in this deck and its subdecks
+        self.deck_rows[deck_id] = (deck, deck_btn)
+        self.set_deck_badge(deck_id, self.shown_due_counts.get(deck_id, 0))
+        return deck
+
+    # shows or hides a deck's subdecks, only making their rows when the deck is expanded
+    def toggle_deck(self, deck_id):
+        if deck_id in self.expanded_decks:
+            self.collapse_deck(deck_id)
+            self.deck_arrows[deck_id].configure(text="▸")
+        else:
+            self.expanded_decks.add(deck_id)
+            self.add_deck_rows(deck_id, self.deck_depth(deck_id) + 1, self.deck_rows[deck_id][0])
+            self.deck_arrows[deck_id].configure(text="▾")
+
+    # destroys the rows of a deck's subdecks (and theirs), which are made again if it is expanded
+    def collapse_deck(self, deck_id):
+        self.expanded_decks.discard(deck_id)
+        for child_id, _ in self.deck_children.get(deck_id, []):
+            if child_id in self.deck_rows:
+                self.collapse_deck(child_id)
+                self.deck_rows.pop(child_id)[0].destroy()
+                self.deck_badges.pop(child_id, None)
+                self.deck_arrows.pop(child_id, None)
+
+    # the number of levels above a deck, found by following parents (only done for a deck being expanded)
+    def deck_depth(self, deck_id):
+        depth = 0
+        while self.deck_parents.get(deck_id) in self.deck_parents:
+            deck_id = self.deck_parents[deck_id]
+            depth += 1
+        return depth
 
 
     # asks the user if they want to logout (yes or no)
@@ -196,5 +333,6 @@ class Sidebar(ctk.CTkFrame):
     def logout(self):
         if messagebox.askyesno("Logout", "Are you sure you want to logout?"):
             self.current_user = None  # Clear the stored user info
+            self.db.stop_due_watcher()
             from login import LoginPage
             self.switch_page(LoginPage)
@@ -143,6 +143,8 @@ class SignupPage(ctk.CTkFrame):
             # if user_id is returned, page is switched to DecksPage
             # if user_id isn't returned (user does not exist in database), then an error message is shown
             if user_id:
+                # starts the quick jump search index and the due watcher for the user's due count badges
+                self.db.start_user_session(self.master, user_id)
                 self.master.switch_page(DecksPage, user_id=user_id, switch_page=self.master.switch_page)
             else:
                 messagebox.showerror("Error", "Username already exists or failed to create account")
@@ -0,0 +1,127 @@
+# external imports
+import numpy as np
+
+# my imports
+from scheduler import SCHEDULERS, FSRSScheduler
+
+# share of remembered cards that are rated very easy (4) rather than easy (3) in the simulation
+VERY_EASY_SHARE = 0.2
+
+# number of trials each worker process simulates at once, more trials per task use more memory
+TRIALS_PER_TASK = 5
+
+
+# turns the rows from Database.get_simulation_state into the arrays the simulation starts from:
+# the day each card is due (0 is today, overdue cards are due today), the day of its last review (nan for new cards),
+# its repetition count, ef, scheduler stability and memory stability (how long it is actually remembered for,
+# taken from the scheduler stability or the card's interval, nan for new cards)
+def initial_state(rows, today):
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(-1, 5)
+    due_seconds, interval, repetition, ef, stability = values.T
+    new = np.isnan(due_seconds)
+    due_day = np.where(new, 0, np.maximum(np.floor((due_seconds - today) / 86400), 0)).astype(np.int64)
+    last_day = np.where(new, np.nan, (due_seconds - interval * 60 - today) / 86400)
+    memory = np.where(new, np.nan, np.where(np.isnan(stability), np.maximum(interval / 1440, 0.1), stability))
+    return {
+        "due": due_day,
+        "last": last_day,
+        "repetition": np.nan_to_num(repetition).astype(np.int64),
+        "ef": np.where(np.isnan(ef), 2.5, ef),
+        "stability": stability,
+        "memory": memory
+    }
+
+
+# simulates trials runs of days days of reviews from the initial state, run in a worker process
+# every card in every trial is one element of flat numpy arrays, and each day only the cards due that day are updated
+# scheduler_name and params choose the scheduler being tried, and memory_params are fsrs params (e.g. fitted to the
+# user's reviews) for the memory model, which decides whether each card is remembered: a card last seen t days ago
+# with memory stability s is remembered with chance 1 / (1 + t / (9 * s)), the same curve FSRSScheduler uses
+# failed cards are seen again the same day (as they come back after a few minutes) and then rated easy
+# returns (reviews per trial per day, remembered reviews per trial, reviews of previously seen cards per trial)
+def simulate(state, scheduler_name, params, memory_params, days, trials, seed):
+    rng = np.random.default_rng(seed)
+    scheduler = SCHEDULERS[scheduler_name](params)
+    memory_model = FSRSScheduler(memory_params)
+    count = len(state["due"])
+    due = np.tile(state["due"], trials)
+    last = np.tile(state["last"], trials)
+    repetition = np.tile(state["repetition"], trials)
+    ef = np.tile(state["ef"], trials)
+    stability = np.tile(state["stability"], trials)
+    memory = np.tile(state["memory"], trials)
+
+    loads = np.zeros((trials, days), dtype=np.int64)
+    remembered = np.zeros(trials, dtype=np.int64)
+    seen = np.zeros(trials, dtype=np.int64)
+    for day in range(days):
+        cards = np.flatnonzero(due == day)
+        if len(cards) == 0:
+            continue
+        card_memory = memory.take(cards)
+        new = np.isnan(card_memory)
+        elapsed = day - last.take(cards)
+        elapsed[new] = 0.0
+        # new cards are being learnt, so they always count as remembered
+        draws = rng.random((2, len(cards)))
+        recalled = new | (draws[0] < memory_model.retrievability(elapsed, card_memory))
+        quality = np.where(recalled, np.where(draws[1] < VERY_EASY_SHARE, 4, 3), 1)
+        card_trials = cards // count
+        old_trials = card_trials[~new]
+        loads[:, day] += np.bincount(card_trials, minlength=trials)
+        remembered += np.bincount(old_trials, weights=recalled[~new], minlength=trials).astype(np.int64)
+        seen += np.bincount(old_trials, minlength=trials)
+
+        card_repetition, card_ef = repetition.take(cards), ef.take(cards)
+        _, card_memory = memory_model.review(quality, card_repetition, card_ef, card_memory, elapsed)
+        card_repetition, card_stability = scheduler.review(quality, card_repetition, card_ef, stability.take(cards), elapsed)
+        card_ef = scheduler.next_ef(card_ef, quality)
+
+        # failed cards are reviewed again straight away and rated easy
+        failed = np.flatnonzero(~recalled)
+        if len(failed):
+            loads[:, day] += np.bincount(card_trials[failed], minlength=trials)
+            zero = np.zeros(len(failed))
+            again = np.full(len(failed), 3)
+            _, card_memory[failed] = memory_model.review(again, card_repetition[failed], card_ef[failed], card_memory[failed], zero)
+            card_repetition[failed], card_stability[failed] = scheduler.review(
+                again, card_repetition[failed], card_ef[failed], card_stability[failed], zero
+            )
+            card_ef[failed] = scheduler.next_ef(card_ef[failed], again)
+            quality[failed] = 3
+
+        # cards are reviewed at midday, and are due again on the day their due time falls in (at least tomorrow)
+        due_time = scheduler.due_time(day * 86400 + 43200, quality, card_repetition, card_stability)
+        due[cards] = np.maximum(due_time // 86400, day + 1)
+        last[cards] = day
+        repetition[cards] = card_repetition
+        stability[cards] = card_stability
+        memory[cards] = card_memory
+        ef[cards] = card_ef
+    return loads, remembered, seen
+
+
+# splits trials into tasks of TRIALS_PER_TASK trials for background.run_in_processes, as lists of simulate's arguments
+def simulation_tasks(state, scheduler_name, params, memory_params, days, trials, seed=0):
+    tasks = []
+    for start in range(0, trials, TRIALS_PER_TASK):
+        task_trials = min(TRIALS_PER_TASK, trials - start)
+        tasks.append((state, scheduler_name, params, memory_params, days, task_trials, seed + start))
+    return tasks
+
+
+# combines the results of the simulation tasks into a dict with:
+# daily_mean and daily_p90: the average and 90th percentile number of reviews on each day across the trials,
+# retention: the average share of reviews remembered, with retention_p5 and retention_p95 across the trials
+def summarise(results):
+    loads = np.concatenate([result[0] for result in results])
+    remembered = np.concatenate([result[1] for result in results])
+    seen = np.concatenate([result[2] for result in results])
+    retention = remembered / np.maximum(seen, 1)
+    return {
+        "daily_mean": loads.mean(axis=0).tolist(),
+        "daily_p90": np.percentile(loads, 90, axis=0).tolist(),
+        "retention": float(retention.mean()),
+        "retention_p5": float(np.percentile(retention, 5)),
+        "retention_p95": float(np.percentile(retention, 95))
+    }
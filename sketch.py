@@ -0,0 +1,135 @@
+# external imports
+import math
+from array import array
+
+
+class TDigest:
+    # a t-digest is a small summary of a list of numbers (here, how long each card took to answer)
+    # that can estimate percentiles (e.g. the 90th percentile answer time) without keeping every number
+    # numbers are grouped into centroids (a mean and how many numbers it stands for), with small centroids
+    # near the ends so the slow outliers (p90, p99) stay accurate, and large centroids in the middle
+    # compression limits the number of centroids (roughly compression / 2 at most), so it uses the same memory
+    # whether it has seen 10 answers or 10 million, and two digests (e.g. from two decks) can be merged
+    def __init__(self, compression=100):
+        self.compression = compression
+        # centroids are [mean, weight] lists kept sorted by mean
+        self.centroids = []
+        # new numbers are buffered and merged into the centroids in batches, which is faster than one at a time
+        self.buffer = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value, weight=1):
+        self.buffer.append([value, weight])
+        self.count += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self.buffer) >= self.compression * 5:
+            self.compress()
+
+    # adds all the numbers summarised by another digest, e.g. to get the answer times across every deck
+    def merge(self, other):
+        other.compress()
+        for mean, weight in other.centroids:
+            self.buffer.append([mean, weight])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+
+    # maps a quantile (0 to 1) onto the scale used to decide how big a centroid can be
+    # the scale changes quickly near 0 and 1 and slowly near 0.5, so centroids at the ends are kept small
+    def scale(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    # merges the buffered numbers into the centroids, joining neighbouring centroids while they stay small enough
+    def compress(self):
+        if not self.buffer:
+            return
+        points = self.centroids + self.buffer
+        points.sort()
+        self.buffer = []
+
+        merged = [list(points[0])]
+        # weight_before is the total weight of all centroids before the current one
+        weight_before = 0
+        limit = self.scale(0) + 1
+        for mean, weight in points[1:]:
+            current = merged[-1]
+            q = (weight_before + current[1] + weight) / self.count
+            if self.scale(min(q, 1.0)) <= limit:
+                # join the point into the current centroid (weighted average of the means)
+                total = current[1] + weight
+                current[0] += (mean - current[0]) * weight / total
+                current[1] = total
+            else:
+                weight_before += current[1]
+                limit = self.scale(weight_before / self.count) + 1
+                merged.append([mean, weight])
+        self.centroids = merged
+
+    # estimates the value below which a fraction q of the numbers fall, e.g. quantile(0.5) is the median
+    # the value is interpolated between the centres of the two centroids either side of q
+    def quantile(self, q):
+        self.compress()
+        if not self.centroids:
+            return 0.0
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        target = q * self.count
+        # the first and last halves of the end centroids are interpolated towards the min and max
+        first_mean, first_weight = self.centroids[0]
+        if target < first_weight / 2:
+            return self.min + (first_mean - self.min) * target / (first_weight / 2)
+        last_mean, last_weight = self.centroids[-1]
+        if target > self.count - last_weight / 2:
+            return last_mean + (self.max - last_mean) * (target - (self.count - last_weight / 2)) / (last_weight / 2)
+
+        # position is the cumulative weight at the centre of the current centroid
+        position = first_weight / 2
+        for index in range(len(self.centroids) - 1):
+            mean, weight = self.centroids[index]
+            next_mean, next_weight = self.centroids[index + 1]
+            gap = (weight + next_weight) / 2
+            if position + gap >= target:
+                return mean + (next_mean - mean) * (target - position) / gap
+            position += gap
+        return last_mean
+
+    # packs the digest into bytes so it can be stored in the database:
+    # compression, count, min and max followed by each centroid's mean and weight, all as 8 byte floats
+    def to_bytes(self):
+        self.compress()
+        values = array("d", [self.compression, self.count, self.min, self.max])
+        for mean, weight in self.centroids:
+            values.append(mean)
+            values.append(weight)
+        return values.tobytes()
+
+    @staticmethod
+    def from_bytes(data):
+        values = array("d")
+        values.frombytes(data)
+        digest = TDigest(int(values[0]))
+        digest.count = int(values[1])
+        digest.min = values[2]
+        digest.max = values[3]
+        digest.centroids = [[values[index], values[index + 1]] for index in range(4, len(values), 2)]
+        return digest
+
+
+# returns the 50th, 90th and 99th percentiles of a digest as a dict, or None if it is empty
+def percentiles(digest):
+    if digest is None or len(digest) == 0:
+        return None
+    return {
+        "p50": digest.quantile(0.5),
+        "p90": digest.quantile(0.9),
+        "p99": digest.quantile(0.99)
+    }
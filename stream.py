@@ -0,0 +1,98 @@
+# external imports
+import heapq
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+
+# returns the merge key of a due card tuple (card_id, question, answer, due, deck_id), due date first then card id
+def get_due_key(card):
+    return (card[3], card[0])
+
+
+class PagePrefetcher:
+    # fetches pages of due cards on one background thread, so the next page is usually ready before it is needed
+    # the thread has its own connection (sqlite connections can't be shared between threads)
+    def __init__(self, db):
+        self.db = db
+        self.connection = None
+        self.executor = ThreadPoolExecutor(max_workers=1, initializer=self.connect)
+
+    # runs on the background thread when it starts
+    def connect(self):
+        self.connection = sqlite3.connect(self.db.db_name)
+
+    def fetch(self, *args):
+        return self.db.get_due_cards_page(*args, cursor=self.connection.cursor())
+
+    # starts fetching a page and returns a future, whose result() is the same as get_due_cards_page
+    def submit(self, user_id, deck_id, now_str, after, limit):
+        return self.executor.submit(self.fetch, user_id, deck_id, now_str, after, limit)
+
+    # closes the background connection once any fetch in progress has finished, and stops the thread
+    def close(self):
+        if self.executor is None:
+            return
+        self.executor.submit(lambda: self.connection.close())
+        self.executor.shutdown(wait=False)
+        self.executor = None
+
+
+class DueCardCursor:
+    # iterates through one deck's due cards in due order, fetching them from the database a page at a time
+    # only the current page and the next one are kept in memory
+    # the first page is fetched straight away so the first card can be shown, and while a page is being used
+    # the next one is fetched in the background by the prefetcher (if there is no prefetcher it is fetched when needed)
+    def __init__(self, db, user_id, deck_id, now_str, page_size=20, prefetcher=None):
+        self.db = db
+        self.user_id = user_id
+        self.deck_id = deck_id
+        self.now_str = now_str
+        self.page_size = page_size
+        self.prefetcher = prefetcher
+
+    def __iter__(self):
+        rows, after = self.db.get_due_cards_page(self.user_id, self.deck_id, self.now_str, None, self.page_size)
+        while True:
+            next_page = None
+            if after is not None and self.prefetcher:
+                next_page = self.prefetcher.submit(self.user_id, self.deck_id, self.now_str, after, self.page_size)
+            yield from rows
+            if after is None:
+                return
+            if next_page:
+                rows, after = next_page.result()
+            else:
+                rows, after = self.db.get_due_cards_page(self.user_id, self.deck_id, self.now_str, after, self.page_size)
+
+
+# merges the due cards of several decks into one stream in global due order (a k-way merge)
+# heapq.merge keeps a heap with the next card from each deck and repeatedly takes the earliest one,
+# so it only holds a page or two per deck in memory and the first card is ready after one small query per deck
+def merge_due_cards(db, user_id, deck_ids, now_str, page_size=20, prefetcher=None):
+    cursors = [DueCardCursor(db, user_id, deck_id, now_str, page_size, prefetcher) for deck_id in deck_ids]
+    return heapq.merge(*cursors, key=get_due_key)
+
+
+class RelearnQueue:
+    # a min-heap of cards that were rated 0 - 2 during a session and come back after a few minutes (learning steps)
+    # entries are (due time, order added, card), the order added breaks ties so cards are never compared
+    def __init__(self):
+        self.heap = []
+        self.count = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, due, card):
+        heapq.heappush(self.heap, (due, self.count, card))
+        self.count += 1
+
+    # returns when the next card is due, or None if the queue is empty
+    def next_due(self):
+        return self.heap[0][0] if self.heap else None
+
+    # removes and returns the earliest card if it is due by now, otherwise returns None
+    def pop_due(self, now):
+        if self.heap and self.heap[0][0] <= now:
+            return heapq.heappop(self.heap)[2]
+        return None
@@ -0,0 +1,123 @@
+# external imports
+import re
+import numpy as np
+
+# words with a meaning in tag queries, which can't be used as tag names
+KEYWORDS = ("and", "or", "not")
+# splits a tag query into brackets and words
+TOKEN_PATTERN = re.compile(r"\(|\)|[^\s()]+")
+
+
+# turns a tag name into the form it is stored in: lowercase, with no brackets, and hyphens instead of spaces
+# returns "" for names that can't be used (empty or a query keyword)
+def normalise_tag(name):
+    name = re.sub(r"\s+", "-", name.strip().lower().replace("(", "").replace(")", ""))
+    return "" if name in KEYWORDS else name
+
+
+# splits what the user typed into tag names, separated by commas or spaces, without repeats
+def parse_tag_list(text):
+    names = []
+    for part in re.split(r"[,\s]+", text):
+        name = normalise_tag(part)
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+# a bitset is a python int with bit n set if card n is in it, so sets of cards are combined with & | and ~
+# on whole ints at once (a machine word of cards at a time) instead of card by card
+def bitset_from_ids(card_ids):
+    card_ids = np.asarray(card_ids, dtype=np.int64)
+    if len(card_ids) == 0:
+        return 0
+    flags = np.zeros(int(card_ids.max()) + 1, dtype=bool)
+    flags[card_ids] = True
+    return int.from_bytes(np.packbits(flags, bitorder="little").tobytes(), "little")
+
+
+# returns the card ids in a bitset, in order
+def ids_from_bitset(bits):
+    if bits <= 0:
+        return []
+    data = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(data, bitorder="little")).tolist()
+
+
+class TagIndex:
+    # an in memory index of a user's tags: a bitset of the cards with each tag (by card_id),
+    # so queries like "verbs and (spanish or french) and not easy" are worked out with a few int operations
+    # rather than queries joining card_tags for each tag
+    # loaded from the database when first needed and kept up to date as cards are tagged (see Database.set_card_tags)
+    def __init__(self, rows):
+        card_ids = {}
+        for name, card_id in rows:
+            card_ids.setdefault(name, []).append(card_id)
+        self.bits = {name: bitset_from_ids(ids) for name, ids in card_ids.items()}
+
+    def add(self, name, card_id):
+        self.bits[name] = self.bits.get(name, 0) | (1 << card_id)
+
+    def remove(self, name, card_id):
+        bits = self.bits.get(name, 0) & ~(1 << card_id)
+        if bits:
+            self.bits[name] = bits
+        else:
+            self.bits.pop(name, None)
+
+    # takes a card out of every tag, e.g. when it is deleted
+    def remove_card(self, card_id):
+        for name in [name for name, bits in self.bits.items() if bits >> card_id & 1]:
+            self.remove(name, card_id)
+
+    # returns (tag name, number of cards) for every tag in use, by name
+    def counts(self):
+        return sorted((name, bits.bit_count()) for name, bits in self.bits.items())
+
+    # works out a tag query as a bitset: tags joined by "and", "or" and "not" (and brackets), where tags next to each
+    # other without a keyword count as "and", e.g. "verbs spanish" is "verbs and spanish"
+    # the result is negative if the query is only true for cards outside some set (e.g. "not easy"): ~result is
+    # then the set of cards that don't match, as there is no list of every card to take them away from
+    # raises ValueError if the query can't be read
+    def query(self, text):
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        if not tokens:
+            raise ValueError("Empty tag query")
+        bits, position = self.parse_or(tokens, 0)
+        if position < len(tokens):
+            raise ValueError(f"Unexpected '{tokens[position]}' in tag query")
+        return bits
+
+    # the query is read by recursive descent, one function for each level of precedence (or, then and, then not),
+    # each returning the bitset of what it read and the position of the next token
+    def parse_or(self, tokens, position):
+        bits, position = self.parse_and(tokens, position)
+        while position < len(tokens) and tokens[position] == "or":
+            right, position = self.parse_and(tokens, position + 1)
+            bits |= right
+        return bits, position
+
+    def parse_and(self, tokens, position):
+        bits, position = self.parse_not(tokens, position)
+        while position < len(tokens) and tokens[position] not in ("or", ")"):
+            if tokens[position] == "and":
+                position += 1
+            right, position = self.parse_not(tokens, position)
+            bits &= right
+        return bits, position
+
+    def parse_not(self, tokens, position):
+        if position >= len(tokens):
+            raise ValueError("Tag query ends too soon")
+        token = tokens[position]
+        if token == "not":
+            bits, position = self.parse_not(tokens, position + 1)
+            return ~bits, position
+        if token == "(":
+            bits, position = self.parse_or(tokens, position + 1)
+            if position >= len(tokens) or tokens[position] != ")":
+                raise ValueError("Missing ')' in tag query")
+            return bits, position + 1
+        if token in KEYWORDS or token == ")":
+            raise ValueError(f"Unexpected '{token}' in tag query")
+        return self.bits.get(normalise_tag(token), 0), position + 1
@@ -0,0 +1,56 @@
+# external imports
+from datetime import datetime
+
+# milliseconds to wait after due dates change (e.g. a card is rated) before checking the due counts,
+# so rating several cards quickly only loads the counts once
+REFRESH_DELAY_MS = 500
+
+
+class DueWatcher:
+    # keeps the due counts shown around the app (the sidebar badges and deck tiles) up to date as cards become due,
+    # e.g. a card rated very hard showing up as due again after 2 minutes without the user changing page
+    # it doesn't poll: it sleeps (with after on the main window) until the due forecast's valid_until, which is when
+    # the earliest upcoming next_review_date is (found with the (user_id, next_review_date) index) or midnight,
+    # then loads the due counts and sends them to the subscribers, which only change the badges and labels
+    # whose counts are different
+    def __init__(self, root, db, user_id):
+        self.root = root
+        self.db = db
+        self.user_id = user_id
+        self.subscribers = []
+        self.job = None
+        self.schedule()
+
+    # callback(due_counts) is called with {deck_id: cards due now} every time the due counts are checked,
+    # until widget is destroyed
+    def subscribe(self, widget, callback):
+        self.subscribers.append((widget, callback))
+
+    # sets the timer for the next check, in delay_ms milliseconds or when the next card becomes due
+    def schedule(self, delay_ms=None):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+        if delay_ms is None:
+            valid_until = self.db.get_cached_due_forecast(self.user_id)["valid_until"]
+            # due dates are in whole seconds, so checking just after valid_until counts the card as due
+            delay_ms = max(int((valid_until - datetime.now()).total_seconds() * 1000), 0) + 10
+        self.job = self.root.after(delay_ms, self.check)
+
+    # called when due dates have changed (e.g. a card was rated), as the next card to become due may now be sooner
+    def refresh(self):
+        self.schedule(REFRESH_DELAY_MS)
+
+    def check(self):
+        self.job = None
+        due_counts = self.db.get_due_counts(self.user_id)
+        self.subscribers = [(widget, callback) for widget, callback in self.subscribers if widget.winfo_exists()]
+        for widget, callback in self.subscribers:
+            callback(due_counts)
+        self.schedule()
+
+    # stops the timer, e.g. when the user logs out
+    def stop(self):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+        self.subscribers = []